@@ -0,0 +1,80 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import gzip
+
+from common import types as T
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+__all__ = ["DEFAULT_THRESHOLD", "CODINGS", "compress", "negotiate"]
+
+
+# Default size (in bytes) below which bodies aren't worth compressing
+DEFAULT_THRESHOLD = 1024
+
+# Content codings, in order of our preference, with their compressors
+_COMPRESSORS:T.Dict[str, T.Callable[[bytes], bytes]] = {
+    **({"br": lambda body: brotli.compress(body, quality=5)} if brotli else {}),
+    "gzip": lambda body: gzip.compress(body, compresslevel=6)
+}
+
+CODINGS = tuple(_COMPRESSORS)
+
+
+def negotiate(accept_encoding:T.Optional[str]) -> T.Optional[str]:
+    """
+    Choose the content coding from those the client accepts, per its
+    Accept-Encoding header, or None if it's to be left uncompressed
+    """
+    if not accept_encoding:
+        return None
+
+    accepted:T.Dict[str, float] = {}
+    for coding in accept_encoding.split(","):
+        name, *params = (part.strip() for part in coding.split(";"))
+
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+
+        accepted[name.lower()] = q
+
+    # Ties are broken by our preference
+    wildcard = accepted.get("*", 0.0)
+    chosen, chosen_q = None, 0.0
+    for coding in CODINGS:
+        q = accepted.get(coding, wildcard)
+        if q > chosen_q:
+            chosen, chosen_q = coding, q
+
+    return chosen
+
+def compress(body:bytes, coding:str) -> bytes:
+    """ Compress the body with the given content coding """
+    return _COMPRESSORS[coding](body)
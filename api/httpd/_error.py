@@ -25,7 +25,7 @@ from common.logging import Level, log
 from ._types import HTTPException
 
 
-__all__ = ["HTTPError"]
+__all__ = ["HTTPError", "serialisable_error"]
 
 
 # Extract HTTP client/server error response reasons from stdlib
@@ -35,6 +35,22 @@ _status_map:T.Dict[int, str] = {
     if 400 <= status.value < 600
 }
 
+def _reason(status:int) -> str:
+    try:
+        return _status_map[status]
+    except KeyError:
+        log(f"HTTP {status} status is undefined", Level.Debug)
+        return "Undefined Error"
+
+def serialisable_error(status:int, description:str) -> T.Dict[str, T.Any]:
+    """ Serialisable form of an error, as given in error responses """
+    return {
+        "status":      status,
+        "reason":      _reason(status),
+        "description": description
+    }
+
+
 class HTTPError(HTTPException):
     """ Standardised JSON error response """
     _description:str
@@ -50,23 +66,14 @@ class HTTPError(HTTPException):
         self._description = description
 
         self.status_code = status_or_exception
-
-        try:
-            reason = _status_map[self.status_code]
-        except KeyError:
-            log(f"HTTP {self.status_code} status is undefined", Level.Debug)
-            reason = "Undefined Error"
+        reason = _reason(self.status_code)
 
         headers_with_content_type = {
             "Content-Type": f"{MIMEType.JSON.value}; charset={ENCODING}",
             **(headers or {})
         }
 
-        body = json.encode({
-            "status":      self.status_code,
-            "reason":      reason,
-            "description": self.description
-        })
+        body = json.encode(serialisable_error(self.status_code, self.description))
 
         super().__init__(headers=headers_with_content_type, reason=reason, body=body)
 
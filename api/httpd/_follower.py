@@ -0,0 +1,149 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import os
+from time import monotonic
+
+from api.models import Registry, InvalidSnapshot, read_snapshot
+from common import types as T, time
+from common.logging import Level, log
+from common.metrics import Counter, Gauge, Histogram
+from ._types import Application
+
+
+__all__ = ["Publication", "SnapshotFollower", "published"]
+
+
+# Interval (in seconds) between checks for a newly published snapshot
+_POLL_INTERVAL = 1.0
+
+# Snapshot load duration histogram bucket upper bounds, in seconds
+_DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Snapshots are replaced, rather than rewritten, so a new publication
+# has a new inode, as well as a new modification time
+Publication = T.Tuple[int, int]
+
+def published(path:str) -> T.Optional[Publication]:
+    """ The publication of the snapshot at the given path, if any """
+    try:
+        stat = os.stat(path)
+
+    except FileNotFoundError:
+        return None
+
+    return stat.st_ino, stat.st_mtime_ns
+
+class SnapshotFollower(object):
+    """
+    Background task that restores the registry from the snapshots
+    published by a separate refresher process, whenever a new one
+    appears, rather than refreshing the registry from the LDAP server
+    itself; this stands in for a Refresher in each worker process
+    """
+    _registry:Registry
+    _snapshot:str
+    _interval:float
+    _publication:T.Optional[Publication]
+    _loaded:asyncio.Event
+    _task:T.Optional[asyncio.Task]
+
+    refreshes:Histogram
+    failures:Counter
+    last_success:Gauge
+
+    def __init__(self, registry:Registry, snapshot:str, publication:T.Optional[Publication] = None, interval:float = _POLL_INTERVAL) -> None:
+        """
+        @param   registry     Registry to restore
+        @param   snapshot     Path of the published snapshots
+        @param   publication  Publication already restored, if any
+        @param   interval     Interval (in seconds) between checks
+        """
+        self._registry = registry
+        self._snapshot = snapshot
+        self._interval = interval
+        self._publication = publication
+        self._loaded = asyncio.Event()
+        self._task = None
+
+        self.refreshes = Histogram("registry_snapshot_load_duration_seconds",
+                                   "Time taken to restore the registry from published snapshots",
+                                   buckets=_DURATION_BUCKETS)
+        self.failures = Counter("registry_snapshot_load_failures_total",
+                                "Number of published snapshots that could not be restored")
+        self.last_success = Gauge("registry_snapshot_last_load_timestamp_seconds",
+                                  "Time of the last restoration of the registry from a published snapshot")
+
+    async def _load(self, publication:Publication) -> None:
+        """ Restore the registry from the snapshot, read off the event loop """
+        started = monotonic()
+        loop = asyncio.get_event_loop()
+
+        # Whatever happens, we don't retry the same publication
+        self._publication = publication
+
+        try:
+            snapshot = await loop.run_in_executor(None, read_snapshot, self._snapshot)
+            self._registry.restore(snapshot)
+
+        except (InvalidSnapshot, OSError) as e:
+            log(f"Could not restore registry from snapshot: {e}", Level.Warning)
+            self.failures.inc()
+            return
+
+        log(f"Registry restored from snapshot {self._snapshot}", Level.Debug)
+        self.refreshes.observe(monotonic() - started)
+        self.last_success.set(time.now().timestamp())
+        self._loaded.set()
+
+    async def _run(self) -> None:
+        while True:
+            publication = published(self._snapshot)
+            if publication is not None and publication != self._publication:
+                await self._load(publication)
+
+            await asyncio.sleep(self._interval)
+
+    async def start(self, _app:Application) -> None:
+        """ Start following the published snapshots in the background """
+        log(f"Following registry snapshots published to {self._snapshot}", Level.Debug)
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self, _app:Application) -> None:
+        """ Stop following the published snapshots """
+        if self._task is None:
+            return
+
+        log("Stopping following registry snapshots", Level.Debug)
+        self._task.cancel()
+
+        try:
+            await self._task
+
+        except asyncio.CancelledError:
+            pass
+
+    async def ready(self) -> None:
+        """
+        Wait until the registry has data to serve; that is, only if it
+        has never been populated, we wait for the first snapshot
+        """
+        if self._registry.last_updated is None:
+            await self._loaded.wait()
@@ -20,23 +20,38 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 import asyncio
 from functools import wraps
 
-from api.ldap import CannotConnect, Server
+from api.ldap import CannotConnect
 from api.models import Registry, Person, Group, NoMatches
-from common import types as T, json
+from common import types as T, serialisation
 from common.constants import ENCODING, MIMEType
 from common.logging import Level, log
-from ._error import HTTPError
+from common.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from common.serialisation import MEDIA_TYPES
+from ._compression import negotiate
+from ._error import HTTPError, serialisable_error
 from ._middleware import allow, accept
-from ._types import Request, Response, Handler, HandlerDecorator
+from ._photos import SIZES as PHOTO_SIZES, MEDIA_TYPES as PHOTO_MEDIA_TYPES
+from ._types import Request, Response, StreamResponse, Handler, HandlerDecorator
 
 
 _MAX_RETRY = 3
 
+# Maximum page size and the number of entities rendered at a time
+_MAX_LIMIT = 1000
+_CHUNK = 500
+
+# Maximum number of entities that can be requested in bulk
+_MAX_BULK = 1000
+
 def _reconnect(max_attempts:int = 1) -> HandlerDecorator:
     """
     Parametrisable handler decorator that will reattempt to run the
     handler a set number of times while, in the event of a connection
     problem with the LDAP server, trying to reconnect
+
+    NOTE  Handlers that prepare (i.e., stream) their responses mustn't
+          raise connection problems once they have, as they can't be
+          run again without sending a second response
     """
     assert max_attempts > 0
 
@@ -58,11 +73,11 @@ def _reconnect(max_attempts:int = 1) -> HandlerDecorator:
                         # Bad gateway
                         raise HTTPError(502, f"Cannot establish a connection with LDAP server at {ldap_server}")
 
-                    # Otherwise, sleep for a bit, then try reconnecting
+                    # Otherwise, sleep for a bit, then try again; the
+                    # LDAP server's connection pool will have discarded
+                    # its dead connections, so it will reconnect
                     log(f"Will attempt to reconnect to LDAP server at {ldap_server} in {sleep_for} seconds...", Level.Debug)
                     await asyncio.sleep(sleep_for)
-                    ldap = Server(ldap_server)
-                    registry.server = ldap
 
                     # Exponential back-off
                     sleep_for *= 2
@@ -73,12 +88,12 @@ def _reconnect(max_attempts:int = 1) -> HandlerDecorator:
 
 
 async def _get_registry(req:Request) -> Registry:
-    """ Get (and update, if necessary) the Registry object """
-    registry = req.app["registry"]
-    if registry.has_expired:
-        await registry.update()
-
-    return registry
+    """
+    Get the Registry object, which is refreshed in the background, so
+    we only wait for it if it has never been populated
+    """
+    await req.app["refresher"].ready()
+    return req.app["registry"]
 
 
 _EntityT = T.TypeVar("_EntityT", Person, Group)
@@ -94,64 +109,330 @@ async def _get_entity(cls:T.Type[_EntityT], req:Request) -> _EntityT:
         raise HTTPError(404, f"No such {cls._relation} with ID {identity}")
 
 
-def _JSONResponse(body:T.Any, *, serialise:bool = True, status:int = 200) -> Response:
-    """ Standardised Response factory for JSON payloads """
-    return Response(status=status, content_type=MIMEType.JSON.value, charset=ENCODING,
-                    body=json.encode(body) if serialise else body)
+def _charset(media_type:MIMEType) -> T.Optional[str]:
+    """ Character set of textual representations """
+    return ENCODING if media_type == MIMEType.JSON else None
+
+
+def _SerialisedResponse(req:Request, body:T.Any, *, serialise:bool = True, status:int = 200) -> Response:
+    """
+    Standardised Response factory for serialisable payloads, in the
+    preferred representation
+    """
+    return Response(status=status, content_type=req.preferred.value, charset=_charset(req.preferred),
+                    body=serialisation.encode(body, req.preferred) if serialise else body)
+
+
+async def _encoded_links(registry:Registry, cls:T.Type[_EntityT], identities:T.List[str], media_type:MIMEType) -> bytes:
+    """
+    Encode the array of hypermedia entities, resolving and encoding them
+    a chunk at a time, yielding to the event loop in between, so a long
+    listing doesn't hold up other requests
+    """
+    encode = lambda link: serialisation.encode(link, media_type)
+
+    # Nodes may be pruned in the meantime, so the array's length is only
+    # known once every entity has been resolved
+    encoded:T.List[bytes] = []
+    for i in range(0, len(identities), _CHUNK):
+        encoded.extend(map(encode, await registry.links(cls, identities[i:i + _CHUNK])))
+        await asyncio.sleep(0)
+
+    start, separator, end = serialisation.array_framing(media_type, len(encoded))
+    return start + separator.join(encoded) + end
+
+
+def _StoredResponse(req:Request, body:bytes, coding:T.Optional[str]) -> Response:
+    """ Response factory for stored bodies, in the given content coding """
+    response = _SerialisedResponse(req, body, serialise=False)
+    response.headers["Vary"] = "Accept, Accept-Encoding"
+    if coding is not None:
+        response.headers["Content-Encoding"] = coding
+
+    return response
+
+
+async def _stored(req:Request, version:T.Callable[[], int], renderer:T.Callable[[], T.Awaitable[bytes]], resource:T.Optional[str] = None) -> Response:
+    """
+    Respond with the requested resource's stored representation, which
+    is rendered (and stored) if it's not current, per the version of the
+    data it's rendered from
+    """
+    store = req.app["store"]
+
+    coding = negotiate(req.headers.get("Accept-Encoding"))
+    body, coding = await store.render(resource or req.path, req.preferred, version, renderer, coding)
+    return _StoredResponse(req, body, coding)
+
+
+async def _streamed_links(req:Request, registry:Registry, cls:T.Type[_EntityT], cursor:T.Optional[str]) -> StreamResponse:
+    """
+    Respond with every hypermedia entity of the given type, after the
+    cursor, if any: from the store, if it's current, otherwise streamed
+    a chunk at a time, so the time to the first byte doesn't depend on
+    the number of entities. The streamed body is kept, to be stored, only
+    while it fits within the store's budget, which bounds the memory used
+    """
+    store = req.app["store"]
+    media_type = req.preferred
+    version = registry.version(cls)
+
+    stored = await store.get(req.path_qs, media_type, version, negotiate(req.headers.get("Accept-Encoding")))
+    if stored is not None:
+        return _StoredResponse(req, *stored)
+
+    # The first chunk is resolved before the response is begun, so any
+    # connection problem can still be retried
+    identities = list(registry.keys(cls, after=cursor))
+    links = await registry.links(cls, identities[:_CHUNK])
+
+    response = StreamResponse(status=200)
+    response.content_type = media_type.value
+    response.charset = _charset(media_type)
+    response.headers["Vary"] = "Accept, Accept-Encoding"
+    response.enable_chunked_encoding()
+    response.enable_compression()
+    await response.prepare(req)
+
+    # The array's length is only used to frame MessagePack, which isn't
+    # streamed
+    start, separator, end = serialisation.array_framing(media_type, len(identities))
+    encode = lambda link: serialisation.encode(link, media_type)
+
+    # The body is kept, to be stored, for as long as it would fit
+    body:T.Optional[T.List[bytes]] = []
+    size = 0
+
+    async def _write(data:bytes) -> None:
+        nonlocal body, size
+        await response.write(data)
+
+        size += len(data)
+        if body is not None and size <= store.budget:
+            body.append(data)
+
+        else:
+            body = None
+
+    try:
+        await _write(start)
+
+        written = 0
+        for i in range(0, len(identities), _CHUNK):
+            if i:
+                links = await registry.links(cls, identities[i:i + _CHUNK])
+
+            if links:
+                await _write((separator if written else b"") + separator.join(map(encode, links)))
+                written += len(links)
+
+        await _write(end)
+
+    except CannotConnect:
+        # The response has begun, so it can only be cut short, which the
+        # client will see as a failure
+        log(f"Listing cut short by a connection problem with LDAP server at {registry.server.uri}", Level.Error)
+        req.transport.close()
+        return response
+
+    await response.write_eof()
+
+    # Rendering may have changed the data, as per the response store
+    if body is not None and registry.version(cls) == version:
+        store.put(req.path_qs, media_type, version, b"".join(body))
+
+    return response
+
+
+def _pagination(req:Request) -> T.Tuple[T.Optional[int], T.Optional[str]]:
+    """ Get the requested page size, if any, and the cursor """
+    limit = req.query.get("limit")
+    if limit is not None:
+        if not limit.isdigit() or not 0 < int(limit) <= _MAX_LIMIT:
+            raise HTTPError(400, f"Limit must be between 1 and {_MAX_LIMIT}")
+
+        limit = int(limit)
+
+    return limit, req.query.get("cursor")
+
+
+def _fields(req:Request, cls:T.Type[_EntityT]) -> T.Optional[T.FrozenSet[str]]:
+    """ Get the requested fields, if they're restricted """
+    fields = req.query.get("fields")
+    if fields is None:
+        return None
+
+    requested = frozenset(field for field in fields.split(",") if field)
+    unknown = requested - set(cls.fields())
+    if unknown:
+        raise HTTPError(400, f"Unknown {cls._relation} fields: {', '.join(sorted(unknown))}")
+
+    return requested
+
+
+async def _sparse(req:Request, entity:_EntityT) -> Response:
+    """ Respond with the entity's requested fields """
+    fields = _fields(req, type(entity))
+    version = lambda: entity.version
+    if fields is None:
+        return await _stored(req, version, lambda: entity.render(req.preferred))
+
+    # Normalised, so equivalent requests share the stored representation
+    resource = f"{req.path}?fields={','.join(sorted(fields))}"
+    return await _stored(req, version, lambda: entity.render(req.preferred, fields), resource)
+
+
+async def _requested_ids(req:Request) -> T.Optional[T.List[str]]:
+    """
+    Get the IDs of the entities requested in bulk, from the JSON array
+    in the body of a POST request or the id query parameters, if any
+    """
+    if req.method == "POST":
+        try:
+            identities = await req.json()
+
+        except ValueError:
+            identities = None
+
+        if not isinstance(identities, list) or not all(isinstance(i, str) for i in identities):
+            raise HTTPError(400, "Request body must be a JSON array of IDs")
+
+    else:
+        identities = req.query.getall("id", [])
+        if not identities:
+            return None
+
+    if len(identities) > _MAX_BULK:
+        raise HTTPError(400, f"Cannot request more than {_MAX_BULK} IDs at once")
+
+    return identities
+
+
+async def _bulk(req:Request, registry:Registry, cls:T.Type[_EntityT], identities:T.List[str]) -> Response:
+    """
+    Respond with the details of each requested entity, by ID, where
+    those that need fetching are fetched together and those that cannot
+    be found are reported individually, rather than failing the request
+    """
+    fields = _fields(req, cls)
+    entities = await registry.get_many(cls, identities)
+
+    output = {}
+    for identity in identities:
+        entity = entities.get(identity)
+        if entity is None:
+            output[identity] = serialisable_error(404, f"No such {cls._relation} with ID {identity}")
+            continue
+
+        output[identity] = await entity.__serialisable__(fields)
+
+    return _SerialisedResponse(req, output)
+
+
+async def _links(req:Request, cls:T.Type[_EntityT]) -> StreamResponse:
+    """
+    Respond with the hypermedia entities of the given type, in a stable
+    order, either a page at a time, with a link to the next page (if
+    there may be one), or streamed in full; alternatively, respond with
+    the details of the entities that are requested in bulk
+    """
+    registry = await _get_registry(req)
+
+    identities = await _requested_ids(req)
+    if identities is not None:
+        return await _bulk(req, registry, cls, identities)
+
+    limit, cursor = _pagination(req)
+
+    # MessagePack arrays are framed by their length, which isn't known
+    # until every entity has been resolved, as nodes may be pruned in the
+    # meantime, so those listings are rendered in full
+    if limit is None and req.method != "HEAD" and req.preferred != MIMEType.MSGPACK:
+        return await _streamed_links(req, registry, cls, cursor)
+
+    identities = list(registry.keys(cls, after=cursor, limit=limit))
+    response = await _stored(req, lambda: registry.version(cls),
+                             lambda: _encoded_links(registry, cls, identities, req.preferred), req.path_qs)
+
+    if limit is not None and len(identities) == limit:
+        next_page = req.rel_url.update_query(cursor=identities[-1])
+        response.headers["Link"] = f"<{next_page}>; rel=\"next\""
+
+    return response
 
 
 @allow("GET")
-@accept(MIMEType.JSON)
+@accept(*MEDIA_TYPES)
 @_reconnect(_MAX_RETRY)
 async def registry(req:Request) -> Response:
     # Index (undocumented endpoint, just for completeness)
     registry = await _get_registry(req)
-    return _JSONResponse({
+    return _SerialisedResponse(req, {
         "last_updated": registry.last_updated,
         "groups":       { "href": "/groups", "rel": "items" },
         "people":       { "href": "/people", "rel": "items" }
     })
 
 
-@allow("GET")
-@accept(MIMEType.JSON)
+@allow("GET", "POST")
+@accept(*MEDIA_TYPES)
 @_reconnect(_MAX_RETRY)
-async def people(req:Request) -> Response:
-    registry = await _get_registry(req)
-    return _JSONResponse(await registry.all_links(Person))
+async def people(req:Request) -> StreamResponse:
+    return await _links(req, Person)
 
 
 @allow("GET")
-@accept(MIMEType.JSON)
+@accept(*MEDIA_TYPES)
 @_reconnect(_MAX_RETRY)
 async def person(req:Request) -> Response:
     person = await _get_entity(Person, req)
-    return _JSONResponse(await person.json, serialise=False)
+    return await _sparse(req, person)
 
 
 @allow("GET")
-@accept(MIMEType.JPEG)
+@accept(*PHOTO_MEDIA_TYPES)
 @_reconnect(_MAX_RETRY)
 async def photo(req:Request) -> Response:
+    size = req.query.get("size")
+    if size is not None:
+        if not size.isdigit() or int(size) not in PHOTO_SIZES:
+            _sizes = " or".join(", ".join(map(str, PHOTO_SIZES)).rsplit(",", 1))
+            raise HTTPError(400, f"Photo size must be one of {_sizes}")
+
+        size = int(size)
+
     person = await _get_entity(Person, req)
 
-    if person.photo is None:
+    photo = await person.get_photo()
+    if photo is None:
         raise HTTPError(404, f"No photo available for {person.name} ({person.id})")
 
-    return Response(status=200, content_type=MIMEType.JPEG.value, body=person.photo)
+    variant = await req.app["photos"].variant(photo, size, req.preferred)
+    headers = {"ETag": variant.etag, "Vary": "Accept"}
 
+    if req.headers.get("If-None-Match") == variant.etag:
+        return Response(status=304, headers=headers)
 
-@allow("GET")
-@accept(MIMEType.JSON)
+    return Response(status=200, content_type=req.preferred.value, body=variant.body, headers=headers)
+
+
+@allow("GET", "POST")
+@accept(*MEDIA_TYPES)
 @_reconnect(_MAX_RETRY)
-async def groups(req:Request) -> Response:
-    registry = await _get_registry(req)
-    return _JSONResponse(await registry.all_links(Group))
+async def groups(req:Request) -> StreamResponse:
+    return await _links(req, Group)
 
 
 @allow("GET")
-@accept(MIMEType.JSON)
+@accept(*MEDIA_TYPES)
 @_reconnect(_MAX_RETRY)
 async def group(req:Request) -> Response:
     group = await _get_entity(Group, req)
-    return _JSONResponse(await group.json, serialise=False)
+    return await _sparse(req, group)
+
+
+@allow("GET")
+async def metrics(req:Request) -> Response:
+    # Prometheus scrape target
+    body = req.app["metrics"].render().encode(ENCODING)
+    return Response(status=200, body=body, headers={"Content-Type": METRICS_CONTENT_TYPE})
@@ -0,0 +1,185 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+from time import monotonic
+
+from api.ldap import Server
+from api.models import Registry, Person, Group
+from common import types as T
+from common.cache import LRUCache
+from common.metrics import Counter, Gauge, Histogram, MetricSet
+from ._follower import SnapshotFollower
+from ._refresher import Refresher
+from ._store import ResponseStore
+from ._types import Application, Request, StreamResponse, Handler, HTTPException
+
+
+__all__ = ["LoopMonitor", "instrument", "metric_set"]
+
+
+# Interval (in seconds) between event loop lag samples
+_LAG_INTERVAL = 1.0
+
+# Event loop lag histogram bucket upper bounds, in seconds
+_LAG_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+class LoopMonitor(object):
+    """
+    Background task that measures how late the event loop is to wake it
+    up, which is how long anything else waits for blocking work to finish
+    """
+    _interval:float
+    _task:T.Optional[asyncio.Task]
+
+    lag:Histogram
+
+    def __init__(self, interval:float = _LAG_INTERVAL) -> None:
+        self._interval = interval
+        self._task = None
+
+        self.lag = Histogram("event_loop_lag_seconds",
+                             "Time by which the event loop overran scheduled wake ups",
+                             buckets=_LAG_BUCKETS)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_event_loop()
+
+        while True:
+            scheduled = loop.time() + self._interval
+            await asyncio.sleep(self._interval)
+            self.lag.observe(max(loop.time() - scheduled, 0))
+
+    async def start(self, _app:Application) -> None:
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self, _app:Application) -> None:
+        if self._task is None:
+            return
+
+        self._task.cancel()
+
+        try:
+            await self._task
+
+        except asyncio.CancelledError:
+            pass
+
+
+def _route(request:Request) -> str:
+    """ Route of the request, as its template rather than its path """
+    resource = request.match_info.route.resource
+    return resource.canonical if resource is not None else "unmatched"
+
+async def instrument(app:Application, handler:Handler) -> Handler:
+    """ Record the latency of every request, by route and status """
+    requests = app["metrics"]["http_request_duration_seconds"]
+
+    async def _middleware(request:Request) -> StreamResponse:
+        started = monotonic()
+        status = 500
+
+        try:
+            response = await handler(request)
+            status = response.status
+            return response
+
+        except HTTPException as e:
+            status = e.status
+            raise
+
+        finally:
+            requests.observe(monotonic() - started, _route(request), str(status))
+
+    return _middleware
+
+
+_CacheT = T.Union[ResponseStore, LRUCache]
+
+def _caches(caches:T.Dict[str, _CacheT]) -> T.List[T.Union[Counter, Gauge]]:
+    """ Hit and miss counts, hit ratios and sizes of the caches, by name """
+    def _collect(value:T.Callable[[_CacheT], T.Optional[float]]) -> T.Callable[[], T.Dict[T.Tuple[str], float]]:
+        def _collector() -> T.Dict[T.Tuple[str], float]:
+            values = {(name,): value(cache) for name, cache in caches.items()}
+            return {labels: v for labels, v in values.items() if v is not None}
+
+        return _collector
+
+    return [
+        Counter("cache_hits_total", "Number of cache lookups that were hits, by cache", ("cache",),
+                collect=_collect(lambda cache: cache.hits)),
+        Counter("cache_misses_total", "Number of cache lookups that were misses, by cache", ("cache",),
+                collect=_collect(lambda cache: cache.misses)),
+        Gauge("cache_hit_ratio", "Proportion of cache lookups that were hits, by cache", ("cache",),
+              collect=_collect(lambda cache: cache.hit_rate)),
+        Gauge("cache_size_bytes", "Total size of the cached values, by cache", ("cache",),
+              collect=_collect(lambda cache: cache.size))
+    ]
+
+def metric_set(app:Application) -> MetricSet:
+    """
+    Every metric exposed by the API server; most are recorded by the
+    components they measure, while those that merely reflect existing
+    state are only collected when they're scraped, so cost nothing in
+    the meantime
+    """
+    registry:Registry = app["registry"]
+    refresher:T.Union[Refresher, SnapshotFollower] = app["refresher"]
+    monitor:LoopMonitor = app["monitor"]
+    server = registry.server
+
+    # Connection pool gauges only apply to live LDAP servers
+    pool = []
+    if isinstance(server, Server):
+        pool = [
+            Gauge("ldap_pool_connections", "Number of established LDAP connections, by whether they're in use", ("state",),
+                  collect=lambda: {("in_use",): server.pool.in_use,
+                                   ("idle",):   server.pool.connections - server.pool.in_use}),
+            Gauge("ldap_pool_waiting", "Number of callers waiting for an LDAP connection",
+                  collect=lambda: {(): server.pool.waiting}),
+            Gauge("ldap_pool_size", "Maximum number of LDAP connections",
+                  collect=lambda: {(): server.pool.size}),
+            Counter("ldap_pool_waits_total", "Number of LDAP connections handed out",
+                    collect=lambda: {(): server.pool.waits}),
+            Counter("ldap_pool_wait_seconds_total", "Total time spent waiting for LDAP connections",
+                    collect=lambda: {(): server.pool.wait_time}),
+            Gauge("ldap_pool_max_wait_seconds", "Longest time spent waiting for an LDAP connection",
+                  collect=lambda: {(): server.pool.max_wait_time})
+        ]
+
+    return MetricSet(
+        Histogram("http_request_duration_seconds", "Time taken to respond to requests, by route and status",
+                  ("route", "status")),
+        monitor.lag,
+
+        *server.instrumentation.metrics,
+        *pool,
+
+        Gauge("registry_nodes", "Number of nodes in the registry, by class", ("class",),
+              collect=lambda: {(cls.__name__,): registry.count(cls) for cls in (Person, Group)}),
+        registry.seeds,
+        refresher.refreshes,
+        refresher.failures,
+        refresher.last_success,
+
+        *_caches({
+            "responses":      app["store"],
+            "photos":         registry.photos,
+            "photo_variants": app["photos"].cache
+        }))
@@ -79,7 +79,8 @@ def allow(*methods:str) -> HandlerDecorator:
 
             response = await handler(request)
 
-            if request.method == "HEAD":
+            # Streamed responses' lengths aren't known in advance
+            if request.method == "HEAD" and response.body is not None:
                 content_length = len(response.body)
                 response.body = None
                 response.headers["Content-Length"] = str(content_length)
@@ -204,7 +205,8 @@ def accept(*media_types:MIMEType) -> HandlerDecorator:
     if not media_types or any(not RE_MEDIA_TYPE.match(m.value) for m in media_types):
         raise TypeError("You must specify fully-qualified media type(s)")
 
-    available = tuple(set(media_types))
+    # Deduplicated, but in order, so ties are broken by our preference
+    available = tuple(dict.fromkeys(media_types))
 
     def _decorator(handler:Handler) -> Handler:
         """ Decorator that handles the accepted media types """
@@ -215,7 +217,7 @@ def accept(*media_types:MIMEType) -> HandlerDecorator:
             acceptable = _AcceptParser(request.headers.get("Accept", "*/*"))
 
             if not acceptable.can_accept(*available):
-                _pretty = " or".join(", ".join(available).rsplit(",", 1))
+                _pretty = " or".join(", ".join(m.value for m in available).rsplit(",", 1))
                 raise HTTPError(406, f"Can only respond with {_pretty} media types")
 
             # Thread the parsed Accept header and the preferred response
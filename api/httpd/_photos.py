@@ -0,0 +1,108 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+from hashlib import sha1
+from io import BytesIO
+
+from PIL import Image
+
+from common import types as T
+from common.cache import LRUCache
+from common.constants import MIMEType
+
+
+__all__ = ["DEFAULT_BUDGET", "SIZES", "MEDIA_TYPES", "Variant", "PhotoVariants"]
+
+
+# Default photo variant cache budget, in bytes
+DEFAULT_BUDGET = 32 * 1024 * 1024
+
+# Available photo sizes (maximum width and height, in pixels) and the
+# media types, in order of our preference, in which they're available
+SIZES = (64, 128, 256, 512)
+MEDIA_TYPES = (MIMEType.JPEG, MIMEType.WEBP, MIMEType.PNG)
+
+# Pillow formats and encoding options
+_FORMATS:T.Dict[MIMEType, T.Tuple[str, T.Dict[str, T.Any]]] = {
+    MIMEType.JPEG: ("JPEG", {"quality": 85, "optimize": True}),
+    MIMEType.WEBP: ("WEBP", {"quality": 80}),
+    MIMEType.PNG:  ("PNG",  {"optimize": True})
+}
+
+class Variant(T.NamedTuple):
+    """ Photo variant with its entity tag """
+    etag:str
+    body:bytes
+
+
+def _render(photo:bytes, size:T.Optional[int], media_type:MIMEType) -> bytes:
+    """ Resize (if necessary) and encode the photo in the given format """
+    image = Image.open(BytesIO(photo))
+
+    if size is not None:
+        image.thumbnail((size, size), Image.LANCZOS)
+
+    if media_type == MIMEType.JPEG and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    fmt, options = _FORMATS[media_type]
+    output = BytesIO()
+    image.save(output, format=fmt, **options)
+    return output.getvalue()
+
+
+_KeyT = T.Tuple[str, T.Optional[int], MIMEType]   # Content hash, Size, Media type
+
+class PhotoVariants(object):
+    """
+    Resized and re-encoded variants of photos, which are rendered (off
+    the event loop) once and then cached by the original's content hash
+    """
+    _cache:LRUCache[_KeyT, Variant]
+
+    def __init__(self, budget:int = DEFAULT_BUDGET) -> None:
+        self._cache = LRUCache(budget, sizeof=lambda variant: len(variant.body))
+
+    @property
+    def cache(self) -> LRUCache[_KeyT, Variant]:
+        return self._cache
+
+    async def variant(self, photo:bytes, size:T.Optional[int], media_type:MIMEType) -> Variant:
+        """
+        Get the photo variant of the given size (None for the original
+        size) and media type
+        """
+        digest = sha1(photo).hexdigest()
+        etag = f"\"{digest}-{size or 'original'}-{_FORMATS[media_type][0].lower()}\""
+
+        # The original is served as is
+        if size is None and media_type == MIMEType.JPEG:
+            return Variant(etag, photo)
+
+        key = (digest, size, media_type)
+        variant = self._cache.get(key)
+
+        if variant is None:
+            loop = asyncio.get_event_loop()
+            body = await loop.run_in_executor(None, _render, photo, size, media_type)
+            variant = Variant(etag, body)
+            self._cache.put(key, variant)
+
+        return variant
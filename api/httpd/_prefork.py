@@ -0,0 +1,198 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import os
+import shutil
+import signal
+import socket
+import tempfile
+from functools import partial
+from time import monotonic, sleep
+
+from api.models import Registry
+from common import types as T
+from common.logging import Level, log
+from ._refresher import Refresher
+
+
+__all__ = ["RegistryFactory", "Supervisor", "Worker"]
+
+
+# Maximum length of the shared listening socket's connection queue
+_BACKLOG = 128
+
+# Minimum time (in seconds) between a process starting and respawning,
+# so one that fails as soon as it starts doesn't spin
+_RESPAWN_DELAY = 1.0
+
+# Factory of the registry, which is called in each process, so each
+# has its own connections to the LDAP server
+RegistryFactory = T.Callable[[], Registry]
+
+# A worker serves the API on the shared listening socket, from the
+# registry snapshots published to the given path
+Worker = T.Callable[[socket.socket, str], None]
+
+def _listen(host:str, port:int) -> socket.socket:
+    """ Bind the listening socket that is shared by every worker """
+    family, kind, proto, _, address = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM, flags=socket.AI_PASSIVE)[0]
+
+    sock = socket.socket(family, kind, proto)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(address)
+    sock.listen(_BACKLOG)
+
+    return sock
+
+def _refresh(registry:RegistryFactory, snapshot:str) -> None:
+    """ Refresh the registry and publish its snapshots, until terminated """
+    loop = asyncio.get_event_loop()
+    refresher = Refresher(registry(), snapshot)
+
+    stopping = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopping.set)
+
+    loop.run_until_complete(refresher.start(None))
+    loop.run_until_complete(stopping.wait())
+    loop.run_until_complete(refresher.stop(None))
+
+class _Child(T.NamedTuple):
+    name:str
+    target:T.Callable[[], None]
+    started:float
+
+class Supervisor(object):
+    """
+    Parent of the processes that serve the API: a single refresher
+    process, which refreshes the registry from the LDAP server and
+    publishes a snapshot after each refresh, and a number of worker
+    processes, which accept connections from a listening socket they
+    inherit and restore the registry from each published snapshot. Thus
+    serving scales with the number of workers, while the load on the LDAP
+    server doesn't. Processes that exit unexpectedly are respawned.
+    """
+    _registry:RegistryFactory
+    _workers:int
+    _snapshot:str
+    _temporary:T.Optional[str]
+    _children:T.Dict[int, _Child]
+    _stopping:bool
+
+    def __init__(self, registry:RegistryFactory, workers:int, snapshot:T.Optional[str] = None) -> None:
+        """
+        @param   registry  Factory of the registry, called in each process
+        @param   workers   Number of worker processes
+        @param   snapshot  Path to which snapshots are published
+                           (defaults to a temporary file)
+        """
+        self._registry = registry
+        self._workers = workers
+
+        self._temporary = None
+        if snapshot is None:
+            self._temporary = tempfile.mkdtemp(prefix="registry-")
+            snapshot = os.path.join(self._temporary, "snapshot")
+
+        self._snapshot = snapshot
+        self._children = {}
+        self._stopping = False
+
+    def _spawn(self, name:str, target:T.Callable[[], None]) -> None:
+        pid = os.fork()
+
+        if pid == 0:
+            # Child process: terminate when signalled, like any other
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+
+            # The inherited event loop, if any, shares its selector with
+            # every other process, so each needs its own
+            asyncio.set_event_loop(asyncio.new_event_loop())
+
+            status = 1
+            try:
+                target()
+                status = 0
+
+            except KeyboardInterrupt:
+                status = 0
+
+            except BaseException as e:
+                log(f"The {name} failed: {e}", Level.Critical)
+
+            finally:
+                os._exit(status)
+
+        log(f"Started the {name} with PID {pid}", Level.Debug)
+        self._children[pid] = _Child(name, target, monotonic())
+
+    def _stop(self, _signum:int, _frame:T.Any) -> None:
+        """ Signal handler that terminates every child process """
+        if not self._stopping:
+            log("Stopping the refresher and worker processes", Level.Info)
+            self._stopping = True
+
+        for pid in self._children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+
+            except ProcessLookupError:
+                pass
+
+    def _supervise(self) -> None:
+        """ Wait for every child process to exit, respawning them until stopped """
+        while self._children:
+            try:
+                pid, _status = os.wait()
+
+            except ChildProcessError:
+                break
+
+            child = self._children.pop(pid, None)
+            if child is None or self._stopping:
+                continue
+
+            log(f"The {child.name} exited unexpectedly; respawning", Level.Error)
+            sleep(max(child.started + _RESPAWN_DELAY - monotonic(), 0))
+
+            if not self._stopping:
+                self._spawn(child.name, child.target)
+
+    def run(self, host:str, port:int, worker:Worker) -> None:
+        """ Start the refresher and workers, and supervise them until terminated """
+        sock = _listen(host, port)
+        handlers = {signum: signal.signal(signum, self._stop) for signum in (signal.SIGTERM, signal.SIGINT)}
+
+        try:
+            self._spawn("refresher", partial(_refresh, self._registry, self._snapshot))
+            for i in range(self._workers):
+                self._spawn(f"worker {i + 1}", partial(worker, sock, self._snapshot))
+
+            self._supervise()
+
+        finally:
+            sock.close()
+
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+
+            if self._temporary is not None:
+                shutil.rmtree(self._temporary, ignore_errors=True)
@@ -0,0 +1,167 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+from time import monotonic
+
+from api.models import Registry, write_snapshot
+from common import types as T, time
+from common.logging import Level, log
+from common.metrics import Counter, Gauge, Histogram
+from ._types import Application
+
+
+__all__ = ["Refresher"]
+
+
+# Proportion of the registry's shelf life, ahead of its expiry, at which
+# it will be refreshed
+_REFRESH_AHEAD = 0.1
+
+# Bounds (in seconds) of the back-off between failed refreshes
+_RETRY_MIN = 1
+_RETRY_MAX = 300
+
+# Refresh duration histogram bucket upper bounds, in seconds
+_DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+class Refresher(object):
+    """
+    Background task that refreshes the registry ahead of its expiry, so
+    requests continue to be served from the previous data until the new
+    data is ready, rather than waiting for the refresh themselves. After
+    each refresh, a snapshot of the registry is saved, if requested.
+    """
+    _registry:Registry
+    _snapshot:T.Optional[str]
+    _task:T.Optional[asyncio.Task]
+    _refresh:T.Optional[asyncio.Future]
+    _started:float
+
+    refreshes:Histogram
+    failures:Counter
+    last_success:Gauge
+
+    def __init__(self, registry:Registry, snapshot:T.Optional[str] = None) -> None:
+        self._registry = registry
+        self._snapshot = snapshot
+        self._task = None
+        self._refresh = None
+
+        self.refreshes = Histogram("registry_refresh_duration_seconds",
+                                   "Time taken by successful background registry refreshes",
+                                   buckets=_DURATION_BUCKETS)
+        self.failures = Counter("registry_refresh_failures_total",
+                                "Number of failed background registry refreshes")
+        self.last_success = Gauge("registry_refresh_last_success_timestamp_seconds",
+                                  "Time of the last successful background registry refresh")
+
+    @property
+    def _due_in(self) -> float:
+        """ Time (in seconds) until the registry ought to be refreshed """
+        last_updated = self._registry.last_updated
+        if last_updated is None:
+            return 0
+
+        due = last_updated + (self._registry.shelf_life * (1 - _REFRESH_AHEAD))
+        return max((due - time.now()).total_seconds(), 0)
+
+    async def _refresh_in(self, delay:float) -> None:
+        await asyncio.sleep(delay)
+        self._started = monotonic()
+        await self._registry.update()
+
+    def _schedule(self, delay:float = 0) -> None:
+        """
+        Schedule the next refresh, which is pending until it's due, so
+        there's always a refresh for the registry's first use to await
+        """
+        self._refresh = asyncio.ensure_future(self._refresh_in(delay))
+
+    async def _save(self) -> None:
+        """ Save a snapshot of the registry, off the event loop """
+        if self._snapshot is None:
+            return
+
+        snapshot = self._registry.dump()
+        loop = asyncio.get_event_loop()
+
+        try:
+            await loop.run_in_executor(None, write_snapshot, snapshot, self._snapshot)
+            log(f"Registry snapshot saved to {self._snapshot}", Level.Debug)
+
+        except OSError as e:
+            log(f"Could not save registry snapshot to {self._snapshot}: {e}", Level.Warning)
+
+    async def _run(self) -> None:
+        retry_in = _RETRY_MIN
+
+        while True:
+            try:
+                await self._refresh
+                log("Registry refreshed", Level.Debug)
+                self.refreshes.observe(monotonic() - self._started)
+                self.last_success.set(time.now().timestamp())
+                await self._save()
+                sleep_for = self._due_in
+                retry_in = _RETRY_MIN
+
+            except (asyncio.CancelledError, KeyboardInterrupt, SystemExit):
+                raise
+
+            # The LDAP and registry exceptions derive from BaseException
+            except BaseException as e:
+                log(f"Could not refresh registry: {e}; retrying in {retry_in} seconds", Level.Error)
+                self.failures.inc()
+                sleep_for = retry_in
+                retry_in = min(retry_in * 2, _RETRY_MAX)
+
+            self._schedule(sleep_for)
+
+    async def start(self, _app:Application) -> None:
+        """ Start refreshing the registry in the background """
+        log("Starting background registry refresh", Level.Debug)
+        self._schedule()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self, _app:Application) -> None:
+        """ Stop refreshing the registry """
+        if self._task is None:
+            return
+
+        log("Stopping background registry refresh", Level.Debug)
+        self._task.cancel()
+        self._refresh.cancel()
+
+        try:
+            await self._task
+
+        except asyncio.CancelledError:
+            pass
+
+    async def ready(self) -> None:
+        """
+        Wait until the registry has data to serve; that is, only if it
+        has never been populated, we wait for the current refresh, or the
+        next attempt if that has already failed (and raise any exception
+        that attempt raises)
+        """
+        if self._registry.last_updated is None:
+            # Shielded, so an abandoned request won't cancel the refresh
+            await asyncio.shield(self._refresh)
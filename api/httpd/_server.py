@@ -17,15 +17,24 @@ You should have received a copy of the GNU Affero General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
-import asyncio
+import socket
+from functools import partial
 
 from aiohttp.web import run_app
 
+from common import types as T
 from common.logging import Level, get_logger, log
 from api import __version__
 from api.models import Registry
 from . import _handlers as handler
+from ._compression import DEFAULT_THRESHOLD as DEFAULT_COMPRESS_THRESHOLD
+from ._follower import SnapshotFollower, published
+from ._metrics import LoopMonitor, instrument, metric_set
 from ._middleware import error_handler
+from ._photos import DEFAULT_BUDGET as DEFAULT_VARIANT_BUDGET, PhotoVariants
+from ._prefork import RegistryFactory, Supervisor
+from ._refresher import Refresher
+from ._store import DEFAULT_BUDGET as DEFAULT_STORE_BUDGET, ResponseStore
 from ._types import Application, Request, Response
 
 
@@ -36,18 +45,38 @@ async def _set_server_header(_request:Request, response:Response) -> None:
     response.headers["Access-Control-Allow-Origin"] = "*"
 
 async def _shutdown(app:Application) -> None:
-    log("Shutting down API server", Level.Info)
+    store = app["store"]
+    if store.hit_rate is not None:
+        log(f"Response store hit rate: {store.hit_rate:.1%} ({store.hits} hits, {store.misses} misses)", Level.Info)
 
+    log("Shutting down API server", Level.Info)
 
-def start(host:str, port:int, registry:Registry) -> None:
-    """ Start the API server """
-    logger = get_logger()
 
-    app = Application(logger=logger, middlewares=[error_handler])
+def _application(registry:Registry,
+                 refresher:T.Union[Refresher, SnapshotFollower],
+                 store_budget:int,
+                 variant_budget:int,
+                 compress_threshold:int) -> Application:
+    """ Build the API server application """
+    app = Application(logger=get_logger(), middlewares=[instrument, error_handler])
     app.on_response_prepare.append(_set_server_header)
     app.on_shutdown.append(_shutdown)
 
     app["registry"] = registry
+    app["store"] = ResponseStore(store_budget, compress_threshold)
+    app["photos"] = PhotoVariants(variant_budget)
+
+    # Refresh the registry in the background
+    app["refresher"] = refresher
+    app.on_startup.append(refresher.start)
+    app.on_cleanup.append(refresher.stop)
+
+    # Sample the event loop's lag in the background
+    monitor = app["monitor"] = LoopMonitor()
+    app.on_startup.append(monitor.start)
+    app.on_cleanup.append(monitor.stop)
+
+    app["metrics"] = metric_set(app)
 
     # Routing
     app.router.add_route("*", "/",                  handler.registry)
@@ -56,8 +85,44 @@ def start(host:str, port:int, registry:Registry) -> None:
     app.router.add_route("*", "/people/{id}/photo", handler.photo)
     app.router.add_route("*", "/groups",            handler.groups)
     app.router.add_route("*", "/groups/{id}",       handler.group)
+    app.router.add_route("*", "/metrics",           handler.metrics)
+
+    return app
+
+
+def start(host:str, port:int, build_registry:RegistryFactory,
+          store_budget:int = DEFAULT_STORE_BUDGET,
+          variant_budget:int = DEFAULT_VARIANT_BUDGET,
+          snapshot:T.Optional[str] = None,
+          compress_threshold:int = DEFAULT_COMPRESS_THRESHOLD,
+          workers:int = 1) -> None:
+    """
+    Start the API server; with more than one worker, each is a separate
+    process, serving from the snapshots published by a single refresher
+    process, each of which builds its own registry from the given factory
+    """
+    logger = get_logger()
+    run = partial(run_app, access_log=logger, access_log_format="%a \"%r\" %s %b", print=None)
+
+    if workers == 1:
+        registry = build_registry()
+        app = _application(registry, Refresher(registry, snapshot), store_budget, variant_budget, compress_threshold)
+
+        log(f"Starting API server on http://{host}:{port}", Level.Info)
+        run(app, host=host, port=port)
+        return
+
+    def _worker(sock:socket.socket, path:str) -> None:
+        publication = published(path)
+        registry = build_registry()
+
+        # Workers needn't restore the publication they've just been
+        # warm started from, if any
+        if registry.last_updated is None:
+            publication = None
+
+        follower = SnapshotFollower(registry, path, publication)
+        run(_application(registry, follower, store_budget, variant_budget, compress_threshold), sock=sock)
 
-    log(f"Starting API server on http://{host}:{port}", Level.Info)
-    run_app(app, host=host, port=port,
-            access_log=logger, access_log_format="%a \"%r\" %s %b",
-            print=None)
+    log(f"Starting API server on http://{host}:{port} with {workers} workers", Level.Info)
+    Supervisor(build_registry, workers, snapshot).run(host, port, _worker)
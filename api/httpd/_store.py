@@ -0,0 +1,144 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+
+from common import types as T
+from common.cache import LRUCache
+from common.constants import MIMEType
+from ._compression import DEFAULT_THRESHOLD, compress
+
+
+__all__ = ["DEFAULT_BUDGET", "ResponseStore"]
+
+
+# Default response store budget, in bytes
+DEFAULT_BUDGET = 64 * 1024 * 1024
+
+class _Entry(T.NamedTuple):
+    """ Stored body, with its compressed variants by content coding """
+    version:int
+    body:bytes
+    encoded:T.Dict[str, bytes]
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(map(len, self.encoded.values()))
+
+_KeyT = T.Tuple[str, MIMEType]        # Resource, Representation
+_RendererT = T.Callable[[], T.Awaitable[bytes]]
+_VersionT = T.Callable[[], int]
+
+class ResponseStore(object):
+    """
+    Encoded response bodies, by resource and representation, which are
+    valid for the version of the data from which they were rendered and
+    are otherwise rebuilt; bodies that are large enough to be worth it
+    are compressed, on demand, once per version
+    """
+    _cache:LRUCache[_KeyT, _Entry]
+    _threshold:int
+
+    hits:int
+    misses:int
+
+    def __init__(self, budget:int = DEFAULT_BUDGET, threshold:int = DEFAULT_THRESHOLD) -> None:
+        self._cache = LRUCache(budget, sizeof=lambda entry: entry.size)
+        self._threshold = threshold
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def budget(self) -> int:
+        """ Maximum total size of the stored bodies """
+        return self._cache.budget
+
+    @property
+    def size(self) -> int:
+        """ Total size of the stored bodies """
+        return self._cache.size
+
+    @property
+    def hit_rate(self) -> T.Optional[float]:
+        """ Proportion of lookups with a current body, if there were any """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else None
+
+    async def _encoded(self, key:_KeyT, entry:_Entry, coding:T.Optional[str]) -> T.Tuple[bytes, T.Optional[str]]:
+        """
+        The stored body, compressed with the given content coding, if
+        any, when it's large enough; returning the body and the content
+        coding that was actually applied
+        """
+        if coding is None or len(entry.body) < self._threshold:
+            return entry.body, None
+
+        encoded = entry.encoded.get(coding)
+        if encoded is None:
+            loop = asyncio.get_event_loop()
+            encoded = await loop.run_in_executor(None, compress, entry.body, coding)
+
+            # Stored alongside the plain body, unless it's been superseded
+            current = self._cache.get(key)
+            if current is not None and current.version == entry.version:
+                self._cache.put(key, current._replace(encoded={**current.encoded, coding: encoded}))
+
+        return encoded, coding
+
+    async def get(self, resource:str, representation:MIMEType, version:int, coding:T.Optional[str] = None) -> T.Optional[T.Tuple[bytes, T.Optional[str]]]:
+        """
+        Get the stored body of a resource's representation, compressed
+        as per render, if it's current for the given version of its data
+        """
+        key = (resource, representation)
+
+        entry = self._cache.get(key)
+        if entry is None or entry.version != version:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return await self._encoded(key, entry, coding)
+
+    def put(self, resource:str, representation:MIMEType, version:int, body:bytes) -> None:
+        """ Store the body of a resource's representation, for the given version of its data """
+        self._cache.put((resource, representation), _Entry(version, body, {}))
+
+    async def render(self, resource:str, representation:MIMEType, version:_VersionT, renderer:_RendererT, coding:T.Optional[str] = None) -> T.Tuple[bytes, T.Optional[str]]:
+        """
+        Get the stored body of a resource's representation, if it's
+        current, per the version of its data, otherwise render and store
+        it, compressed with the given content coding, if any, when it's
+        large enough; returning the body and the content coding that was
+        actually applied
+        """
+        current = version()
+        stored = await self.get(resource, representation, current, coding)
+        if stored is not None:
+            return stored
+
+        entry = _Entry(current, await renderer(), {})
+
+        # Rendering may have changed the data (e.g., by updating expired
+        # nodes), as may anything else in the meantime, in which case the
+        # body is already out of date, so isn't stored
+        if version() == current:
+            self.put(resource, representation, current, entry.body)
+
+        return await self._encoded((resource, representation), entry, coding)
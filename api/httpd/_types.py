@@ -17,8 +17,8 @@ You should have received a copy of the GNU Affero General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
-from aiohttp.web import Application, Request, Response, HTTPException
+from aiohttp.web import Application, Request, Response, StreamResponse, HTTPException
 from common import types as T
 
-Handler = T.Callable[[Request], Response]
+Handler = T.Callable[[Request], StreamResponse]
 HandlerDecorator = T.Callable[[Handler], Handler]
@@ -1,4 +1,7 @@
 from ._exceptions import *
 from ._scope import Scope
-from ._server import Server, escape
+from ._pool import PoolStatistics
+from ._instrumentation import DEFAULT_SLOW_THRESHOLD, SearchInstrumentation, SearchRecord
+from ._server import Server, DEFAULT_POOL_SIZE, escape
+from ._ldif import LDIFDirectory, DEFAULT_INDEXED
 from ._entity import Entity, entity_adaptor_factory
@@ -19,6 +19,8 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 __all__ = [
     "CannotConnect",
+    "InvalidFilter",
+    "InvalidLDIF",
     "NoServerSpecified",
     "NoSuchDistinguishedName",
     "PayloadNotFetched"
@@ -27,6 +29,12 @@ __all__ = [
 class CannotConnect(BaseException):
     """ Raised when a connection cannot be established """
 
+class InvalidFilter(BaseException):
+    """ Raised when a search filter cannot be parsed """
+
+class InvalidLDIF(BaseException):
+    """ Raised when an LDIF file cannot be parsed """
+
 class NoServerSpecified(BaseException):
     """ Raised when the LDAP server hasn't been injected """
 
@@ -0,0 +1,190 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import re
+from abc import ABCMeta, abstractmethod
+from functools import lru_cache
+
+from common import types as T
+from ._exceptions import InvalidFilter
+
+
+__all__ = ["Filter", "And", "Or", "Not", "Presence", "Equality", "Substrings", "GreaterOrEqual", "LessOrEqual", "parse"]
+
+
+# Entries are matched with their attribute names in lower case; values
+# are compared case insensitively (for ASCII), which is what the
+# matching rules of the attributes we search on amount to
+_EntryT = T.Mapping[str, T.List[bytes]]
+
+class Filter(metaclass=ABCMeta):
+    """ Search filter component """
+    __slots__ = ()
+
+    @abstractmethod
+    def match(self, entry:_EntryT) -> bool:
+        """ Check the entry matches the filter """
+
+class And(Filter):
+    __slots__ = ("terms",)
+
+    def __init__(self, terms:T.List[Filter]) -> None:
+        self.terms = terms
+
+    def match(self, entry:_EntryT) -> bool:
+        return all(term.match(entry) for term in self.terms)
+
+class Or(Filter):
+    __slots__ = ("terms",)
+
+    def __init__(self, terms:T.List[Filter]) -> None:
+        self.terms = terms
+
+    def match(self, entry:_EntryT) -> bool:
+        return any(term.match(entry) for term in self.terms)
+
+class Not(Filter):
+    __slots__ = ("term",)
+
+    def __init__(self, term:Filter) -> None:
+        self.term = term
+
+    def match(self, entry:_EntryT) -> bool:
+        return not self.term.match(entry)
+
+class Presence(Filter):
+    __slots__ = ("attr",)
+
+    def __init__(self, attr:str) -> None:
+        self.attr = attr
+
+    def match(self, entry:_EntryT) -> bool:
+        return self.attr in entry
+
+class _Assertion(Filter):
+    """ Comparison of an attribute's values against an assertion value """
+    __slots__ = ("attr", "value")
+
+    def __init__(self, attr:str, value:bytes) -> None:
+        self.attr = attr
+        self.value = value.lower()
+
+    def match(self, entry:_EntryT) -> bool:
+        return any(self.compare(value.lower()) for value in entry.get(self.attr, ()))
+
+    @abstractmethod
+    def compare(self, value:bytes) -> bool:
+        """ Compare a value, in lower case, against the assertion """
+
+class Equality(_Assertion):
+    __slots__ = ()
+
+    def compare(self, value:bytes) -> bool:
+        return value == self.value
+
+class GreaterOrEqual(_Assertion):
+    __slots__ = ()
+
+    def compare(self, value:bytes) -> bool:
+        return value >= self.value
+
+class LessOrEqual(_Assertion):
+    __slots__ = ()
+
+    def compare(self, value:bytes) -> bool:
+        return value <= self.value
+
+class Substrings(Filter):
+    __slots__ = ("attr", "pattern")
+
+    def __init__(self, attr:str, parts:T.List[bytes]) -> None:
+        self.attr = attr
+        self.pattern = re.compile(b".*".join(re.escape(part.lower()) for part in parts), re.DOTALL)
+
+    def match(self, entry:_EntryT) -> bool:
+        return any(self.pattern.fullmatch(value.lower()) for value in entry.get(self.attr, ()))
+
+
+_RE_ESCAPE = re.compile(rb"\\([0-9a-fA-F]{2})")
+_RE_ITEM = re.compile(r"^([a-zA-Z0-9][a-zA-Z0-9;\-\.]*)(=|>=|<=|~=)(.*)$", re.DOTALL)
+
+_ASSERTIONS:T.Dict[str, T.Type[_Assertion]] = {
+    "=":  Equality,
+    ">=": GreaterOrEqual,
+    "<=": LessOrEqual,
+    "~=": Equality  # Approximate matching is just equality, for us
+}
+
+def _unescape(value:str) -> bytes:
+    return _RE_ESCAPE.sub(lambda m: bytes.fromhex(m[1].decode()), value.encode())
+
+def _item(item:str) -> Filter:
+    match = _RE_ITEM.match(item)
+    if match is None:
+        raise InvalidFilter(f"Cannot parse filter item \"{item}\"")
+
+    attr, operator, value = match.groups()
+    attr = attr.lower()
+
+    if operator == "=" and value == "*":
+        return Presence(attr)
+
+    if operator == "=" and "*" in value:
+        return Substrings(attr, [_unescape(part) for part in value.split("*")])
+
+    return _ASSERTIONS[operator](attr, _unescape(value))
+
+def _parse(search:str, position:int) -> T.Tuple[Filter, int]:
+    """ Parse the parenthesised filter at the position and where it ends """
+    if search[position:position + 1] != "(":
+        raise InvalidFilter(f"Expected \"(\" at position {position} of {search}")
+
+    kind = search[position + 1:position + 2]
+    if kind in ("&", "|", "!"):
+        terms = []
+        position += 2
+        while search[position:position + 1] == "(":
+            term, position = _parse(search, position)
+            terms.append(term)
+
+        if search[position:position + 1] != ")" or not terms or (kind == "!" and len(terms) != 1):
+            raise InvalidFilter(f"Malformed filter at position {position} of {search}")
+
+        component = And(terms) if kind == "&" else Or(terms) if kind == "|" else Not(terms[0])
+        return component, position + 1
+
+    end = search.find(")", position)
+    if end == -1:
+        raise InvalidFilter(f"Unbalanced parentheses in {search}")
+
+    return _item(search[position + 1:end]), end + 1
+
+@lru_cache(maxsize=256)
+def parse(search:str) -> Filter:
+    """
+    Parse an LDAP search filter, per RFC4515, supporting conjunction,
+    disjunction, negation, equality, presence, substrings and ordering
+    (but not extensible matching)
+    """
+    search = search.strip()
+    component, end = _parse(search, 0)
+    if end != len(search):
+        raise InvalidFilter(f"Unexpected trailing characters in {search}")
+
+    return component
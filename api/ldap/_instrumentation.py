@@ -0,0 +1,201 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import re
+from functools import lru_cache
+from time import monotonic
+
+from common import types as T
+from common.logging import Level, log
+from common.metrics import Counter, Histogram
+from . import _types as ldapT
+from ._scope import Scope
+
+
+__all__ = ["DEFAULT_SLOW_THRESHOLD", "SearchRecord", "SearchInstrumentation"]
+
+
+# Default duration (in seconds) from which searches are logged as slow
+DEFAULT_SLOW_THRESHOLD = 1.0
+
+_RE_FIRST_RDN = re.compile(r"^(?:[^,\\]|\\.)*,")
+
+def _base_label(base:str, scope:Scope) -> str:
+    """
+    Search base as a metric label: base scoped searches are for
+    individual entries, so are labelled by their parent, to keep the
+    number of labels bounded
+    """
+    return _RE_FIRST_RDN.sub("", base, count=1) if scope == Scope.Base else base
+
+# Assertion values (other than presence) and runs of identical terms
+_RE_VALUE = re.compile(r"([=<>~]=?)(?!\*\))(?:[^()\\]|\\.)+(?=\))")
+_RE_REPEATS = re.compile(r"(\([^()]*\))\1+")
+
+@lru_cache(maxsize=1024)
+def _shape(search:str) -> str:
+    """
+    Search filter with its values elided and runs of identical terms
+    collapsed, so the same query with different inputs (e.g., searches
+    for individual entries in a loop) is counted together
+    """
+    return _RE_REPEATS.sub(r"\1...", _RE_VALUE.sub(r"\1?", search))
+
+def _size(result:T.Tuple[str, ldapT.Payload]) -> int:
+    """ Approximate size (in bytes) of a search result """
+    dn, payload = result
+    return len(dn) + sum(len(datum) for data in payload.values() for datum in data)
+
+
+class SearchRecord(object):
+    """ Timings and volume of an individual search """
+    __slots__ = ("base", "scope", "search", "started", "connected", "first_result", "finished", "searched", "entries", "received")
+
+    base:str
+    scope:Scope
+    search:str
+    started:float
+    connected:T.Optional[float]
+    first_result:T.Optional[float]
+    finished:T.Optional[float]
+    searched:float
+    entries:int
+    received:int
+
+    def __init__(self, base:str, scope:Scope, search:str) -> None:
+        self.base = base
+        self.scope = scope
+        self.search = search
+        self.started = monotonic()
+        self.connected = None
+        self.first_result = None
+        self.finished = None
+        self.searched = 0.0
+        self.entries = 0
+        self.received = 0
+
+    def result(self, result:T.Tuple[str, ldapT.Payload]) -> None:
+        """ Account for a search result """
+        if self.first_result is None:
+            self.first_result = monotonic()
+
+        self.entries += 1
+        self.received += _size(result)
+
+    def _since_start(self, timestamp:T.Optional[float]) -> T.Optional[float]:
+        return timestamp - self.started if timestamp is not None else None
+
+    @property
+    def waited(self) -> T.Optional[float]:
+        """ Time (in seconds) spent waiting for a connection """
+        return self._since_start(self.connected)
+
+    @property
+    def time_to_first_result(self) -> T.Optional[float]:
+        """ Time (in seconds) until the first result, if there was one """
+        return self._since_start(self.first_result)
+
+    @property
+    def duration(self) -> float:
+        """
+        Time (in seconds) spent waiting for the search's results, which
+        excludes waiting for a connection and the time the caller spends
+        between results
+        """
+        return self.searched
+
+    @property
+    def elapsed(self) -> T.Optional[float]:
+        """ Time (in seconds) until the search finished """
+        return self._since_start(self.finished)
+
+    def __str__(self) -> str:
+        timings = f"{self.duration:.3f}s searching, {self.elapsed:.3f}s in total, " \
+                  f"{self.waited or 0:.3f}s waiting for a connection"
+        if self.time_to_first_result is not None:
+            timings += f", {self.time_to_first_result:.3f}s to the first result"
+
+        return f"{self.scope.name} search of {self.base} for {self.search}: " \
+               f"{self.entries} entries, {self.received} bytes; {timings}"
+
+
+class SearchInstrumentation(object):
+    """
+    Aggregated search metrics, by base DN and scope, with the number of
+    searches also by the shape of their filter, such that repetitive
+    search patterns stand out, and a log of slow searches
+    """
+    _slow_threshold:float
+
+    searches:Counter
+    durations:Histogram
+    first_results:Histogram
+    entries:Counter
+    received:Counter
+    slow:Counter
+
+    def __init__(self, slow_threshold:float = DEFAULT_SLOW_THRESHOLD) -> None:
+        self._slow_threshold = slow_threshold
+
+        labels = ("base", "scope")
+        self.searches = Counter("ldap_searches_total",
+                                "Number of LDAP searches, by base DN, scope and filter, with values elided",
+                                (*labels, "filter"))
+        self.durations = Histogram("ldap_search_duration_seconds",
+                                   "Time spent waiting for LDAP search results, by base DN and scope",
+                                   labels)
+        self.first_results = Histogram("ldap_search_first_result_seconds",
+                                       "Time taken for LDAP searches' first results, by base DN and scope",
+                                       labels)
+        self.entries = Counter("ldap_search_entries_total",
+                               "Number of entries returned by LDAP searches, by base DN and scope",
+                               labels)
+        self.received = Counter("ldap_search_received_bytes_total",
+                                "Approximate size of the entries returned by LDAP searches, by base DN and scope",
+                                labels)
+        self.slow = Counter("ldap_slow_searches_total",
+                            "Number of LDAP searches that exceeded the slow search threshold, by base DN and scope",
+                            labels)
+
+    @property
+    def slow_threshold(self) -> float:
+        return self._slow_threshold
+
+    @property
+    def metrics(self) -> T.List[T.Union[Counter, Histogram]]:
+        return [self.searches, self.durations, self.first_results, self.entries, self.received, self.slow]
+
+    def record(self, search:SearchRecord) -> None:
+        """ Account for a finished search """
+        if search.finished is None:
+            search.finished = monotonic()
+
+        labels = (_base_label(search.base, search.scope), search.scope.name)
+
+        self.searches.inc(*labels, _shape(search.search))
+        self.durations.observe(search.duration, *labels)
+        self.entries.inc(*labels, amount=search.entries)
+        self.received.inc(*labels, amount=search.received)
+
+        if search.first_result is not None:
+            self.first_results.observe(search.time_to_first_result, *labels)
+
+        if search.duration >= self._slow_threshold:
+            self.slow.inc(*labels)
+            log(f"Slow LDAP search: {search}", Level.Warning)
@@ -0,0 +1,329 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import base64
+import binascii
+import re
+import sys
+from collections import defaultdict
+from pathlib import Path
+from time import monotonic
+
+from common import types as T
+from common.logging import Level, log
+from common.utils import identity
+from . import _types as ldapT
+from ._exceptions import InvalidLDIF, NoSuchDistinguishedName
+from ._filter import Filter, And, Or, Equality, parse
+from ._instrumentation import DEFAULT_SLOW_THRESHOLD, SearchInstrumentation, SearchRecord
+from ._scope import Scope
+
+
+__all__ = ["DEFAULT_INDEXED", "LDIFDirectory"]
+
+
+# Attributes (in lower case) whose values are indexed by default, being
+# those that the registry searches on by equality
+DEFAULT_INDEXED = ("objectclass", "uid", "cn")
+
+# Number of results between yields to the event loop
+_YIELD_EVERY = 1000
+
+_NO_ATTRS = "1.1"
+
+_RE_RDN = re.compile(r"(?:[^,\\]|\\.)+")
+
+def _normalise(dn:str) -> T.Tuple[str, str]:
+    """ Normalised DN, for comparison, and that of its parent """
+    if "\\" in dn:
+        rdns = [rdn.strip() for rdn in _RE_RDN.findall(dn.lower())]
+        return ",".join(rdns), ",".join(rdns[1:])
+
+    # Without escapes, RDNs can simply be split on commas
+    normalised = ",".join(map(str.strip, dn.lower().split(",")))
+    return normalised, normalised.partition(",")[2]
+
+
+def _records(stream:T.BinaryIO) -> T.Iterator[T.Tuple[int, T.List[bytes]]]:
+    """
+    Generator of the unfolded lines of each record, without comments,
+    with the line number at which the record starts
+    """
+    record:T.List[bytes] = []
+    start = 0
+    current:T.List[bytes] = []  # Parts of the current, possibly folded, line
+
+    def _unfold() -> None:
+        if current and not current[0].startswith(b"#"):
+            record.append(b"".join(current))
+
+        current.clear()
+
+    for number, line in enumerate(stream, 1):
+        line = line.rstrip(b"\r\n")
+
+        # Folded lines continue after a single space
+        if line.startswith(b" "):
+            if not current:
+                raise InvalidLDIF(f"Continuation without a line to continue, at line {number}")
+
+            current.append(line[1:])
+            continue
+
+        _unfold()
+
+        if line:
+            if not record:
+                start = number
+
+            current.append(line)
+
+        elif record:
+            yield start, record
+            record = []
+
+    _unfold()
+    if record:
+        yield start, record
+
+
+def _decode(value:bytes, number:int) -> bytes:
+    """ Decode an attribute value given other than as a safe string """
+    if value.startswith(b"<"):
+        raise InvalidLDIF(f"URL values are not supported, in record starting at line {number}")
+
+    try:
+        return base64.b64decode(value[1:].strip(), validate=True)
+
+    except binascii.Error as e:
+        raise InvalidLDIF(f"Invalid base64 value in record starting at line {number}: {e}")
+
+
+class _Entry(T.NamedTuple):
+    dn:str
+    normalised:str
+    parent:str
+    payload:T.Dict[str, T.List[bytes]]  # Attribute names in lower case
+
+class LDIFDirectory(object):
+    """
+    Read-only directory loaded from an LDIF export, which is searched in
+    memory with the same contract as an LDAP server. Entries are indexed
+    by their parent DN and by the values of the given attributes, so the
+    usual searches don't need to scan the whole directory. The export is
+    only read once, when the directory is created.
+    """
+    _path:Path
+    _entries:T.List[_Entry]
+    _dns:T.Dict[str, int]                           # Normalised DN: Entry
+    _children:T.DefaultDict[str, T.List[int]]       # Normalised DN: Entries
+    _index:T.Dict[str, T.Dict[bytes, T.List[int]]]  # Attribute: {Value: Entries}
+    _names:T.Dict[str, str]                         # Attribute: Attribute, as given
+    _instrumentation:SearchInstrumentation
+
+    def __init__(self, path:str, indexed:T.Iterable[str] = DEFAULT_INDEXED, slow_threshold:float = DEFAULT_SLOW_THRESHOLD) -> None:
+        self._path = Path(path).resolve()
+        self._entries = []
+        self._dns = {}
+        self._children = defaultdict(list)
+        self._index = {attr.lower(): {} for attr in indexed}
+        self._names = {}
+        self._instrumentation = SearchInstrumentation(slow_threshold)
+
+        log(f"Loading directory from {self._path}", Level.Info)
+        started = monotonic()
+
+        # Attribute names, as given, mapped to them in lower case
+        names:T.Dict[bytes, str] = {}
+
+        with self._path.open("rb") as stream:
+            for number, record in _records(stream):
+                self._load(number, record, names)
+
+        log(f"Loaded {len(self._entries)} entries in {monotonic() - started:.1f} seconds", Level.Info)
+
+    def _load(self, number:int, record:T.List[bytes], names:T.Dict[bytes, str]) -> None:
+        """ Add a record to the directory and its indices """
+        payload = defaultdict(list)
+        dn = None
+
+        for line in record:
+            name, separator, value = line.partition(b":")
+            if not separator:
+                raise InvalidLDIF(f"Missing attribute separator in record starting at line {number}")
+
+            value = _decode(value, number) if value[:1] in (b":", b"<") else value.lstrip(b" ")
+
+            attr = names.get(name)
+            if attr is None:
+                # Attribute options (e.g., jpegPhoto;binary) are dropped,
+                # so the attribute matches by its type alone
+                given = name.decode("ascii").strip().partition(";")[0]
+                attr = names[name] = sys.intern(given.lower())
+                self._names.setdefault(attr, given)
+
+                if attr == "changetype":
+                    raise InvalidLDIF(f"Change records are not supported, in record starting at line {number}")
+
+            if dn is None:
+                # The version may be followed directly by the first record
+                if attr == "version" and line is record[0]:
+                    continue
+
+                if attr != "dn":
+                    raise InvalidLDIF(f"Record starting at line {number} doesn't start with a DN")
+
+                dn = value.decode()
+                continue
+
+            payload[attr].append(value)
+
+        if dn is None:
+            return
+
+        normalised, parent = _normalise(dn)
+        if normalised in self._dns:
+            log(f"Ignoring duplicate entry for {dn}, at line {number}", Level.Warning)
+            return
+
+        i = len(self._entries)
+        self._entries.append(_Entry(dn, normalised, parent, dict(payload)))
+        self._dns[normalised] = i
+        self._children[parent].append(i)
+
+        for attr, index in self._index.items():
+            for value in payload.get(attr, ()):
+                index.setdefault(value.lower(), []).append(i)
+
+    @property
+    def uri(self) -> str:
+        return self._path.as_uri()
+
+    @property
+    def instrumentation(self) -> SearchInstrumentation:
+        return self._instrumentation
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _candidates(self, search:Filter) -> T.Optional[T.Set[int]]:
+        """
+        Entries that could match the filter, per the indices, or None if
+        the filter can't be resolved through them
+        """
+        if isinstance(search, Equality) and search.attr in self._index:
+            return set(self._index[search.attr].get(search.value, ()))
+
+        if isinstance(search, And):
+            # The smallest candidate set of any term will do
+            candidates = [c for c in map(self._candidates, search.terms) if c is not None]
+            return min(candidates, key=len) if candidates else None
+
+        if isinstance(search, Or):
+            candidates = list(map(self._candidates, search.terms))
+            return set().union(*candidates) if None not in candidates else None
+
+        return None
+
+    def _subtree(self, normalised:str) -> T.Iterator[int]:
+        """ Entries subordinate to the given normalised DN, depth first """
+        for i in self._children.get(normalised, ()):
+            yield i
+            yield from self._subtree(self._entries[i].normalised)
+
+    def _in_scope(self, normalised:str, scope:Scope) -> T.Callable[[_Entry], bool]:
+        if scope == Scope.Base:
+            return lambda entry: entry.normalised == normalised
+
+        if scope == Scope.OneLevel:
+            return lambda entry: entry.parent == normalised
+
+        suffix = f",{normalised}"
+        if scope == Scope.Children:
+            return lambda entry: entry.normalised.endswith(suffix)
+
+        return lambda entry: entry.normalised == normalised or entry.normalised.endswith(suffix)
+
+    def _scoped(self, normalised:str, scope:Scope) -> T.Iterable[int]:
+        if scope == Scope.Base:
+            return [self._dns[normalised]] if normalised in self._dns else []
+
+        if scope == Scope.OneLevel:
+            return self._children.get(normalised, [])
+
+        subtree = list(self._subtree(normalised))
+        if scope == Scope.Subtree and normalised in self._dns:
+            subtree.insert(0, self._dns[normalised])
+
+        return subtree
+
+    def _search(self, base:str, scope:Scope, search:Filter) -> T.List[_Entry]:
+        """ Entries matching the search, in the order they were loaded """
+        normalised, _ = _normalise(base)
+        if normalised not in self._dns and normalised not in self._children:
+            raise NoSuchDistinguishedName(f"Base DN {base} does not exist")
+
+        candidates = self._candidates(search)
+        if candidates is None:
+            entries = (self._entries[i] for i in self._scoped(normalised, scope))
+
+        else:
+            in_scope = self._in_scope(normalised, scope)
+            entries = (entry for entry in map(self._entries.__getitem__, sorted(candidates)) if in_scope(entry))
+
+        return [entry for entry in entries if search.match(entry.payload)]
+
+    def _select(self, payload:T.Dict[str, T.List[bytes]], attrs:T.Optional[T.List[str]]) -> ldapT.Payload:
+        """
+        Requested attributes of the payload, under the names by which
+        they were requested, as an LDAP server would return them, or as
+        given in the export when all attributes are requested
+        """
+        if attrs is None or "*" in attrs:
+            return {self._names[attr]: values for attr, values in payload.items()}
+
+        wanted = {attr.lower(): attr for attr in attrs if attr != _NO_ATTRS}
+        return {wanted[attr]: values for attr, values in payload.items() if attr in wanted}
+
+    async def search(self, base:str, scope:Scope, search:str = "(objectClass=*)", *,
+                     attrs:T.Optional[T.List[str]] = None,
+                     adaptor:T.Optional[T.Callable] = None) -> T.AsyncIterator[T.Any]:
+        """
+        Search the directory and return results asynchronously, as per
+        Server.search, yielding to the event loop every so often
+        """
+        adaptor = adaptor or identity
+        record = SearchRecord(base, scope, search)
+        record.connected = record.started
+
+        try:
+            entries = self._search(base, scope, parse(search))
+            record.searched = monotonic() - record.started
+
+            for n, entry in enumerate(entries, 1):
+                result = entry.dn, self._select(entry.payload, attrs)
+                record.result(result)
+                yield adaptor(result)
+
+                if n % _YIELD_EVERY == 0:
+                    await asyncio.sleep(0)
+
+        finally:
+            self._instrumentation.record(record)
@@ -0,0 +1,221 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from time import monotonic
+
+import ldap
+from ldap.ldapobject import LDAPObject
+
+from common import types as T
+from common.logging import Level, log
+
+
+__all__ = ["ConnectionPool", "PoolStatistics"]
+
+
+# Idle time (in seconds) after which a pooled connection is health
+# checked before it's reused
+_HEALTH_CHECK_AFTER = 60.0
+
+class _Connection(LDAPObject):
+    """ Pooled LDAP connection """
+    generation:int
+    last_used:float
+
+    def __init__(self, uri:str, generation:int) -> None:
+        super().__init__(uri)
+        self.generation = generation
+        self.last_used = monotonic()
+
+    def poll(self, msgid:int) -> T.Iterator[T.Optional[T.Tuple]]:
+        """
+        Generator of the search entry messages for the given message ID,
+        polled with a zero timeout, yielding None while nothing is ready
+        """
+        while True:
+            message = self.result3(msgid, all=0, timeout=0)
+            rtype, *_ = message
+
+            if rtype is None:
+                yield None
+
+            elif rtype == ldap.RES_SEARCH_ENTRY:
+                yield message
+
+            elif rtype == ldap.RES_SEARCH_RESULT:
+                return
+
+    def close(self) -> None:
+        """ Unbind the connection, ignoring any problems in doing so """
+        try:
+            self.unbind_s()
+
+        except ldap.LDAPError:
+            pass
+
+
+class PoolStatistics(T.NamedTuple):
+    """ Connection pool gauges """
+    size:int            # Maximum number of connections
+    connections:int     # Number of established connections
+    in_use:int          # Number of connections in use
+    waiting:int         # Number of callers waiting for a connection
+    waits:int           # Number of connections handed out
+    wait_time:float     # Total time (in seconds) spent waiting
+    max_wait_time:float # Longest time (in seconds) spent waiting
+
+
+class ConnectionPool(object):
+    """
+    Fixed-size pool of LDAP connections, which are established lazily
+    and health checked when they've been idle for a while. Connections
+    are discarded when the server goes away and replaced on demand.
+    """
+    _uri:str
+    _size:int
+    _slots:asyncio.Semaphore
+    _idle:T.Deque[_Connection]
+    _generation:int
+
+    _in_use:int
+    _waiting:int
+    _waits:int
+    _wait_time:float
+    _max_wait_time:float
+
+    def __init__(self, uri:str, size:int) -> None:
+        assert size > 0
+
+        self._uri = uri
+        self._size = size
+        self._slots = asyncio.Semaphore(size)
+        self._idle = deque()
+        self._generation = 0
+
+        self._in_use = 0
+        self._waiting = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait_time = 0.0
+
+    @property
+    def statistics(self) -> PoolStatistics:
+        return PoolStatistics(
+            size          = self._size,
+            connections   = len(self._idle) + self._in_use,
+            in_use        = self._in_use,
+            waiting       = self._waiting,
+            waits         = self._waits,
+            wait_time     = self._wait_time,
+            max_wait_time = self._max_wait_time)
+
+    @staticmethod
+    async def _close(connection:_Connection) -> None:
+        """ Close a connection, off the event loop """
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, connection.close)
+
+    async def _healthy(self, connection:_Connection) -> bool:
+        """ Check an idle connection is still alive, off the event loop """
+        if monotonic() - connection.last_used < _HEALTH_CHECK_AFTER:
+            return True
+
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(None, connection.whoami_s)
+            return True
+
+        except ldap.LDAPError:
+            log(f"Discarding unhealthy connection to {self._uri}", Level.Debug)
+            await self._close(connection)
+            return False
+
+    async def _acquire(self) -> _Connection:
+        """ Get an idle, healthy connection or establish a new one """
+        while self._idle:
+            connection = self._idle.pop()
+            if await self._healthy(connection):
+                return connection
+
+        log(f"Establishing new connection to {self._uri}", Level.Debug)
+        connection = _Connection(self._uri, self._generation)
+
+        # The connection is only made by its first operation, so that's
+        # done off the event loop
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, connection.whoami_s)
+        return connection
+
+    async def _release(self, connection:_Connection) -> None:
+        """ Return a connection to the pool, unless it's been invalidated """
+        if connection.generation != self._generation:
+            await self._close(connection)
+            return
+
+        connection.last_used = monotonic()
+        self._idle.append(connection)
+
+    async def invalidate(self) -> None:
+        """
+        Discard every idle connection and mark those in use to be
+        discarded upon release
+        """
+        log(f"Invalidating all connections to {self._uri}", Level.Debug)
+        self._generation += 1
+
+        idle, self._idle = self._idle, deque()
+        await asyncio.gather(*map(self._close, idle))
+
+    @asynccontextmanager
+    async def connection(self) -> T.AsyncIterator[_Connection]:
+        """ Context manager that lends out a connection from the pool """
+        started = monotonic()
+        self._waiting += 1
+
+        try:
+            await self._slots.acquire()
+
+        finally:
+            self._waiting -= 1
+
+        waited = monotonic() - started
+        self._waits += 1
+        self._wait_time += waited
+        self._max_wait_time = max(self._max_wait_time, waited)
+
+        try:
+            connection = await self._acquire()
+            self._in_use += 1
+
+            try:
+                yield connection
+
+            except ldap.SERVER_DOWN:
+                await self.invalidate()
+                raise
+
+            finally:
+                self._in_use -= 1
+                await self._release(connection)
+
+        finally:
+            self._slots.release()
@@ -17,56 +17,103 @@ You should have received a copy of the GNU Affero General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
+import asyncio
+from collections import deque
+from time import monotonic
+
 import ldap
 from ldap.filter import escape_filter_chars
-from ldap.ldapobject import LDAPObject
-from ldap.resiter import ResultProcessor
 
 from common import types as T
 from common.logging import Level, log
 from common.utils import identity
 from . import _types as ldapT
 from ._exceptions import *
+from ._instrumentation import DEFAULT_SLOW_THRESHOLD, SearchInstrumentation, SearchRecord
+from ._pool import ConnectionPool, PoolStatistics
 from ._scope import Scope
 
 
 _ResultT = T.Tuple[str, ldapT.Payload]  # DN: Payload
 
+# Bounds (in seconds) of the back-off between polls of pending results
+_POLL_MIN = 0.001
+_POLL_MAX = 0.05
+
 class _SearchResults(T.AsyncIterator[_ResultT]):
-    """ Asynchronous generator from LDAP search generator """
-    def __init__(self, results) -> None:
+    """
+    Asynchronous generator from LDAP search result messages, where a
+    message of None means that nothing is ready yet; we then yield to
+    the event loop, with back-off, rather than blocking it. The time
+    spent waiting for results is added to the search's record.
+    """
+    def __init__(self, results, record:SearchRecord) -> None:
         self._results = results
+        self._record = record
+        self._ready = deque()
+        self._poll = 0
 
     def __aiter__(self):
         return self
 
     async def __anext__(self) -> _ResultT:
         """ Iterate through generator """
+        started = monotonic()
+
         try:
-            _, [(dn, entry)], _, _ = next(self._results)
+            while not self._ready:
+                try:
+                    message = next(self._results)
+
+                except StopIteration:
+                    raise StopAsyncIteration
 
-        except StopIteration:
-            raise StopAsyncIteration
+                if message is None:
+                    await asyncio.sleep(self._poll)
+                    self._poll = min(max(self._poll * 2, _POLL_MIN), _POLL_MAX)
+                    continue
 
-        return dn, entry
+                _, data, _, _ = message
+                self._ready.extend(data)
+                self._poll = 0
+
+            return self._ready.popleft()
+
+        finally:
+            self._record.searched += monotonic() - started
 
 
 _AdaptedT = T.TypeVar("_AdaptedT")
 _AdaptorT = T.Callable[[_ResultT], _AdaptedT]
 
-class Server(LDAPObject, ResultProcessor):
-    """ LDAP connection object with asynchronous searching """
+# Default number of pooled connections to the LDAP server
+DEFAULT_POOL_SIZE = 4
+
+class Server(object):
+    """ Pooled LDAP connections with asynchronous searching """
     _server_uri:str
+    _pool:ConnectionPool
+
+    _instrumentation:SearchInstrumentation
 
-    def __init__(self, uri:str) -> None:
+    def __init__(self, uri:str, pool_size:int = DEFAULT_POOL_SIZE, slow_threshold:float = DEFAULT_SLOW_THRESHOLD) -> None:
         self._server_uri = uri
-        log(f"Connecting to LDAP server at {uri}", Level.Info)
-        super().__init__(uri)
+        log(f"Connecting to LDAP server at {uri}, with up to {pool_size} connections", Level.Info)
+        self._pool = ConnectionPool(uri, pool_size)
+        self._instrumentation = SearchInstrumentation(slow_threshold)
 
     @property
     def uri(self) -> str:
         return self._server_uri
 
+    @property
+    def pool(self) -> PoolStatistics:
+        return self._pool.statistics
+
+    @property
+    def instrumentation(self) -> SearchInstrumentation:
+        return self._instrumentation
+
     async def search(self, base:str, scope:Scope, search:str = "(objectClass=*)", *,
                      attrs:T.Optional[T.List[str]] = None,
                      adaptor:T.Optional[_AdaptorT] = None) -> T.AsyncIterator[_AdaptedT]:
@@ -79,14 +126,39 @@ class Server(LDAPObject, ResultProcessor):
         @kwarg   attrs    List of attributes; None for everything (default)
         @kwarg   adaptor  Function applied to each result; None for no adaption (default)
         @return  Asynchronous generator of (optionally adapted) search results
+
+        NOTE  The search's timings are recorded when it finishes; its
+              duration is only the time spent waiting for the LDAP
+              server, not the time the caller spends between results
         """
         adaptor = adaptor or identity
+        record = SearchRecord(base, scope, search)
 
         try:
-            msgid = super().search(base, scope.value, search, attrs)
-
-            async for result in _SearchResults(self.allresults(msgid)):
-                yield adaptor(result)
+            async with self._pool.connection() as connection:
+                record.connected = monotonic()
+                msgid = connection.search(base, scope.value, search, attrs)
+                record.searched += monotonic() - record.connected
+                complete = False
+
+                try:
+                    async for result in _SearchResults(connection.poll(msgid), record):
+                        record.result(result)
+                        yield adaptor(result)
+
+                    complete = True
+
+                finally:
+                    # Abandon the search (off the event loop) if we've
+                    # been stopped early, so the connection is clean when
+                    # it's returned
+                    if not complete:
+                        try:
+                            loop = asyncio.get_event_loop()
+                            await loop.run_in_executor(None, connection.abandon, msgid)
+
+                        except ldap.LDAPError:
+                            pass
 
         except ldap.NO_SUCH_OBJECT:
             log(f"No such DN {base}", Level.Error)
@@ -96,5 +168,8 @@ class Server(LDAPObject, ResultProcessor):
             log(f"Lost connection to {self.uri}", Level.Error)
             raise CannotConnect(f"Cannot connect to {self.uri}")
 
+        finally:
+            self._instrumentation.record(record)
+
 
 escape = escape_filter_chars
@@ -24,8 +24,8 @@ from urllib.parse import urlparse
 from common import time
 from common.logging import Level, log
 from . import httpd, __version__
-from .ldap import Server
-from .models import Registry
+from .ldap import Server, LDIFDirectory, InvalidLDIF, DEFAULT_POOL_SIZE, DEFAULT_SLOW_THRESHOLD
+from .models import Registry, InvalidSnapshot, read_snapshot
 
 
 if __name__ == "__main__":
@@ -35,14 +35,59 @@ if __name__ == "__main__":
         log("LDAP_URI environment variable is not defined", Level.Critical)
         sys.exit(1)
 
-    ldap = Server(os.environ["LDAP_URI"])
+    slow_threshold = float(os.environ.get("LDAP_SLOW_SEARCH", DEFAULT_SLOW_THRESHOLD))
+
+    # Serve from an LDIF export, rather than a live LDAP server, if given;
+    # the export is loaded once, here, and shared by every process
+    ldap_uri = urlparse(os.environ["LDAP_URI"])
+    if ldap_uri.scheme == "file":
+        try:
+            directory = LDIFDirectory(ldap_uri.path, slow_threshold=slow_threshold)
+
+        except (InvalidLDIF, OSError) as e:
+            log(f"Could not load LDIF export: {e}", Level.Critical)
+            sys.exit(1)
+
+        connect = lambda: directory
+
+    else:
+        pool_size = int(os.environ.get("LDAP_POOL_SIZE", DEFAULT_POOL_SIZE))
+        connect = lambda: Server(os.environ["LDAP_URI"], pool_size, slow_threshold)
 
     expiry = time.delta(seconds=int(os.environ.get("EXPIRY", 3600)))
-    registry = Registry(ldap, expiry)
+    miss_expiry = time.delta(seconds=int(os.environ.get("MISS_EXPIRY", 60)))
+    photo_budget = int(os.environ.get("PHOTO_BUDGET", 32)) * 1024 * 1024
+    snapshot = os.environ.get("SNAPSHOT")
+
+    def build_registry() -> Registry:
+        """
+        Build the registry, with its own LDAP server connections, in the
+        process that will use them; warm started from the registry
+        snapshot, if there is one
+        """
+        registry = Registry(connect(), expiry, miss_expiry, photo_budget)
+
+        if snapshot and os.path.exists(snapshot):
+            try:
+                registry.restore(read_snapshot(snapshot))
+                log(f"Registry restored from snapshot {snapshot}", Level.Info)
+
+            except (InvalidSnapshot, OSError) as e:
+                log(f"Could not restore registry from snapshot: {e}", Level.Warning)
+
+        return registry
 
     api_uri = urlparse(os.environ.get("API_URI", "http://0.0.0.0:5000"))
     if not (api_uri.scheme == "http" and api_uri.hostname and api_uri.port):
         log("Invalid value for API_URI environment variable", Level.Critical)
         sys.exit(1)
 
-    httpd.start(api_uri.hostname, api_uri.port, registry)
+    store_budget = int(os.environ.get("STORE_BUDGET", 64)) * 1024 * 1024
+    compress_threshold = int(os.environ.get("COMPRESS_THRESHOLD", 1024))
+
+    workers = int(os.environ.get("WORKERS", 1))
+    if workers < 1:
+        log("Invalid value for WORKERS environment variable", Level.Critical)
+        sys.exit(1)
+
+    httpd.start(api_uri.hostname, api_uri.port, build_registry, store_budget, photo_budget, snapshot, compress_threshold, workers)
@@ -1,2 +1,3 @@
 from ._bases import NoMatches
 from ._humgen import Person, Group, Registry
+from ._snapshot import InvalidSnapshot, Snapshot, read as read_snapshot, write as write_snapshot
@@ -17,6 +17,8 @@ You should have received a copy of the GNU Affero General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
+import sys
+
 from api import ldap
 from common import types as T
 from common.utils import noop
@@ -25,15 +27,54 @@ from common.utils import noop
 _AttrAdaptorT = T.Callable
 
 class Attribute(object):
-    """ Attribute(s) adaptor interface for data munging """
+    """
+    Attribute(s) adaptor interface for data munging, declared on node
+    classes as a descriptor: the adapted value is decoded once, when the
+    node's payload is ingested, and is thereafter read back as is
+    """
     _attrs:T.Tuple[str, ...]
     _adaptor:_AttrAdaptorT
+    _name:T.Optional[str]
+    _index:T.Optional[int]
 
     def __init__(self, *attrs:str, adaptor:T.Optional[_AttrAdaptorT] = None) -> None:
         assert attrs # Need at least one
 
+        # Static methods aren't callable from within their class' body
+        # (i.e., where attributes are declared) prior to Python 3.10
+        if isinstance(adaptor, staticmethod):
+            adaptor = adaptor.__func__
+
         self._attrs = attrs
         self._adaptor = adaptor or noop
+        self._name = None
+        self._index = None
+
+    def __set_name__(self, owner:T.Type, name:str) -> None:
+        self._name = name
+
+    @property
+    def name(self) -> T.Optional[str]:
+        return self._name
+
+    @property
+    def index(self) -> T.Optional[int]:
+        """ Position of the decoded value in its node's values """
+        return self._index
+
+    @index.setter
+    def index(self, index:int) -> None:
+        self._index = index
+
+    def __get__(self, instance:T.Any, owner:T.Type) -> T.Any:
+        if instance is None:
+            return self
+
+        values = instance._values
+        if values is None:
+            raise ldap.PayloadNotFetched(f"Data for {instance.dn} has not been fetched!")
+
+        return values[self._index]
 
     def __call__(self, entity:ldap.Entity) -> T.Any:
         return self._adaptor(*map(entity.get, self._attrs))
@@ -41,3 +82,8 @@ class Attribute(object):
 # Basic adaptors to flatten/convert simple text attributes
 flatten = lambda x: x[0].decode()
 to_bool = lambda x: flatten(x).upper() in ["TRUE", "YES"]
+
+# Adaptors for values that are shared by many entries (e.g., job titles
+# and the DNs of group members), which are interned to be stored once
+interned = lambda x: sys.intern(flatten(x))
+to_dns = lambda x: tuple(sys.intern(dn.decode()) for dn in x or [])
@@ -17,59 +17,159 @@ You should have received a copy of the GNU Affero General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
-from abc import ABCMeta
+from abc import ABCMeta, abstractmethod
+from bisect import bisect_right
 from collections import defaultdict
+from functools import lru_cache, partial
 import asyncio
 import re
-import threading
+import sys
 
 from api import ldap
-from common import types as T, time
+from api.ldap import _types as ldapT
+from common import types as T, time, serialisation
+from common.cache import LRUCache
+from common.constants import MIMEType
 from common.logging import Level, log
+from common.metrics import Histogram
 from ._mixins import Expirable, Serialisable, Hypermedia
 from ._adaptors import Attribute
+from ._snapshot import InvalidSnapshot, NodeState, Snapshot
 
 
+@lru_cache(maxsize=None)
+def _rdn_pattern(rdn_attr:str, base_dn:str) -> T.Pattern:
+    """ Compiled pattern that matches the RDN value of a DN """
+    return re.compile(fr"(?<=^{rdn_attr}=).+(?=,{base_dn}$)")
+
+# Operational modification timestamp, fetched for incremental
+# synchronisation, and the special attribute list for no attributes
+_MODIFIED = "modifyTimestamp"
+_NO_ATTRS = ["1.1"]
+
+@lru_cache(maxsize=None)
+def _presence(present:T.FrozenSet[str]) -> T.FrozenSet[str]:
+    """ Shared presence set, as there are few distinct combinations """
+    return present
+
 class BaseNode(Expirable, Serialisable, Hypermedia, metaclass=ABCMeta):
     """ Base class for specific LDAP objects """
+    __slots__ = ("_identity", "_registry", "_values", "_modified", "_present", "_version")
+
     _rdn_attr:T.ClassVar[str]
     _base_dn:T.ClassVar[str]
     _object_classes:T.ClassVar[T.List[str]]
 
+    # Attributes to fetch (by default, all user attributes) and those
+    # for which we only record their presence, rather than their value
+    _attrs:T.ClassVar[T.List[str]] = ["*"]
+    _presence_attrs:T.ClassVar[T.List[str]] = []
+
+    # Attribute descriptors, in the order of their decoded values
+    _attributes:T.ClassVar[T.Tuple[Attribute, ...]] = ()
+
+    # Fields of the serialisable form, which can be requested selectively
+    _fields:T.ClassVar[T.Tuple[str, ...]] = ()
+
     _identity:str
-    _entity:ldap.Entity
-    _attr_map:T.Dict[str, Attribute]
+    _registry:"BaseRegistry"
+    _values:T.Optional[T.Tuple]
+    _modified:T.Optional[str]
+    _present:T.FrozenSet[str]
+    _version:int
+
+    def __init_subclass__(cls, **kwargs:T.Any) -> None:
+        super().__init_subclass__(**kwargs)
+
+        # Collect the attribute descriptors declared on the class and its
+        # ancestors, with the ancestors' first so their indices are stable
+        attributes:T.Dict[str, Attribute] = {}
+        for klass in reversed(cls.__mro__):
+            for name, value in vars(klass).items():
+                if isinstance(value, Attribute):
+                    attributes[name] = value
+
+        cls._attributes = tuple(attributes.values())
+        for index, attribute in enumerate(cls._attributes):
+            attribute.index = index
+
+    def __init__(self, identity:str, registry:"BaseRegistry") -> None:
+        super().__init__(registry.shelf_life)
+
+        self._identity = sys.intern(identity)
+        self._registry = registry
+        self._values = None
+        self._modified = None
+        self._present = _presence(frozenset())
+        self._version = 0
+
+    def ingest(self, payload:ldapT.Payload) -> None:
+        """
+        Decode the node's attributes from its LDAP payload, once, so the
+        payload itself needn't be retained
+        """
+        values = []
+        for attribute in self._attributes:
+            try:
+                values.append(attribute(payload))
 
-    _update_lock:asyncio.Lock
-    _reattach_lock:threading.Lock
+            except Exception as e:
+                log(f"Cannot decode {attribute.name} for {self.identity}: {e}", Level.Warning)
+                values.append(None)
 
-    def __init__(self, identity:str, server:ldap.Server, attr_map:T.Dict[str, Attribute], shelf_life:T.TimeDelta) -> None:
-        super().__init__(shelf_life)
+        self._values = tuple(values)
 
-        self._identity = identity
-        self._entity = ldap.Entity(self.dn)
-        self._entity.server = server
+        modified = payload.get(_MODIFIED)
+        self._modified = modified[0].decode() if modified else None
 
-        self._attr_map = attr_map
+    async def __updator__(self) -> None:
+        log(f"Updating {self.identity}", Level.Debug)
 
-        self._update_lock = asyncio.Lock()
-        self._reattach_lock = threading.Lock()
+        server = self._registry.server
+        exists = False
+        async for _, payload in server.search(self.dn, ldap.Scope.Base, attrs=self.fetch_attrs()):
+            exists = True
+            self.ingest(payload)
 
-    def __getattr__(self, attr:str) -> T.Any:
-        if attr not in self._attr_map:
-            raise AttributeError(f"No such attribute {attr}!")
+        if not exists:
+            raise ldap.NoSuchDistinguishedName(f"{self.dn} does not exist!")
 
-        return self._attr_map[attr](self._entity)
+        present = set()
+        for attr in self._presence_attrs:
+            async for _ in server.search(self.dn, ldap.Scope.Base, f"({attr}=*)", attrs=_NO_ATTRS):
+                present.add(attr)
 
-    async def __updator__(self) -> None:
-        async with self._update_lock:
-            log(f"Updating {self.identity}", Level.Debug)
-            await self._entity.fetch()
+        self._present = _presence(frozenset(present))
+        self._registry.index(self)
+
+    @abstractmethod
+    async def __serialisable__(self, fields:T.Optional[T.AbstractSet[str]] = None) -> T.Any:
+        """
+        Render a serialisable form of the node, restricted to the given
+        fields (or with every field, if None), without doing the work
+        for those that aren't wanted
+        """
+
+    async def render(self, media_type:MIMEType, fields:T.Optional[T.AbstractSet[str]] = None) -> bytes:
+        """
+        Return the serialisation of the given fields (or every field, if
+        None) in the given representation
+        """
+        return serialisation.encode(await self.__serialisable__(fields), media_type)
+
+    @classmethod
+    def fields(cls) -> T.Tuple[str, ...]:
+        return cls._fields
+
+    @classmethod
+    def fetch_attrs(cls) -> T.List[str]:
+        """ Attributes to fetch, including the modification timestamp """
+        return [*cls._attrs, _MODIFIED]
 
     @classmethod
     def extract_rdn(cls, dn:str) -> str:
         """ Extract the RDN from the DN """
-        search = re.search(fr"(?<=^{cls._rdn_attr}=).+(?=,{cls._base_dn}$)", dn)
+        search = _rdn_pattern(cls._rdn_attr, cls._base_dn).search(dn)
         if not search:
             raise ldap.NoSuchDistinguishedName(f"Cannot extract {cls.__name__} RDN from {dn}")
 
@@ -87,57 +187,161 @@ class BaseNode(Expirable, Serialisable, Hypermedia, metaclass=ABCMeta):
     def identity(self) -> str:
         return self._identity
 
-    def reattach_server(self, server:ldap.Server) -> None:
+    def has(self, attr:str) -> bool:
+        """ Whether an attribute, whose presence is recorded, is present """
+        return attr in self._present
+
+    @property
+    def modified(self) -> T.Optional[str]:
+        """ The node's LDAP modification timestamp, if known """
+        return self._modified
+
+    @property
+    def version(self) -> int:
+        """
+        Counter that increases whenever the node's data, or that of the
+        nodes it's rendered with, changes
+        """
+        return self._version
+
+    @property
+    def has_expired(self) -> bool:
         """
-        Reattach an LDAP server to the node's entity, in the event of
-        connection problems and forcibly expire the node
+        Has our entity expired? Nodes restored from a snapshot are valid
+        until the registry is next updated. Otherwise, a successful
+        synchronisation of the node's type would have fetched it, had it
+        changed, so the node is as fresh as that, if it's not been
+        updated since
         """
-        with self._reattach_lock:
-            log(f"Reattaching {self.identity} to {server.uri}", Level.Debug)
-            self._entity.server = server
+        if self._registry.restored:
+            return False
+
+        synced = self._registry.synced(type(self))
+        if synced is None or (self._last_updated is not None and self._last_updated >= synced):
+            return super().has_expired
+
+        return time.now() - synced > self._shelf_life
+
+
+def _conjunction(cls:T.Type[BaseNode], *terms:T.Optional[str]) -> str:
+    """
+    Build the conjunctive search term from the class' object classes
+    and the sanitised search terms, if provided
+    """
+    return "(&" \
+         + "".join(f"(objectClass={ldap.escape(oc)})" for oc in cls._object_classes) \
+         + "".join(term for term in terms if term) \
+         + ")"
+
+
+def _updated(nodes:T.List[BaseNode], updating:asyncio.Future) -> None:
+    """ Done callback that releases the nodes a batch was updating """
+    for node in nodes:
+        if node._updating is updating:
+            node._updating = None
 
 
 class NoMatches(BaseException):
     """ Raised when trying to seed the registry with no data """
 
+# Default shelf life and capacity of the record of recently missed DNs
+DEFAULT_MISS_LIFE = time.delta(minutes=1)
+_MISS_CAPACITY = 10000
+
+# Maximum number of nodes fetched by a single (disjunctive) search, to
+# keep its filter within the size that LDAP servers will accept
+_BATCH_SIZE = 100
+
 class BaseRegistry(Expirable, Serialisable, T.Container[BaseNode], metaclass=ABCMeta):
     """ Base container class for nodes """
+    _classes:T.ClassVar[T.List[T.Type[BaseNode]]]
+
     _server:ldap.Server
-    _registry:T.Dict[str, BaseNode]
+    _registry:T.DefaultDict[T.Type[BaseNode], T.Dict[str, BaseNode]]  # Class: {Identity: Node}
+    _high_water:T.Dict[T.Type[BaseNode], str]
+    _sorted:T.Dict[T.Type[BaseNode], T.List[str]]
+    _synced:T.Dict[T.Type[BaseNode], T.DateTime]
+    _restored:bool
+    _version:int
+    _versions:T.Dict[T.Type[BaseNode], int]
+
+    _misses:LRUCache[str, T.DateTime]  # DN: Expiry
+    _miss_life:T.TimeDelta
+    _seeding:T.Dict[str, asyncio.Future]
 
     _seed_lock:T.DefaultDict[T.Type[BaseNode], asyncio.Lock]
-    _reattach_lock:threading.Lock
 
-    def __init__(self, server:ldap.Server, shelf_life:T.TimeDelta) -> None:
+    seeds:Histogram
+
+    def __init__(self, server:ldap.Server, shelf_life:T.TimeDelta, miss_life:T.TimeDelta = DEFAULT_MISS_LIFE) -> None:
         self._server = server
-        self._registry = {}
+        self._registry = defaultdict(dict)
+        self._high_water = {}
+        self._sorted = {}
+        self._synced = {}
+        self._restored = False
+        self._version = 0
+        self._versions = {}
+
+        # Recently missed DNs, bounded by number rather than size
+        self._misses = LRUCache(_MISS_CAPACITY, sizeof=lambda _: 1)
+        self._miss_life = miss_life
+
+        # In-flight seeds for individual nodes, by DN
+        self._seeding = {}
 
         # Create seeding lock for the given class, if it doesn't exist.
         # We reasonably assume that the data fetched for each node class
         # is mutually exclusive.
         self._seed_lock = defaultdict(asyncio.Lock)
-        self._reattach_lock = threading.Lock()
+
+        self.seeds = Histogram("registry_seed_duration_seconds",
+                               "Time taken to seed the registry, by node class and whether it was for every node",
+                               ("class", "extent"))
 
         super().__init__(shelf_life)
 
-    def __contains__(self, dn:str) -> bool:
-        return dn in self._registry
+    def __contains__(self, node:BaseNode) -> bool:
+        return node.identity in self._registry[type(node)]
+
+    def count(self, cls:T.Type[BaseNode]) -> int:
+        """ Number of nodes of the specified type in the registry """
+        return len(self._registry[cls])
 
     @property
     def server(self) -> ldap.Server:
         return self._server
 
+    @property
+    def restored(self) -> bool:
+        """ Whether the registry was restored from a snapshot and not updated since """
+        return self._restored
+
+    async def _update(self) -> None:
+        await super()._update()
+
+        # Restored nodes expire as usual, once they've been refreshed
+        self._restored = False
+
+    def synced(self, cls:T.Type[BaseNode]) -> T.Optional[T.DateTime]:
+        """
+        When the last successful synchronisation of the nodes of the
+        specified type started, if there's been one
+        """
+        return self._synced.get(cls)
+
+    def version(self, cls:T.Type[BaseNode]) -> int:
+        """ Counter that increases whenever any node of the specified type changes """
+        return self._versions.get(cls, 0)
+
     @server.setter
     def server(self, server:ldap.Server) -> None:
         """
-        Reattach an LDAP server to every node, in the event of
-        connection problems and forcibly expire the registry
+        Reattach an LDAP server, in the event of connection problems;
+        nodes search through the registry's server, so follow suit
         """
-        with self._reattach_lock:
-            log(f"Reattaching all nodes to {server.uri}", Level.Debug)
-            self._server = server
-            for node in self._registry:
-                self._registry[node].reattach_server(server)
+        log(f"Reattaching all nodes to {server.uri}", Level.Debug)
+        self._server = server
 
     async def seed(self, cls:T.Type[BaseNode], search:T.Optional[str] = None) -> None:
         """
@@ -146,54 +350,365 @@ class BaseRegistry(Expirable, Serialisable, T.Container[BaseNode], metaclass=ABC
         to be hygienic; it's the caller's responsibility to ensure
         inputs are escaped to avoid injection attacks.
         """
-        def _adaptor(result) -> T.Tuple[str, BaseNode]:
-            dn, payload = result
-            identity = cls.extract_rdn(dn)
-            node = cls(identity, self)
-            node._entity._payload = payload
-            node._last_updated = time.now()
-            return dn, node
-
-        # Build the conjunctive search term from the class' object
-        # classes and the sanitised search term, if provided
-        conjunction = "(&" \
-                    + "".join(f"(objectClass={ldap.escape(oc)})" for oc in cls._object_classes) \
-                    + (search or "") \
-                    + ")"
-
-        found = False
+        conjunction = _conjunction(cls, search)
+
+        nodes = self._registry[cls]
+
+        # Nodes from the same search share their update time
+        updated = time.now()
+
+        async def _seed() -> T.List[str]:
+            seeded = []
+            async for dn, payload in self._server.search(cls._base_dn, ldap.Scope.OneLevel, conjunction, attrs=cls.fetch_attrs()):
+                # Update existing nodes in place, otherwise create them
+                identity = cls.extract_rdn(dn)
+                node = nodes.get(identity)
+                if node is None:
+                    node = nodes[identity] = cls(identity, self)
+
+                node.ingest(payload)
+                node._last_updated = updated
+                self.index(node)
+                self._misses.remove(dn)
+
+                # Track the most recent modification we've seen
+                modified = node.modified
+                if modified and modified > self._high_water.get(cls, ""):
+                    self._high_water[cls] = modified
+
+                seeded.append(identity)
+
+            return seeded
+
         log(f"Seeding registry with {cls.__name__} results from {conjunction}...", Level.Debug)
 
-        async with self._seed_lock[cls]:
-            async for dn, node in self._server.search(cls._base_dn, ldap.Scope.OneLevel, conjunction, adaptor=_adaptor):
-                self._registry[dn] = node
-                found = True
+        # Only seeding every node of a class is serialised; filtered
+        # seeds can proceed without waiting for a full reseed to finish
+        if search is None:
+            async with self._seed_lock[cls]:
+                with self.seeds.time(cls.__name__, "all"):
+                    seeded = await _seed()
 
-        if not found:
+        else:
+            with self.seeds.time(cls.__name__, "filtered"):
+                seeded = await _seed()
+
+        if not seeded:
             raise NoMatches(f"No matches found for {conjunction} under {cls._base_dn} to seed registry")
 
+        # Seeding every node finds those that no longer exist
+        if search is None:
+            self._prune(cls, set(seeded), updated)
+
+        if cls._presence_attrs:
+            await self._seed_presence(cls, search, seeded)
+
+        if search is None:
+            self._synced[cls] = updated
+
+    def _prune(self, cls:T.Type[BaseNode], seeded:T.Set[str], updated:T.DateTime) -> None:
+        """
+        Remove the nodes of the specified type that weren't seeded, unless
+        they've been seeded or updated since
+        """
+        nodes = self._registry[cls]
+        pruned = [
+            identity for identity, node in nodes.items()
+            if identity not in seeded and (node._last_updated is None or node._last_updated < updated)
+        ]
+
+        for identity in pruned:
+            self.unindex(nodes.pop(identity))
+
+        if pruned:
+            log(f"Pruned {len(pruned)} {cls.__name__} nodes that no longer exist", Level.Debug)
+
+    async def _seed_presence(self, cls:T.Type[BaseNode], search:T.Optional[str], seeded:T.List[str]) -> None:
+        """
+        Record the presence of attributes, without fetching their values,
+        for the nodes that were seeded by the given search term
+        """
+        nodes = self._registry[cls]
+        present = defaultdict(set)
+
+        for attr in cls._presence_attrs:
+            conjunction = _conjunction(cls, search, f"({attr}=*)")
+
+            async for dn, _ in self._server.search(cls._base_dn, ldap.Scope.OneLevel, conjunction, attrs=_NO_ATTRS):
+                present[cls.extract_rdn(dn)].add(attr)
+
+        for identity in seeded:
+            node = nodes[identity]
+            presence = _presence(frozenset(present[identity]))
+            if presence is not node._present:
+                node._present = presence
+                self.touch(node)
+
+    async def sync(self, cls:T.Type[BaseNode]) -> None:
+        """
+        Incrementally seed the registry with nodes of the specified type
+        that have been modified since the most recent modification we've
+        seen, falling back to a full seed when we haven't seen any. Note
+        that deleted entries cannot be detected this way.
+        """
+        high_water = self._high_water.get(cls)
+        if high_water is None:
+            await self.seed(cls)
+            return
+
+        started = time.now()
+
+        try:
+            await self.seed(cls, f"({_MODIFIED}>={ldap.escape(high_water)})")
+
+        except NoMatches:
+            log(f"No {cls.__name__} modifications since {high_water}", Level.Debug)
+
+        self._synced[cls] = started
+
     async def get(self, cls:T.Type[BaseNode], identity:str) -> BaseNode:
         """
         Get a node from the registry of the specified type, seeding the
         registry if the node doesn't exist, and updating it if necessary
         """
-        dn = cls.build_dn(identity)
-        if dn not in self._registry:
-            search = f"({cls._rdn_attr}={ldap.escape(identity)})"
-            await self.seed(cls, search)
+        nodes = self._registry[cls]
+        if identity not in nodes:
+            # Answer repeated misses from memory, until they expire
+            dn = cls.build_dn(identity)
+            expiry = self._misses.get(dn)
+            if expiry is not None and time.now() < expiry:
+                raise NoMatches(f"No matches found for {dn} (cached)")
+
+            # Concurrent callers all await the same, single seed
+            if dn not in self._seeding:
+                self._seeding[dn] = asyncio.ensure_future(self._seed_node(cls, identity))
+
+            # Shielded, so an abandoned caller won't cancel everyone's seed
+            await asyncio.shield(self._seeding[dn])
+
+        node = nodes.get(identity)
+        if node is None:
+            # The node was sought in a batch, in which it wasn't found
+            raise NoMatches(f"No matches found for {cls.build_dn(identity)}")
 
-        node = self._registry[dn]
         if node.has_expired:
             await node.update()
 
         return node
 
-    def keys(self, cls:T.Type[BaseNode]) -> T.Iterator[str]:
-        """ Generator of all nodes matching the specified type """
-        for k in self._registry:
-            try:
-                identity = cls.extract_rdn(k)
-                yield identity
+    async def get_many(self, cls:T.Type[BaseNode], identities:T.Iterable[str]) -> T.Dict[str, BaseNode]:
+        """
+        Get the nodes from the registry of the specified type, by their
+        identities, where those that need seeding or updating are fetched
+        in batches, with one search per batch rather than one per node;
+        nodes that cannot be found are omitted
+        """
+        nodes = self._registry[cls]
+        now = time.now()
+
+        # Deduplicated, in order
+        identities = list(dict.fromkeys(identities))
+
+        to_fetch:T.List[str] = []
+        in_flight:T.Set[asyncio.Future] = set()
+        for identity in identities:
+            node = nodes.get(identity)
+            if node is not None:
+                if node.has_expired:
+                    # Expired nodes already being updated are awaited
+                    if node._updating is not None:
+                        in_flight.add(node._updating)
+                    else:
+                        to_fetch.append(identity)
+
+                continue
+
+            dn = cls.build_dn(identity)
+            if dn in self._seeding:
+                in_flight.add(self._seeding[dn])
+                continue
+
+            expiry = self._misses.get(dn)
+            if expiry is None or now >= expiry:
+                to_fetch.append(identity)
+
+        for i in range(0, len(to_fetch), _BATCH_SIZE):
+            batch = to_fetch[i:i + _BATCH_SIZE]
+            seeding = asyncio.ensure_future(self._seed_batch(cls, batch))
+            in_flight.add(seeding)
+
+            # Concurrent callers for any of the batch's nodes await it,
+            # whether they're seeding new nodes or updating expired ones
+            expired = []
+            for identity in batch:
+                node = nodes.get(identity)
+                if node is None:
+                    self._seeding[cls.build_dn(identity)] = seeding
+                else:
+                    node._updating = seeding
+                    expired.append(node)
+
+            seeding.add_done_callback(partial(_updated, expired))
+
+        # Shielded, so an abandoned caller won't cancel everyone's seeds
+        results = await asyncio.gather(*map(asyncio.shield, in_flight), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException) and not isinstance(result, NoMatches):
+                raise result
+
+        return {identity: nodes[identity] for identity in identities if identity in nodes}
+
+    async def _seed_batch(self, cls:T.Type[BaseNode], identities:T.List[str]) -> None:
+        """
+        Seed (or update) a batch of nodes with a single disjunctive
+        search, removing expired nodes that it didn't find (i.e., that
+        no longer exist) and remembering those that are missing
+        """
+        search = "(|" + "".join(f"({cls._rdn_attr}={ldap.escape(identity)})" for identity in identities) + ")"
+        started = time.now()
+
+        try:
+            await self.seed(cls, search)
+
+        except NoMatches:
+            pass
+
+        finally:
+            for identity in identities:
+                self._seeding.pop(cls.build_dn(identity), None)
+
+        nodes = self._registry[cls]
+        expiry = time.now() + self._miss_life
+        for identity in identities:
+            # Unless it's been seeded or updated since we started
+            node = nodes.get(identity)
+            if node is not None and (node._last_updated is None or node._last_updated < started):
+                self.unindex(nodes.pop(identity))
+                node = None
+
+            if node is None:
+                self._misses.put(cls.build_dn(identity), expiry)
+
+    async def _seed_node(self, cls:T.Type[BaseNode], identity:str) -> None:
+        """ Seed an individual node, remembering if it's missing """
+        dn = cls.build_dn(identity)
+
+        try:
+            search = f"({cls._rdn_attr}={ldap.escape(identity)})"
+            await self.seed(cls, search)
+
+        except NoMatches:
+            self._misses.put(dn, time.now() + self._miss_life)
+            raise
+
+        finally:
+            del self._seeding[dn]
+
+    def touch(self, node:BaseNode) -> None:
+        """ Note that the node's rendered data has changed """
+        self._version += 1
+        node._version = self._version
+
+    def index(self, node:BaseNode) -> None:
+        """
+        Maintain any secondary indices over the registry whenever a node
+        is seeded or updated; by default, there are none, besides the
+        versions of the node and its type
+        """
+        self.touch(node)
+        self._versions[type(node)] = self._version
+
+    def unindex(self, node:BaseNode) -> None:
+        """
+        Maintain any secondary indices over the registry whenever a node
+        is removed; by default, there are none, besides the sorted
+        identities and the version of the node's type
+        """
+        cls = type(node)
+        self._sorted.pop(cls, None)
+        self._version += 1
+        self._versions[cls] = self._version
+
+    def dump(self) -> Snapshot:
+        """
+        Take a snapshot of the registry; this is cheap, as nodes' values
+        are replaced rather than modified, so they needn't be copied
+        """
+        return Snapshot(
+            last_updated = self._last_updated,
+            high_water   = {cls.__name__: mark for cls, mark in self._high_water.items()},
+            nodes        = {
+                cls.__name__: [
+                    NodeState(
+                        identity     = identity,
+                        values       = dict(zip((a.name for a in cls._attributes), node._values or ())),
+                        modified     = node._modified,
+                        present      = node._present,
+                        last_updated = node._last_updated)
+                    for identity, node in self._registry[cls].items()
+                    if node._values is not None
+                ]
+                for cls in self._classes
+            })
+
+    def restore(self, snapshot:Snapshot) -> None:
+        """
+        Restore the registry's nodes from a snapshot, which are valid
+        until the registry is next updated; nodes that aren't in the
+        snapshot are removed
+        """
+        for cls in self._classes:
+            nodes = self._registry[cls]
+            restored = set()
+
+            for state in snapshot.nodes.get(cls.__name__, []):
+                try:
+                    values = tuple(state.values[attribute.name] for attribute in cls._attributes)
+
+                except KeyError as e:
+                    raise InvalidSnapshot(f"Snapshot has no {e} attribute for {cls.__name__} {state.identity}")
+
+                node = nodes[state.identity] = cls(state.identity, self)
+                node._values = values
+                node._modified = state.modified
+                node._present = _presence(state.present)
+                node._last_updated = state.last_updated
+                self.index(node)
+                restored.add(state.identity)
+
+            for identity in set(nodes) - restored:
+                self.unindex(nodes.pop(identity))
+
+            if cls.__name__ in snapshot.high_water:
+                self._high_water[cls] = snapshot.high_water[cls.__name__]
+
+        # However old the snapshot, it's served without updating its
+        # nodes until the registry is next updated
+        self._last_updated = snapshot.last_updated
+        self._restored = True
+
+    def _sorted_keys(self, cls:T.Type[BaseNode]) -> T.List[str]:
+        """ Sorted identities of every node of the specified type """
+        nodes = self._registry[cls]
+        keys = self._sorted.get(cls)
+
+        # Removing nodes discards their sorted identities, otherwise nodes
+        # are only ever added, so the number of nodes changes exactly
+        # when their identities do
+        if keys is None or len(keys) != len(nodes):
+            keys = self._sorted[cls] = sorted(nodes)
+
+        return keys
+
+    def keys(self, cls:T.Type[BaseNode], *, after:T.Optional[str] = None, limit:T.Optional[int] = None) -> T.Iterator[str]:
+        """
+        Generator of all nodes matching the specified type, in a stable
+        (sorted) order, optionally starting after the given identity and
+        limited in number
+        """
+        keys = self._sorted_keys(cls)
+        start = 0 if after is None else bisect_right(keys, after)
+        stop = None if limit is None else start + limit
 
-            except ldap.NoSuchDistinguishedName:
-                pass
+        # Iterate over a copy, as the registry may change in the meantime
+        yield from keys[start:stop]
@@ -17,25 +17,35 @@ You should have received a copy of the GNU Affero General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
+from collections import defaultdict
+
 from api import ldap
 from common import types as T
+from common.cache import LRUCache
 from common.logging import Level, log
 from common.utils import maybe
-from ._adaptors import Attribute, flatten, to_bool
-from ._bases import BaseNode, BaseRegistry, NoMatches
+from ._adaptors import Attribute, flatten, to_bool, interned, to_dns
+from ._bases import BaseNode, BaseRegistry, DEFAULT_MISS_LIFE
 from ._mixins import Hypermedia
 
 
 class Person(BaseNode):
     """ High level LDAP person model """
+    __slots__ = ()
+
     _rdn_attr = "uid"
     _base_dn = "ou=people,dc=sanger,dc=ac,dc=uk"
     _object_classes = ["posixAccount"]
 
+    # Photos are only fetched on demand, so we just note their presence
+    _attrs = ["uid", "cn", "mail", "title", "sangerAgressoCurrentPerson", "sangerActiveAccount"]
+    _presence_attrs = ["jpegPhoto"]
+
     _base_uri = "/people"
     _relation = "person"
+    _fields = ("id", "last_updated", "name", "mail", "title", "human", "active", "photo", "involvement")
 
-    _registry:BaseRegistry
+    _registry:"Registry"
 
     @staticmethod
     def decode_photo(jpegPhoto) -> T.Optional[bytes]:
@@ -55,28 +65,49 @@ class Person(BaseNode):
         """ Adaptor to determine the active status of a given entry """
         return maybe(to_bool)(sangerAgressoCurrentPerson) or maybe(to_bool)(sangerActiveAccount)
 
-    def __init__(self, uid:str, registry:BaseRegistry) -> None:
-        attr_map = {
-            "id":     Attribute("uid", adaptor=flatten),
-            "name":   Attribute("cn", adaptor=flatten),
-            "mail":   Attribute("mail", adaptor=flatten),
-            "title":  Attribute("title", adaptor=maybe(flatten)),
-            "photo":  Attribute("jpegPhoto", adaptor=Person.decode_photo),
-            "human":  Attribute("sangerAgressoCurrentPerson", adaptor=Person.is_human),
-            "active": Attribute("sangerAgressoCurrentPerson", "sangerActiveAccount", adaptor=Person.is_active)
-        }
+    id     = Attribute("uid", adaptor=interned)
+    name   = Attribute("cn", adaptor=flatten)
+    mail   = Attribute("mail", adaptor=flatten)
+    title  = Attribute("title", adaptor=maybe(interned))
+    human  = Attribute("sangerAgressoCurrentPerson", adaptor=is_human)
+    active = Attribute("sangerAgressoCurrentPerson", "sangerActiveAccount", adaptor=is_active)
 
-        self._registry = registry
-        super().__init__(uid, registry.server, attr_map, registry.shelf_life)
+    @property
+    def has_photo(self) -> bool:
+        return self.has("jpegPhoto")
+
+    async def get_photo(self) -> T.Optional[bytes]:
+        """
+        Get the person's photo, if they have one, from the registry's
+        photo cache or, failing that, from the LDAP server
+        """
+        if not self.has_photo:
+            return None
+
+        # The modification timestamp distinguishes changed photos
+        key = (self.identity, self.modified)
+        photo = self._registry.photos.get(key)
+
+        if photo is None:
+            log(f"Fetching photo for {self.identity}", Level.Debug)
+            async for _, payload in self._registry.server.search(self.dn, ldap.Scope.Base, attrs=["jpegPhoto"]):
+                photo = Person.decode_photo(payload.get("jpegPhoto"))
+
+            if photo is not None:
+                self._registry.photos.put(key, photo)
+
+        return photo
+
+    async def __serialisable__(self, fields:T.Optional[T.AbstractSet[str]] = None) -> T.Any:
+        wanted = lambda field: fields is None or field in fields
 
-    async def __serialisable__(self) -> T.Any:
         attrs = ["last_updated", "name", "mail", "title", "human", "active"]
-        output = {attr: getattr(self, attr) for attr in attrs}
+        output = {attr: getattr(self, attr) for attr in attrs if wanted(attr)}
 
         output["id"] = Person.href(self, rel="self", value=self.id)
 
         # Link to photo, if it exists
-        if self.photo is not None:
+        if wanted("photo") and self.has_photo:
             class _Photo(Hypermedia):
                 """ Dummy photo hypermedia entity """
                 _base_uri = f"{self._base_uri}/{self._identity}"
@@ -87,152 +118,290 @@ class Person(BaseNode):
 
             output["photo"] = Person.href(_Photo(), rel="photo")
 
-        # Group involvement
-        involvement = []
-        for gid in self._registry.keys(Group):
-            group = await self._registry.get(Group, gid)
-
-            if await group.is_pi(self):
-                involvement.append(Group.href(group, rev="pi", value=group.name))
+        # Group involvement, from the registry's reverse index (copied, as
+        # getting a group may update it and thus reindex it)
+        if wanted("involvement"):
+            involvement = []
+            memberships = list(self._registry.involvement(self).items())
+            groups = await self._registry.get_many(Group, (gid for gid, _ in memberships))
+            for gid, capacities in memberships:
+                group = groups.get(gid)
+                if group is None:
+                    continue
 
-            if await group.is_owner(self):
-                involvement.append(Group.href(group, rev="owner", value=group.name))
+                for capacity in Group.capacities:
+                    if capacity in capacities:
+                        involvement.append(Group.href(group, rev=capacity, value=group.name))
 
-            if await group.is_member(self):
-                involvement.append(Group.href(group, rev="member", value=group.name))
-
-        output["involvement"] = involvement
+            output["involvement"] = involvement
 
         return output
 
 
 class Group(BaseNode):
     """ High level LDAP Human Genetics Programme group model """
+    __slots__ = ()
+
     _rdn_attr = "cn"
     _base_dn = "ou=group,dc=sanger,dc=ac,dc=uk"
     _object_classes = ["posixGroup", "sangerHumgenProjectGroup"]
 
     _base_uri = "/groups"
     _relation = "group"
+    _fields = ("id", "last_updated", "active", "description", "prelims", "pi", "owners", "members")
 
-    _registry:BaseRegistry
+    # Capacities in which people can be involved in a group, mapped to
+    # the LDAP attributes that enumerate them
+    capacities:T.ClassVar[T.Dict[str, str]] = {
+        "pi":     "sangerProjectPI",
+        "owner":  "owner",
+        "member": "member"
+    }
 
-    def get_people(self, dns) -> T.Coroutine:
-        """ Adaptor to resolve a list of Person DNs """
-        async def _resolver():
-            for dn in map(lambda x: x.decode(), dns or []):
-                try:
-                    rdn = Person.extract_rdn(dn)
-                    yield await self._registry.get(Person, rdn)
+    _registry:"Registry"
 
-                except ldap.NoSuchDistinguishedName:
-                    # Invalid Person DN in group LDAP record
-                    log(f"Group {self._identity} refers to an invalid person, with DN \"{dn}\"; please correct {self.dn}", Level.Warning)
+    async def get_people(self, dns:T.Iterable[str]) -> T.AsyncIterator[Person]:
+        """
+        Resolve a list of Person DNs, where any people that need seeding
+        or updating are fetched together, in batches
+        """
+        rdns = {}
+        for dn in dns:
+            try:
+                rdns[dn] = Person.extract_rdn(dn)
+
+            except ldap.NoSuchDistinguishedName:
+                # Invalid Person DN in group LDAP record
+                log(f"Group {self._identity} refers to an invalid person, with DN \"{dn}\"; please correct {self.dn}", Level.Warning)
 
-                except NoMatches:
-                    # No matching Person found
-                    log(f"Group {self._identity} refers to an irresolvable person, with ID \"{rdn}\"; please correct {self.dn}", Level.Warning)
+        people = await self._registry.get_many(Person, rdns.values())
 
-        return _resolver
+        for rdn in rdns.values():
+            person = people.get(rdn)
+            if person is None:
+                # No matching Person found
+                log(f"Group {self._identity} refers to an irresolvable person, with ID \"{rdn}\"; please correct {self.dn}", Level.Warning)
+                continue
 
-    def get_person(self, dn) -> T.Coroutine:
-        """ Adaptor to resolve a single Person, if there is one """
-        async def _resolver():
-            if dn is None:
-                return None
+            yield person
 
-            assert len(dn) == 1
-            async for person in self.get_people(dn)():
-                return person
+    async def get_person(self, dns:T.Sequence[str]) -> T.Optional[Person]:
+        """ Resolve a single Person, if there is one """
+        if not dns:
+            return None
+
+        assert len(dns) == 1
+        async for person in self.get_people(dns):
+            return person
 
-        return _resolver
+        return None
 
     @staticmethod
     def decode_prelims(sangerPrelimID) -> T.List[str]:
         """ Adaptor to decode the list of Prelim IDs """
         return [prelim.decode() for prelim in sangerPrelimID or []]
 
-    def __init__(self, cn:str, registry:BaseRegistry) -> None:
-        attr_map = {
-            "name":        Attribute("cn", adaptor=flatten),
-            "active":      Attribute("sangerHumgenProjectActive", adaptor=to_bool),
-            "pi":          Attribute("sangerProjectPI", adaptor=self.get_person),
-            "owners":      Attribute("owner", adaptor=self.get_people),
-            "members":     Attribute("member", adaptor=self.get_people),
-            "description": Attribute("description", adaptor=maybe(flatten)),
-            "prelims":     Attribute("sangerPrelimID", adaptor=Group.decode_prelims)
-            # sangerHumgenDataSecurityLevel
-            # sangerHumgenProjectStorageResources
-            # sangerHumgenProjectStorageQuotas
-        }
+    name        = Attribute("cn", adaptor=flatten)
+    active      = Attribute("sangerHumgenProjectActive", adaptor=to_bool)
+    description = Attribute("description", adaptor=maybe(flatten))
+    prelims     = Attribute("sangerPrelimID", adaptor=decode_prelims)
+    # sangerHumgenDataSecurityLevel
+    # sangerHumgenProjectStorageResources
+    # sangerHumgenProjectStorageQuotas
 
-        self._registry = registry
-        super().__init__(cn, registry.server, attr_map, registry.shelf_life)
+    # The DNs of the people involved in the group, by capacity (named
+    # after it), which are only resolved on demand
+    _pi         = Attribute(capacities["pi"], adaptor=to_dns)
+    _owner      = Attribute(capacities["owner"], adaptor=to_dns)
+    _member     = Attribute(capacities["member"], adaptor=to_dns)
+
+    async def pi(self) -> T.Optional[Person]:
+        return await self.get_person(self._pi)
+
+    def owners(self) -> T.AsyncIterator[Person]:
+        return self.get_people(self._owner)
+
+    def members(self) -> T.AsyncIterator[Person]:
+        return self.get_people(self._member)
+
+    async def __serialisable__(self, fields:T.Optional[T.AbstractSet[str]] = None) -> T.Any:
+        wanted = lambda field: fields is None or field in fields
 
-    async def __serialisable__(self) -> T.Any:
         attrs = ["last_updated", "active", "description", "prelims"]
-        output = {attr: getattr(self, attr) for attr in attrs}
+        output = {attr: getattr(self, attr) for attr in attrs if wanted(attr)}
 
         output["id"] = Group.href(self, rel="self", value=self.name)
 
-        pi = await self.pi()
-        output["pi"] = Person.href(pi, rel="pi", value=pi.name)
+        # People are only resolved for the capacities that are wanted
+        if wanted("pi"):
+            pi = await self.pi()
+            output["pi"] = Person.href(pi, rel="pi", value=pi.name)
+
+        if wanted("owners"):
+            owners = []
+            async for owner in self.owners():
+                owners.append(Person.href(owner, rel="owner", value=owner.name))
 
-        owners = []
-        async for owner in self.owners():
-            owners.append(Person.href(owner, rel="owner", value=owner.name))
+            output["owners"] = owners
 
-        members = []
-        async for member in self.members():
-            members.append(Person.href(member, rel="member", value=member.name))
+        if wanted("members"):
+            members = []
+            async for member in self.members():
+                members.append(Person.href(member, rel="member", value=member.name))
 
-        output["owners"] = owners
-        output["members"] = members
+            output["members"] = members
 
         return output
 
-    async def _is_involved(self, who:Person, capacity:str) -> bool:
-        """ Check a Person's involvement in a group """
-        if capacity == "pi":
-            pi = await self.pi()
-            return who == pi
+    @property
+    def roster(self) -> T.Dict[str, T.FrozenSet[str]]:
+        """
+        The identities of the people involved in the group, by capacity,
+        taken straight from the group's DNs without resolving them
+        """
+        roster = {}
+        for capacity in Group.capacities:
+            people = set()
+            for dn in getattr(self, f"_{capacity}"):
+                try:
+                    people.add(Person.extract_rdn(dn))
+
+                except ldap.NoSuchDistinguishedName:
+                    # Invalid Person DN; this is logged when resolved
+                    pass
 
-        if hasattr(self, capacity):
-            async for user in getattr(self, capacity)():
-                if who == user:
-                    return True
+            roster[capacity] = frozenset(people)
 
-            return False
+        return roster
+
+    async def _is_involved(self, who:Person, capacity:str) -> bool:
+        """ Check a Person's involvement in a group """
+        return capacity in self._registry.involvement(who).get(self.identity, ())
 
     async def is_pi(self, who:Person) -> bool:
         return await self._is_involved(who, "pi")
 
     async def is_owner(self, who:Person) -> bool:
-        return await self._is_involved(who, "owners")
+        return await self._is_involved(who, "owner")
 
     async def is_member(self, who:Person) -> bool:
-        return await self._is_involved(who, "members")
+        return await self._is_involved(who, "member")
 
 
+# Number of incremental synchronisations between full reseeds, which are
+# needed to prune entries that no longer match (e.g., are deleted)
+_FULL_SYNC_EVERY = 24
+
+# Default photo cache budget, in bytes
+DEFAULT_PHOTO_BUDGET = 32 * 1024 * 1024
+
+_RosterT = T.Dict[str, T.FrozenSet[str]]          # Capacity: Person identities
+_InvolvementT = T.Dict[str, T.Set[str]]           # Group identity: Capacities
+
 class Registry(BaseRegistry):
     """ Human Genetics Programme registry """
+    _classes = [Person, Group]
+
+    _rosters:T.Dict[str, _RosterT]                    # Group identity: Roster
+    _involvement:T.DefaultDict[str, _InvolvementT]    # Person identity: Involvement
+    _syncs:int
+    _photos:LRUCache[T.Tuple[str, T.Optional[str]], bytes]  # (Person identity, Modified): Photo
+
+    def __init__(self, server:ldap.Server, shelf_life:T.TimeDelta, miss_life:T.TimeDelta = DEFAULT_MISS_LIFE, photo_budget:int = DEFAULT_PHOTO_BUDGET) -> None:
+        self._rosters = {}
+        self._involvement = defaultdict(dict)
+        self._syncs = 0
+        self._photos = LRUCache(photo_budget)
+        super().__init__(server, shelf_life, miss_life)
+
+    @property
+    def photos(self) -> LRUCache[T.Tuple[str, T.Optional[str]], bytes]:
+        return self._photos
+
     async def __updator__(self) -> None:
         """
-        (Re)seed the registry with groups from the Human Genetics
-        Programme and all user accounts
+        Synchronise the registry with groups from the Human Genetics
+        Programme and all user accounts, with only those modified since
+        the last synchronisation being fetched, except periodically,
+        when everything is reseeded
         """
-        log("Updating registry", Level.Debug)
-        for cls in Person, Group:
-            await self.seed(cls)
+        full = self._syncs >= _FULL_SYNC_EVERY
+        log(f"Updating registry ({'full' if full else 'incremental'})", Level.Debug)
+
+        for cls in self._classes:
+            await (self.seed(cls) if full else self.sync(cls))
+
+        self._syncs = 0 if full else self._syncs + 1
+
+    def _touch_all(self, cls:T.Type[BaseNode], identities:T.Iterable[str]) -> None:
+        """ Note that the rendered data of the given nodes, if any, has changed """
+        nodes = self._registry[cls]
+        for identity in identities:
+            node = nodes.get(identity)
+            if node is not None:
+                self.touch(node)
+
+    def index(self, node:BaseNode) -> None:
+        """
+        Maintain the reverse index of people's group involvement, noting
+        that the groups in which a person is involved are rendered with
+        their name, and the people involved in a group with its roster
+        """
+        super().index(node)
+        if not isinstance(node, Group):
+            self._touch_all(Group, self.involvement(node))
+            return
+
+        gid = node.identity
+
+        # Remove the group's previous roster from the index...
+        involved = self._unroster(gid)
+
+        # ...and then add its current one
+        roster = self._rosters[gid] = node.roster
+        for capacity, people in roster.items():
+            involved.update(people)
+            for pid in people:
+                self._involvement[pid].setdefault(gid, set()).add(capacity)
+
+        self._touch_all(Person, involved)
+
+    def _unroster(self, gid:str) -> T.Set[str]:
+        """ Remove a group's roster from the index, returning the people involved """
+        involved = set()
+        for people in self._rosters.pop(gid, {}).values():
+            involved.update(people)
+            for pid in people:
+                self._involvement[pid].pop(gid, None)
+                if not self._involvement[pid]:
+                    del self._involvement[pid]
+
+        return involved
+
+    def unindex(self, node:BaseNode) -> None:
+        """ Remove a group's roster from the reverse index of people's group involvement """
+        super().unindex(node)
+        if not isinstance(node, Group):
+            self._touch_all(Group, self.involvement(node))
+            return
+
+        self._touch_all(Person, self._unroster(node.identity))
+
+    def involvement(self, person:Person) -> _InvolvementT:
+        """ The groups in which a person is involved, with their capacities """
+        return self._involvement.get(person.identity, {})
+
+    async def links(self, cls:T.Type[BaseNode], identities:T.Iterable[str]) -> T.List:
+        """ List of hypermedia entities of a specific type, by identity """
+        entities = await self.get_many(cls, identities)
+        return [
+            cls.href(entity, rel=cls._relation, value=entity.name)
+            for entity in entities.values()
+        ]
 
     async def all_links(self, cls:T.Type[BaseNode]) -> T.List:
         """ List of hypermedia entities of a specific type """
-        entities = []
-        for identity in self.keys(cls):
-            entity = await self.get(cls, identity)
-            entities.append(cls.href(entity, rel=cls._relation, value=entity.name))
-
-        return entities
+        return await self.links(cls, self.keys(cls))
 
     async def __serialisable__(self) -> T.Any:
         return {
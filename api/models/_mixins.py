@@ -18,18 +18,23 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
 from abc import ABCMeta, abstractmethod
+import asyncio
 
 from common import types as T, time, json
 
 
 class Expirable(metaclass=ABCMeta):
     """ Base class for items that ought to be periodically updated """
+    __slots__ = ("_last_updated", "_shelf_life", "_updating")
+
     _last_updated:T.Optional[T.DateTime]
     _shelf_life:T.TimeDelta
+    _updating:T.Optional[asyncio.Future]
 
     def __init__(self, shelf_life:T.TimeDelta) -> None:
         self._last_updated = None
         self._shelf_life = shelf_life
+        self._updating = None
 
     @abstractmethod
     async def __updator__(self) -> None:
@@ -52,13 +57,30 @@ class Expirable(metaclass=ABCMeta):
     def last_updated(self) -> T.Optional[T.DateTime]:
         return self._last_updated
 
+    async def _update(self) -> None:
+        try:
+            await self.__updator__()
+            self._last_updated = time.now()
+
+        finally:
+            self._updating = None
+
     async def update(self) -> None:
-        await self.__updator__()
-        self._last_updated = time.now()
+        """
+        Update the object's state, where concurrent callers all await
+        the same, single update rather than each running their own
+        """
+        if self._updating is None:
+            self._updating = asyncio.ensure_future(self._update())
+
+        # Shielded, so an abandoned caller won't cancel everyone's update
+        await asyncio.shield(self._updating)
 
 
 class Serialisable(metaclass=ABCMeta):
     """ Base class for JSON-serialisable objects """
+    __slots__ = ()
+
     @property
     async def json(self) -> bytes:
         """ Return the JSON serialisation of the object's serialisable form """
@@ -72,6 +94,8 @@ class Serialisable(metaclass=ABCMeta):
 
 class Hypermedia(metaclass=ABCMeta):
     """ Base class for hypermedia references """
+    __slots__ = ()
+
     _base_uri:T.ClassVar[str]
     _relation:T.ClassVar[str]  # FIXME? This is effectively the class'
                                # relation to some "root", which doesn't
@@ -0,0 +1,78 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import pickle
+import zlib
+
+from common import types as T
+
+
+__all__ = ["InvalidSnapshot", "NodeState", "Snapshot", "read", "write"]
+
+
+# Snapshot format version, to be bumped whenever it changes
+_FORMAT = 2
+
+class InvalidSnapshot(BaseException):
+    """ Raised when a snapshot cannot be read """
+
+class NodeState(T.NamedTuple):
+    """ Everything needed to recreate a node, with values by attribute """
+    identity:str
+    values:T.Dict[str, T.Any]
+    modified:T.Optional[str]
+    present:T.FrozenSet[str]
+    last_updated:T.Optional[T.DateTime]
+
+class Snapshot(T.NamedTuple):
+    """ Everything needed to recreate a registry, by node class name """
+    last_updated:T.Optional[T.DateTime]
+    high_water:T.Dict[str, str]
+    nodes:T.Dict[str, T.List[NodeState]]
+
+
+def write(snapshot:Snapshot, path:str) -> None:
+    """
+    Write a compressed snapshot to disk, atomically, so readers never
+    see a partially written file
+    """
+    data = zlib.compress(pickle.dumps((_FORMAT, snapshot), pickle.HIGHEST_PROTOCOL))
+
+    partial = f"{path}.partial"
+    with open(partial, "wb") as f:
+        f.write(data)
+
+    os.replace(partial, path)
+
+def read(path:str) -> Snapshot:
+    """ Read a compressed snapshot from disk """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    try:
+        version, snapshot = pickle.loads(zlib.decompress(data))
+
+    except Exception as e:
+        raise InvalidSnapshot(f"Cannot read snapshot {path}: {e}")
+
+    if version != _FORMAT:
+        raise InvalidSnapshot(f"Snapshot {path} is in format {version}, rather than {_FORMAT}")
+
+    return snapshot
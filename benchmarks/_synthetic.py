@@ -0,0 +1,147 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import random
+import re
+
+from api.ldap import NoSuchDistinguishedName, Scope
+from api.models import Person, Group
+from common import types as T
+
+
+__all__ = ["SyntheticServer"]
+
+
+# Job titles are drawn from a small pool, as they are in practice
+_TITLES = [f"Job Title {i}".encode() for i in range(50)]
+
+# Group membership follows a long tail: most groups are small, but a few
+# have hundreds of members
+_MEMBERS_SHAPE = 1.2
+_MEMBERS_SCALE = 5
+_MEMBERS_MAX = 500
+
+_RE_EQUALITY = re.compile(r"\((uid|cn)=([^)*]+)\)")
+_RE_MODIFIED = re.compile(r"\(modifyTimestamp>=([^)]+)\)")
+_RE_INDEX = re.compile(r"^(?:user|group)(\d+)$")
+
+_ResultT = T.Tuple[str, T.Dict[str, T.List[bytes]]]
+
+class SyntheticServer(object):
+    """
+    LDAP server stand-in with a synthetic directory of people and,
+    optionally, groups with randomly (but reproducibly) drawn rosters,
+    which honours the searches made by the registry
+    """
+    uri = "ldap://synthetic"
+
+    def __init__(self, people:int, groups:int = 0, seed:int = 0) -> None:
+        self.people = people
+        self.groups = groups
+
+        # Rosters, as indices of people, by group index
+        rng = random.Random(seed)
+        self._rosters = []
+        for _ in range(groups):
+            members = min(int(rng.paretovariate(_MEMBERS_SHAPE) * _MEMBERS_SCALE), _MEMBERS_MAX, people)
+            self._rosters.append({
+                "sangerProjectPI": rng.sample(range(people), 1),
+                "owner":           rng.sample(range(people), rng.randint(1, 3)),
+                "member":          rng.sample(range(people), members)
+            })
+
+    @staticmethod
+    def _modified(i:int) -> bytes:
+        return f"2018{i % 12 + 1:02d}01000000Z".encode()
+
+    def _person(self, i:int) -> _ResultT:
+        uid = f"user{i:06d}"
+        return Person.build_dn(uid), {
+            "uid":                        [uid.encode()],
+            "cn":                         [f"User {i}".encode()],
+            "mail":                       [f"{uid}@example.com".encode()],
+            "title":                      [_TITLES[i % len(_TITLES)]],
+            "sangerAgressoCurrentPerson": [b"YES"],
+            "sangerActiveAccount":        [b"TRUE"],
+            "modifyTimestamp":            [self._modified(i)]
+        }
+
+    def _group(self, i:int) -> _ResultT:
+        cn = f"group{i:05d}"
+        payload = {
+            "cn":                        [cn.encode()],
+            "sangerHumgenProjectActive": [b"TRUE" if i % 5 else b"FALSE"],
+            "description":               [f"Group {i}".encode()],
+            "sangerPrelimID":            [f"prelim{i:05d}".encode()],
+            "modifyTimestamp":           [self._modified(i)]
+        }
+
+        for attr, people in self._rosters[i].items():
+            payload[attr] = [Person.build_dn(f"user{p:06d}").encode() for p in people]
+
+        return Group.build_dn(cn), payload
+
+    def _directory(self, base:str, scope:Scope) -> T.Tuple[T.Type, int, T.Callable[[int], _ResultT]]:
+        for cls, count, entry in ((Person, self.people, self._person), (Group, self.groups, self._group)):
+            if scope == Scope.Base and base.endswith(f",{cls._base_dn}"):
+                return cls, count, entry
+
+            if scope != Scope.Base and base == cls._base_dn:
+                return cls, count, entry
+
+        raise NoSuchDistinguishedName(f"Base DN {base} does not exist")
+
+    def _indices(self, base:str, scope:Scope, search:str, count:int) -> T.Iterable[int]:
+        """ Indices of the entries that match the search """
+        if scope == Scope.Base:
+            rdns = [base.split(",", 1)[0].split("=", 1)[1]]
+
+        else:
+            rdns = [value for _, value in _RE_EQUALITY.findall(search)]
+
+        if not rdns:
+            return range(count)
+
+        # Identities end with their zero-padded index
+        indices = (int(match[1]) for match in map(_RE_INDEX.match, rdns) if match)
+        return sorted(i for i in indices if i < count)
+
+    async def search(self, base, scope, search="(objectClass=*)", *, attrs=None, adaptor=None):
+        adaptor = adaptor or (lambda result: result)
+        _, count, entry = self._directory(base, scope)
+
+        modified = _RE_MODIFIED.search(search)
+        since = modified[1].encode() if modified else None
+
+        for i in self._indices(base, scope, search, count):
+            if since is not None and self._modified(i) < since:
+                continue
+
+            # Every tenth person has a photo
+            if "jpegPhoto=*" in search:
+                if i % 10 == 0:
+                    yield adaptor((entry(i)[0], {}))
+
+                continue
+
+            dn, payload = entry(i)
+            if attrs is not None and "*" not in attrs:
+                payload = {attr: payload[attr] for attr in attrs if attr in payload}
+
+            yield adaptor((dn, payload))
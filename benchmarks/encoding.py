@@ -0,0 +1,71 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+JSON encoding benchmark: compare the available backends on the
+serialisable forms of people from a synthetic directory, and of their
+listing, checking they produce the same output
+
+    python -m benchmarks.encoding [--people N] [--repeat N]
+"""
+
+import argparse
+import asyncio
+import timeit
+
+from api.models import Person, Registry
+from common import json, time, types as T
+from ._synthetic import SyntheticServer
+
+
+async def _payloads(people:int) -> T.Dict[str, T.Any]:
+    registry = Registry(SyntheticServer(people), time.delta(hours=1))
+    await registry.seed(Person)
+    registry._last_updated = time.now()
+
+    identities = list(registry.keys(Person))
+    nodes = await registry.get_many(Person, identities)
+
+    return {
+        "people":  [await node.__serialisable__() for node in nodes.values()],
+        "listing": await registry.all_links(Person)
+    }
+
+
+def main(people:int, repeat:int) -> None:
+    payloads = asyncio.get_event_loop().run_until_complete(_payloads(people))
+
+    for name, payload in payloads.items():
+        print(f"{name} ({people} people)")
+
+        outputs = {}
+        for backend in json.BACKENDS:
+            encode = json.encoder(backend)
+            outputs[backend] = encode(payload)
+
+            elapsed = min(timeit.repeat(lambda: encode(payload), number=1, repeat=repeat))
+            print(f"  {backend:8} {elapsed * 1000:8.2f} ms  {len(outputs[backend]) / elapsed / 1024 / 1024:8.1f} MiB/s")
+
+        assert len(set(outputs.values())) == 1, "Backends' outputs differ"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="JSON encoding benchmark")
+    parser.add_argument("--people", type=int, default=10000, help="number of synthetic people")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timed repetitions")
+    args = parser.parse_args()
+    main(args.people, args.repeat)
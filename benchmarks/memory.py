@@ -0,0 +1,61 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+Memory benchmark: seed a registry from a synthetic directory of people
+and report the memory it retains per node
+
+    python -m benchmarks.memory [--people N]
+"""
+
+import argparse
+import asyncio
+import gc
+import tracemalloc
+
+from api.models import Person, Registry
+from common import time
+from ._synthetic import SyntheticServer
+
+
+async def _seed(registry:Registry) -> None:
+    await registry.seed(Person)
+
+
+def main(people:int) -> None:
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+
+    registry = Registry(SyntheticServer(people), time.delta(hours=1))
+    asyncio.get_event_loop().run_until_complete(_seed(registry))
+
+    gc.collect()
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    retained = after - before
+    print(f"People:         {people}")
+    print(f"Retained:       {retained / 1024 / 1024:.1f} MiB")
+    print(f"Peak:           {(peak - before) / 1024 / 1024:.1f} MiB")
+    print(f"Per node:       {retained / people:.0f} bytes")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Registry memory benchmark")
+    parser.add_argument("--people", type=int, default=50000, help="number of synthetic people")
+    main(parser.parse_args().people)
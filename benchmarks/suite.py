@@ -0,0 +1,252 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+Microbenchmark suite: time the registry's hot paths over a synthetic
+directory of people and groups, reporting their throughput, latency
+percentiles and peak memory, optionally saving the results as a
+baseline and comparing them against a previously saved one
+
+    python -m benchmarks.suite [--scale {small,medium,large}]
+                               [--people N] [--groups N]
+                               [--duration SECONDS] [--only NAME ...]
+                               [--save PATH] [--baseline PATH]
+                               [--tolerance PERCENT]
+
+The scales are 1k people and 100 groups (small, the default), 10k and
+1k (medium) and 100k and 10k (large). Comparisons against a baseline
+fail (with a non-zero exit status) when any benchmark's throughput has
+dropped by more than the tolerance; baselines are only comparable when
+they're taken on the same machine, at the same scale.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import platform
+import sys
+import tracemalloc
+from time import perf_counter
+
+from api.httpd._middleware import _AcceptParser
+from api.models import Person, Group, Registry
+from common import json as json_encoding, time, types as T
+from common.logging import Level, get_logger
+from common.serialisation import MEDIA_TYPES
+from ._synthetic import SyntheticServer
+
+
+_SCALES = {
+    "small":  (1000, 100),
+    "medium": (10000, 1000),
+    "large":  (100000, 10000)
+}
+
+# Bounds on the number of timed iterations of each benchmark
+_MIN_ITERATIONS = 3
+_MAX_ITERATIONS = 100000
+
+# Typical browser Accept header, which none of our media types match
+# exactly, so it exercises the parser's fallbacks
+_ACCEPT = "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8"
+
+_OperationT = T.Callable[[], T.Awaitable[T.Any]]
+
+class Result(T.NamedTuple):
+    """ Benchmark measurements """
+    iterations:int
+    ops:float   # Operations per second
+    p50:float   # Latency percentiles, in seconds
+    p90:float
+    p99:float
+    peak:int    # Peak memory allocated by an operation, in bytes
+
+
+def _percentile(latencies:T.List[float], q:float) -> float:
+    """ Nearest rank percentile of the sorted latencies """
+    return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+async def _measure(operation:_OperationT, duration:float) -> Result:
+    """
+    Time the operation repeatedly, for about the given duration, and
+    then once more, with memory tracing, to find its peak allocation
+    """
+    latencies = []
+    started = perf_counter()
+
+    while len(latencies) < _MAX_ITERATIONS:
+        begin = perf_counter()
+        await operation()
+        end = perf_counter()
+        latencies.append(end - begin)
+
+        if end - started >= duration and len(latencies) >= _MIN_ITERATIONS:
+            break
+
+    tracemalloc.start()
+    await operation()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return Result(
+        iterations = len(latencies),
+        ops        = len(latencies) / sum(latencies),
+        p50        = _percentile(latencies, 0.5),
+        p90        = _percentile(latencies, 0.9),
+        p99        = _percentile(latencies, 0.99),
+        peak       = peak)
+
+
+async def _benchmarks(server:SyntheticServer) -> T.Dict[str, _OperationT]:
+    """ Benchmarked operations, by name, over a seeded registry """
+    registry = Registry(server, time.delta(hours=1))
+    await registry.update()
+
+    people = await registry.get_many(Person, registry.keys(Person))
+    groups = await registry.get_many(Group, registry.keys(Group))
+    next_person = itertools.cycle(people.values()).__next__
+    next_group = itertools.cycle(groups.values()).__next__
+    next_cursor = itertools.cycle(list(people)[::max(len(people) // 100, 1)]).__next__
+
+    person = await next_person().__serialisable__()
+    listing = await registry.all_links(Person)
+
+    async def _seed():
+        fresh = Registry(server, time.delta(hours=1))
+        await fresh.seed(Person)
+        await fresh.seed(Group)
+
+    async def _person():
+        await next_person().__serialisable__()
+
+    async def _group():
+        await next_group().__serialisable__()
+
+    async def _all_links():
+        await registry.all_links(Person)
+
+    async def _keys():
+        list(registry.keys(Person, after=next_cursor(), limit=100))
+
+    async def _encode_person():
+        json_encoding.encode(person)
+
+    async def _encode_listing():
+        json_encoding.encode(listing)
+
+    async def _accept():
+        _AcceptParser(_ACCEPT).preferred(*MEDIA_TYPES)
+
+    return {
+        "registry.seed":           _seed,
+        "person.serialisable":     _person,
+        "group.serialisable":      _group,
+        "registry.all_links":      _all_links,
+        "registry.keys":           _keys,
+        "json.encode.person":      _encode_person,
+        "json.encode.listing":     _encode_listing,
+        "accept.preferred":        _accept
+    }
+
+
+def _duration(seconds:float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+
+    return f"{seconds / 1e-9:.0f} ns"
+
+def _comparison(result:Result, baseline:T.Optional[T.Dict[str, T.Any]], tolerance:float) -> T.Tuple[str, bool]:
+    """ Change in throughput from the baseline, and whether it's a regression """
+    if baseline is None:
+        return "", False
+
+    change = result.ops / baseline["ops"] - 1
+    regressed = change < -tolerance
+    return f"{change:+.1%}{' REGRESSION' if regressed else ''}", regressed
+
+
+def main(people:int, groups:int, duration:float, only:T.Optional[T.List[str]],
+         save:T.Optional[str], baseline_path:T.Optional[str], tolerance:float) -> int:
+    get_logger().setLevel(Level.Warning.value)
+
+    parameters = {"people": people, "groups": groups, "python": platform.python_version()}
+
+    baseline = None
+    if baseline_path is not None:
+        with open(baseline_path) as f:
+            saved = json.load(f)
+
+        if saved["parameters"] != parameters:
+            print(f"Baseline parameters {saved['parameters']} differ from {parameters}; not comparing")
+
+        else:
+            baseline = saved["results"]
+
+    loop = asyncio.get_event_loop()
+    benchmarks = loop.run_until_complete(_benchmarks(SyntheticServer(people, groups)))
+    unknown = set(only or []) - set(benchmarks)
+    if unknown:
+        print(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+        return 2
+
+    print(f"{people} people, {groups} groups")
+    print(f"{'Benchmark':24} {'Iterations':>10} {'ops/s':>12} {'p50':>10} {'p90':>10} {'p99':>10} {'Peak':>10}  Baseline")
+
+    results = {}
+    regressions = 0
+    for name, operation in benchmarks.items():
+        if only and name not in only:
+            continue
+
+        result = results[name] = loop.run_until_complete(_measure(operation, duration))
+        comparison, regressed = _comparison(result, (baseline or {}).get(name), tolerance)
+        regressions += regressed
+
+        print(f"{name:24} {result.iterations:10} {result.ops:12.1f} "
+              f"{_duration(result.p50):>10} {_duration(result.p90):>10} {_duration(result.p99):>10} "
+              f"{result.peak / 1024:7.0f} KiB  {comparison}")
+
+    if save is not None:
+        with open(save, "w") as f:
+            json.dump({
+                "parameters": parameters,
+                "results":    {name: result._asdict() for name, result in results.items()}
+            }, f, indent=2)
+
+        print(f"Baseline saved to {save}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmark suite")
+    parser.add_argument("--scale", choices=_SCALES, default="small", help="size of the synthetic directory")
+    parser.add_argument("--people", type=int, help="number of synthetic people, overriding the scale")
+    parser.add_argument("--groups", type=int, help="number of synthetic groups, overriding the scale")
+    parser.add_argument("--duration", type=float, default=1.0, help="approximate time (in seconds) to run each benchmark")
+    parser.add_argument("--only", nargs="+", metavar="NAME", help="benchmarks to run; all of them by default")
+    parser.add_argument("--save", metavar="PATH", help="save the results as a baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="compare the results against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=10, help="throughput drop (in percent) deemed a regression")
+    args = parser.parse_args()
+
+    people, groups = _SCALES[args.scale]
+    sys.exit(main(args.people or people, args.groups or groups, args.duration, args.only,
+                  args.save, args.baseline, args.tolerance / 100))
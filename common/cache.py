@@ -0,0 +1,114 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from collections import OrderedDict
+
+from . import types as T
+
+
+__all__ = ["LRUCache"]
+
+
+_K = T.TypeVar("_K")
+_V = T.TypeVar("_V")
+
+class LRUCache(T.Generic[_K, _V]):
+    """
+    Least recently used cache, bounded by the total size of its values
+    (by default, their length in bytes) rather than their number
+    """
+    _budget:int
+    _sizeof:T.Callable[[_V], int]
+    _cache:T.Dict[_K, _V]
+    _size:int
+
+    hits:int
+    misses:int
+
+    def __init__(self, budget:int, sizeof:T.Callable[[_V], int] = len) -> None:
+        assert budget > 0
+
+        self._budget = budget
+        self._sizeof = sizeof
+        self._cache = OrderedDict()
+        self._size = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key:_K) -> bool:
+        return key in self._cache
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    @property
+    def budget(self) -> int:
+        return self._budget
+
+    @property
+    def size(self) -> int:
+        """ Total size of the cached values """
+        return self._size
+
+    @property
+    def hit_rate(self) -> T.Optional[float]:
+        """ Proportion of lookups that were hits, if there were any """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else None
+
+    def get(self, key:_K, default:T.Optional[_V] = None) -> T.Optional[_V]:
+        """ Get a value, marking it as most recently used """
+        try:
+            value = self._cache[key]
+
+        except KeyError:
+            self.misses += 1
+            return default
+
+        self._cache.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key:_K, value:_V) -> None:
+        """
+        Cache a value, evicting the least recently used values to keep
+        within budget; values that exceed the budget are not cached
+        """
+        self.remove(key)
+
+        size = self._sizeof(value)
+        if size > self._budget:
+            return
+
+        while self._size + size > self._budget:
+            _, evicted = self._cache.popitem(last=False)
+            self._size -= self._sizeof(evicted)
+
+        self._cache[key] = value
+        self._size += size
+
+    def remove(self, key:_K) -> None:
+        """ Remove a value, if it's cached """
+        if key in self._cache:
+            self._size -= self._sizeof(self._cache.pop(key))
+
+    def clear(self) -> None:
+        self._cache.clear()
+        self._size = 0
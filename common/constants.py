@@ -23,5 +23,9 @@ from enum import Enum
 ENCODING = "utf-8"
 
 class MIMEType(Enum):
-    JSON = "application/json"
-    JPEG = "image/jpeg"
+    JSON    = "application/json"
+    MSGPACK = "application/msgpack"
+    CBOR    = "application/cbor"
+    JPEG    = "image/jpeg"
+    WEBP    = "image/webp"
+    PNG     = "image/png"
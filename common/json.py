@@ -17,31 +17,64 @@ You should have received a copy of the GNU Affero General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
+from datetime import datetime
+from functools import lru_cache
 import json
 
 from .constants import ENCODING
 from . import time, types as T
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-__all__ = ["encode"]
+# Datetimes can only be passed through from version 3.0
+if orjson is not None and not hasattr(orjson, "OPT_PASSTHROUGH_DATETIME"):
+    orjson = None
 
 
-class _JSONEncoder(json.JSONEncoder):
-    """ JSON encoder that understands all our types """
-    _encoders:T.ClassVar[T.List[json.JSONEncoder]] = [
-        time.JSONEncoder()
-    ]
+__all__ = ["BACKENDS", "BACKEND", "encoder", "encode"]
 
-    def default(self, obj:T.Any) -> T.Any:
-        for encoder in _JSONEncoder._encoders:
-            try:
-                return encoder.default(obj)
 
-            except TypeError:
-                pass
+@lru_cache(maxsize=1024)
+def _timestamp(dt:datetime) -> str:
+    # Timestamps are widely shared (e.g., by nodes updated together), so
+    # their formatting is cached
+    return dt.strftime(time.ISO8601)
 
-        super().default(obj)
+def _default(obj:T.Any) -> T.Any:
+    """ Serialisable form of the types that JSON doesn't support """
+    if isinstance(obj, datetime):
+        return _timestamp(obj)
 
-def encode(data:T.Any) -> bytes:
-    """ Standard JSON encoding """
-    return json.dumps(data, cls=_JSONEncoder).encode(ENCODING)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serialisable")
+
+
+# Compact and unescaped, to match the output of the other backends
+_stdlib = json.JSONEncoder(default=_default, separators=(",", ":"), ensure_ascii=False)
+
+def _stdlib_encode(data:T.Any) -> bytes:
+    return _stdlib.encode(data).encode(ENCODING)
+
+def _orjson_encode(data:T.Any) -> bytes:
+    # Datetimes are passed through to keep our timestamp format
+    return orjson.dumps(data, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+# Available encoding backends, in order of speed, which all produce the
+# same output, with the fastest being used
+_BACKENDS:T.Dict[str, T.Callable[[T.Any], bytes]] = {
+    **({"orjson": _orjson_encode} if orjson else {}),
+    "stdlib": _stdlib_encode
+}
+
+BACKENDS = tuple(_BACKENDS)
+BACKEND = BACKENDS[0]
+
+def encoder(backend:str) -> T.Callable[[T.Any], bytes]:
+    """ Get the encoding function of the given backend """
+    return _BACKENDS[backend]
+
+# Standard JSON encoding
+encode = encoder(BACKEND)
@@ -0,0 +1,197 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from time import monotonic
+
+from . import types as T
+
+
+__all__ = ["CONTENT_TYPE", "DEFAULT_BUCKETS", "Counter", "Gauge", "Histogram", "MetricSet"]
+
+
+# Prometheus text exposition format
+# https://prometheus.io/docs/instrumenting/exposition_formats/
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Default histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_LabelsT = T.Tuple[str, ...]
+_SampleT = T.Tuple[str, _LabelsT, _LabelsT, float]  # Suffix, Label names, Label values, Value
+_CollectorT = T.Callable[[], T.Dict[_LabelsT, float]]
+
+def _escape(value:str) -> str:
+    return value.replace("\\", r"\\").replace("\"", r"\"").replace("\n", r"\n")
+
+def _number(value:float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(object):
+    """
+    Base class for metrics, with values by label values that are either
+    recorded as they happen or, for metrics that merely reflect some
+    existing state, collected when they're rendered
+    """
+    _type:T.ClassVar[str]
+
+    name:str
+    description:str
+    labels:_LabelsT
+    _collect:T.Optional[_CollectorT]
+    _values:T.Dict[_LabelsT, T.Any]
+
+    def __init__(self, name:str, description:str, labels:T.Iterable[str] = (), collect:T.Optional[_CollectorT] = None) -> None:
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._collect = collect
+        self._values = {}
+
+    def samples(self) -> T.Iterator[_SampleT]:
+        """ Generator of the metric's collected and recorded samples """
+        if self._collect is not None:
+            for values, value in self._collect().items():
+                yield "", self.labels, values, value
+
+        for values, value in self._values.items():
+            yield "", self.labels, values, value
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self._type}"
+        ]
+
+        for suffix, names, values, value in self.samples():
+            labels = ",".join(f"{name}=\"{_escape(str(v))}\"" for name, v in zip(names, values))
+            labels = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}{suffix}{labels} {_number(value)}")
+
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """ Monotonically increasing count """
+    _type = "counter"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+
+        # Unlabelled counts start from zero, rather than being absent
+        if not self.labels and self._collect is None:
+            self._values[()] = 0
+
+    def inc(self, *labels:str, amount:float = 1) -> None:
+        """ Increment the count for the given label values """
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    """ Value that can go up and down """
+    _type = "gauge"
+
+    def set(self, value:float, *labels:str) -> None:
+        """ Set the value for the given label values """
+        self._values[labels] = value
+
+
+class _Distribution(T.NamedTuple):
+    """ Histogram state for one set of label values """
+    buckets:T.List[int]  # Non-cumulative counts, with a final +Inf bucket
+    total:T.List[float]  # Single-element sum, for mutability
+
+class Histogram(_Metric):
+    """
+    Distribution of observations, counted into buckets by their upper
+    bounds; bucket counts are only made cumulative when rendered, so an
+    observation costs a bisection and a couple of additions
+    """
+    _type = "histogram"
+    _bounds:T.Tuple[float, ...]
+    _values:T.Dict[_LabelsT, _Distribution]
+
+    def __init__(self, name:str, description:str, labels:T.Iterable[str] = (), buckets:T.Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, description, labels)
+        self._bounds = tuple(sorted(buckets))
+
+    def observe(self, value:float, *labels:str) -> None:
+        """ Record an observation for the given label values """
+        distribution = self._values.get(labels)
+        if distribution is None:
+            distribution = self._values[labels] = _Distribution([0] * (len(self._bounds) + 1), [0.0])
+
+        distribution.buckets[bisect_left(self._bounds, value)] += 1
+        distribution.total[0] += value
+
+    @contextmanager
+    def time(self, *labels:str) -> T.Iterator[None]:
+        """ Context manager that observes the time (in seconds) it takes """
+        started = monotonic()
+        try:
+            yield
+        finally:
+            self.observe(monotonic() - started, *labels)
+
+    def count(self, *labels:str) -> int:
+        """ Number of observations for the given label values """
+        distribution = self._values.get(labels)
+        return sum(distribution.buckets) if distribution else 0
+
+    def samples(self) -> T.Iterator[_SampleT]:
+        names = (*self.labels, "le")
+        bounds = (*self._bounds, float("inf"))
+
+        for values, distribution in self._values.items():
+            cumulative = 0
+            for bound, count in zip(bounds, distribution.buckets):
+                cumulative += count
+                yield "_bucket", names, (*values, _number(bound)), cumulative
+
+            yield "_sum", self.labels, values, distribution.total[0]
+            yield "_count", self.labels, values, cumulative
+
+
+class MetricSet(object):
+    """ Collection of metrics, rendered together for scraping """
+    _metrics:T.Dict[str, _Metric]
+
+    def __init__(self, *metrics:_Metric) -> None:
+        self._metrics = {}
+        self.register(*metrics)
+
+    def __contains__(self, name:str) -> bool:
+        return name in self._metrics
+
+    def __getitem__(self, name:str) -> _Metric:
+        return self._metrics[name]
+
+    def register(self, *metrics:_Metric) -> None:
+        for metric in metrics:
+            assert metric.name not in self._metrics, f"Metric {metric.name} is already registered"
+            self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """ Render every metric in the Prometheus text exposition format """
+        return "".join(f"{metric.render()}\n" for metric in self._metrics.values())
@@ -0,0 +1,74 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from . import json, types as T
+from .constants import MIMEType
+
+try:
+    import msgpack
+
+    # Timestamps are only encoded natively from version 1.0
+    if msgpack.version < (1, 0):
+        msgpack = None
+
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+
+__all__ = ["MEDIA_TYPES", "encode", "array_framing"]
+
+
+_EncoderT = T.Callable[[T.Any], bytes]
+_FramingT = T.Tuple[bytes, bytes, bytes]   # Start, Separator, End
+
+# Representations of serialisable forms, in order of our preference, for
+# those whose encoders are available; datetimes are encoded natively,
+# where the representation supports them
+_ENCODERS:T.Dict[MIMEType, _EncoderT] = {
+    MIMEType.JSON: json.encode,
+    **({MIMEType.MSGPACK: lambda data: msgpack.packb(data, use_bin_type=True, datetime=True)} if msgpack else {}),
+    **({MIMEType.CBOR: cbor2.dumps} if cbor2 else {})
+}
+
+MEDIA_TYPES = tuple(_ENCODERS)
+
+
+def encode(data:T.Any, media_type:MIMEType) -> bytes:
+    """ Encode a serialisable form in the given representation """
+    return _ENCODERS[media_type](data)
+
+def array_framing(media_type:MIMEType, length:int) -> _FramingT:
+    """
+    The bytes that start an array of the given length, separate its
+    encoded elements and end it, in the given representation, so arrays
+    can be encoded (and sent) incrementally
+    """
+    if media_type == MIMEType.MSGPACK:
+        return msgpack.Packer().pack_array_header(length), b"", b""
+
+    if media_type == MIMEType.CBOR:
+        # Indefinite-length array
+        return b"\x9f", b"", b"\xff"
+
+    return b"[", b",", b"]"
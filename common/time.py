@@ -18,12 +18,9 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
 from datetime import datetime, timedelta, timezone
-import json
 
-from common import types as T
 
-
-__all__ = ["ISO8601", "JSONEncoder", "now", "delta"]
+__all__ = ["ISO8601", "now", "delta"]
 
 
 now = lambda: datetime.now(timezone.utc)
@@ -31,13 +28,3 @@ delta = timedelta
 
 
 ISO8601 = "%Y-%m-%dT%H:%M:%SZ%z"
-
-class JSONEncoder(json.JSONEncoder):
-    """ JSON encoder that understands datetimes """
-    def default(self, obj:T.Any) -> T.Any:
-        if isinstance(obj, datetime):
-            return obj.strftime(ISO8601)
-
-        # TODO? Serialisation for timedelta
-
-        super().default(obj)
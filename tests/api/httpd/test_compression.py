@@ -0,0 +1,77 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import gzip
+import unittest
+
+from tests import async_test
+from api.httpd import _compression as c
+from api.httpd._store import ResponseStore
+from common.constants import MIMEType
+
+
+class TestCompression(unittest.TestCase):
+    def test_negotiate(self):
+        self.assertIsNone(c.negotiate(None))
+        self.assertIsNone(c.negotiate("identity"))
+        self.assertIsNone(c.negotiate("deflate"))
+        self.assertIsNone(c.negotiate("gzip;q=0"))
+        self.assertIsNone(c.negotiate("*;q=0"))
+
+        self.assertEqual(c.negotiate("gzip"), "gzip")
+        self.assertEqual(c.negotiate("GZip;q=0.5, deflate"), "gzip")
+        self.assertEqual(c.negotiate("*"), c.CODINGS[0])
+
+    def test_compress(self):
+        body = b"foo" * 1000
+        self.assertEqual(gzip.decompress(c.compress(body, "gzip")), body)
+
+    @async_test
+    async def test_store(self):
+        store = ResponseStore(threshold=100)
+        renders = []
+
+        async def _renderer():
+            renders.append(None)
+            return b"foo" * 100
+
+        # Compressed bodies are stored alongside their plain bodies
+        body, coding = await store.render("/foo", MIMEType.JSON, lambda: 1, _renderer, "gzip")
+        self.assertEqual(coding, "gzip")
+        self.assertEqual(gzip.decompress(body), b"foo" * 100)
+        self.assertIs((await store.render("/foo", MIMEType.JSON, lambda: 1, _renderer, "gzip"))[0], body)
+        self.assertEqual(await store.render("/foo", MIMEType.JSON, lambda: 1, _renderer), (b"foo" * 100, None))
+        self.assertEqual(store.size, 300 + len(body))
+        self.assertEqual(len(renders), 1)
+
+        # Small bodies aren't compressed
+        async def _small():
+            return b"foo"
+
+        self.assertEqual(await store.render("/bar", MIMEType.JSON, lambda: 1, _small, "gzip"), (b"foo", None))
+
+        # Bodies whose data changes while they're rendered aren't stored
+        versions = iter([1, 2, 2, 2])
+        self.assertEqual(await store.render("/baz", MIMEType.JSON, lambda: next(versions), _small), (b"foo", None))
+        self.assertEqual(await store.render("/baz", MIMEType.JSON, lambda: next(versions), _small), (b"foo", None))
+        self.assertEqual(store.misses, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from tests import async_test
+from api.httpd._follower import SnapshotFollower, published
+from api.models import Registry, Person
+from api.models import _snapshot as s
+from common import time
+
+
+def _person(identity, last_updated):
+    return s.NodeState(identity, {attr.name: None for attr in Person._attributes}, None, frozenset(), last_updated)
+
+
+class TestSnapshotFollower(unittest.TestCase):
+    @async_test
+    async def test_follow(self):
+        registry = Registry(MagicMock(), time.delta(hours=1))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "snapshot")
+            follower = SnapshotFollower(registry, path, interval=0.01)
+            await follower.start(None)
+
+            # Nothing is served until a snapshot is published
+            self.assertIsNone(published(path))
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(follower.ready(), 0.05)
+
+            last_updated = time.now()
+            s.write(s.Snapshot(last_updated, {}, {}), path)
+            await asyncio.wait_for(follower.ready(), 1)
+            self.assertEqual(registry.last_updated, last_updated)
+            self.assertEqual(follower.refreshes.count(), 1)
+
+            # The same publication isn't restored again
+            await asyncio.sleep(0.05)
+            self.assertEqual(follower.refreshes.count(), 1)
+
+            # Invalid publications are skipped, leaving the registry be
+            with open(f"{path}.partial", "wb") as f:
+                f.write(b"garbage")
+
+            os.replace(f"{path}.partial", path)
+            await asyncio.sleep(0.05)
+            self.assertEqual(follower.refreshes.count(), 1)
+            self.assertEqual(follower.failures._values[()], 1)
+            self.assertEqual(registry.last_updated, last_updated)
+
+            await follower.stop(None)
+
+    @async_test
+    async def test_fresh(self):
+        registry = Registry(MagicMock(), time.delta(hours=1))
+
+        # Workers never update the registry, so published nodes are
+        # served as they are, rather than refreshed when they expire
+        stale = time.now() - time.delta(hours=2)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "snapshot")
+            s.write(s.Snapshot(stale, {}, {"Person": [_person("foo", stale)]}), path)
+
+            follower = SnapshotFollower(registry, path, interval=0.01)
+            await follower.start(None)
+            await asyncio.wait_for(follower.ready(), 1)
+            await follower.stop(None)
+
+        person = await registry.get(Person, "foo")
+        self.assertFalse(person.has_expired)
+        registry.server.search.assert_not_called()
+
+    @async_test
+    async def test_prune(self):
+        registry = Registry(MagicMock(), time.delta(hours=1))
+        last_updated = time.now()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "snapshot")
+            s.write(s.Snapshot(last_updated, {}, {"Person": [_person("foo", last_updated), _person("bar", last_updated)]}), path)
+
+            follower = SnapshotFollower(registry, path, interval=0.01)
+            await follower.start(None)
+            await asyncio.wait_for(follower.ready(), 1)
+            self.assertEqual(list(registry.keys(Person)), ["bar", "foo"])
+
+            # Nodes that the refresher has since pruned are removed
+            s.write(s.Snapshot(last_updated, {}, {"Person": [_person("foo", last_updated)]}), f"{path}.new")
+            os.replace(f"{path}.new", path)
+            await asyncio.sleep(0.1)
+            await follower.stop(None)
+
+        self.assertEqual(follower.refreshes.count(), 2)
+        self.assertEqual(list(registry.keys(Person)), ["foo"])
+        self.assertNotIn("bar", registry._registry[Person])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,245 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import tempfile
+import unittest
+from base64 import b64encode
+from io import BytesIO
+from unittest.mock import patch
+
+from aiohttp.test_utils import TestClient, TestServer
+from PIL import Image
+
+from tests import async_test
+from api.httpd import _handlers as h
+from api.httpd._refresher import Refresher
+from api.httpd._server import _application
+from api.ldap import LDIFDirectory
+from api.models import Registry
+from common import time
+from common.serialisation import msgpack
+
+
+_PEOPLE = 12
+
+def _photo() -> bytes:
+    output = BytesIO()
+    Image.new("RGB", (300, 200), "red").save(output, format="JPEG")
+    return output.getvalue()
+
+_PHOTO = _photo()
+
+def _ldif() -> bytes:
+    """ Directory of a dozen people, the first with a photo, in a single group """
+    records = ["dn: ou=people,dc=sanger,dc=ac,dc=uk\nobjectClass: organizationalUnit\n"]
+
+    for i in range(_PEOPLE):
+        records.append(f"dn: uid=u{i:02},ou=people,dc=sanger,dc=ac,dc=uk\n"
+                       f"objectClass: posixAccount\nuid: u{i:02}\ncn: User {i}\nmail: u{i:02}@example.com\n"
+                       f"sangerActiveAccount: TRUE\nmodifyTimestamp: 20180101000000Z\n")
+
+    records[1] += f"jpegPhoto:: {b64encode(_PHOTO).decode()}\n"
+
+    records.append("dn: ou=group,dc=sanger,dc=ac,dc=uk\nobjectClass: organizationalUnit\n")
+    records.append("dn: cn=g0,ou=group,dc=sanger,dc=ac,dc=uk\n"
+                   "objectClass: posixGroup\nobjectClass: sangerHumgenProjectGroup\ncn: g0\n"
+                   "sangerHumgenProjectActive: TRUE\nmodifyTimestamp: 20180101000000Z\n"
+                   "sangerProjectPI: uid=u00,ou=people,dc=sanger,dc=ac,dc=uk\n"
+                   "owner: uid=u01,ou=people,dc=sanger,dc=ac,dc=uk\n"
+                   "member: uid=u02,ou=people,dc=sanger,dc=ac,dc=uk\n")
+
+    return "\n".join(records).encode()
+
+
+class _HandlerTestCase(unittest.TestCase):
+    """ Test case with a client of the API, served from an LDIF export """
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".ldif")
+        with os.fdopen(fd, "wb") as ldif:
+            ldif.write(_ldif())
+
+        self.registry = Registry(LDIFDirectory(self.path), time.delta(hours=1))
+        self.app = _application(self.registry, Refresher(self.registry), 1024 * 1024, 1024 * 1024, 1024)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def client(self) -> TestClient:
+        return TestClient(TestServer(self.app))
+
+
+class TestListings(_HandlerTestCase):
+    @async_test
+    async def test_streamed(self):
+        async with self.client() as client:
+            # Paginated listings are stored
+            pages = []
+            response = await client.get("/people?limit=5")
+            while True:
+                self.assertEqual(response.status, 200)
+                pages.extend(await response.json())
+
+                if "Link" not in response.headers:
+                    break
+
+                response = await client.get(response.links["next"]["url"].path_qs)
+
+            self.assertEqual(len(pages), _PEOPLE)
+
+            # Full listings are streamed, then served from the store
+            store = self.app["store"]
+            with patch.object(h, "_CHUNK", 5):
+                for stored in (False, True):
+                    hits = store.hits
+                    response = await client.get("/people")
+                    self.assertEqual(response.status, 200)
+                    self.assertEqual(response.headers.get("Transfer-Encoding") == "chunked", not stored)
+                    self.assertEqual(await response.json(), pages)
+                    self.assertEqual(store.hits, hits + stored)
+
+            # ...as are those after a cursor
+            response = await client.get("/people?cursor=u04")
+            self.assertEqual(await response.json(), pages[5:])
+
+            # HEAD requests have a length
+            response = await client.head("/people")
+            self.assertEqual(response.status, 200)
+            self.assertIn("Content-Length", response.headers)
+
+    @unittest.skipUnless(msgpack, "msgpack is not installed")
+    @async_test
+    async def test_msgpack(self):
+        async with self.client() as client:
+            json = await (await client.get("/people")).json()
+
+            response = await client.get("/people", headers={"Accept": "application/msgpack"})
+            self.assertEqual(response.status, 200)
+            self.assertEqual(msgpack.unpackb(await response.read(), raw=False), json)
+
+
+class TestBulk(_HandlerTestCase):
+    @async_test
+    async def test_bulk(self):
+        async with self.client() as client:
+            single = await (await client.get("/people/u00")).json()
+            missing = {"status": 404, "reason": "Not Found", "description": "No such person with ID nobody"}
+
+            # IDs from the query string or a JSON array in the body
+            for response in (await client.get("/people?id=u00&id=nobody"),
+                             await client.post("/people", json=["u00", "nobody"])):
+                self.assertEqual(response.status, 200)
+                self.assertEqual(await response.json(), {"u00": single, "nobody": missing})
+
+            response = await client.post("/groups", json=["g0"])
+            self.assertEqual(response.status, 200)
+            self.assertEqual((await response.json())["g0"]["pi"]["href"], "/people/u00")
+
+            # An empty array is an empty request, not a listing
+            response = await client.post("/people", json=[])
+            self.assertEqual(response.status, 200)
+            self.assertEqual(await response.json(), {})
+
+    @async_test
+    async def test_fields(self):
+        async with self.client() as client:
+            response = await client.post("/people?fields=name", json=["u00", "u01", "nobody"])
+            self.assertEqual(response.status, 200)
+
+            output = await response.json()
+            self.assertEqual(output["u01"], {"id": {"href": "/people/u01", "rel": "self", "value": "u01"},
+                                             "name": "User 1"})
+            self.assertEqual(set(output["u00"]), {"id", "name"})
+            self.assertEqual(output["nobody"]["status"], 404)
+
+            response = await client.get("/people?id=u00&fields=bogus")
+            self.assertEqual(response.status, 400)
+
+    @async_test
+    async def test_invalid(self):
+        async with self.client() as client:
+            for body in (b"", b"not JSON", b'{"id": "u00"}', b'"u00"', b'["u00", 1]', b"[null]"):
+                response = await client.post("/people", data=body, headers={"Content-Type": "application/json"})
+                self.assertEqual(response.status, 400)
+                self.assertIn("Request body must be a JSON array of IDs", await response.text())
+
+            # Requests are capped
+            identities = [f"x{i}" for i in range(h._MAX_BULK)]
+            response = await client.post("/people", json=identities)
+            self.assertEqual(response.status, 200)
+            self.assertEqual(len(await response.json()), h._MAX_BULK)
+
+            response = await client.post("/people", json=identities + ["u00"])
+            self.assertEqual(response.status, 400)
+            self.assertIn(f"Cannot request more than {h._MAX_BULK} IDs at once", await response.text())
+
+            query = "&".join(f"id=u{i}" for i in range(h._MAX_BULK + 1))
+            response = await client.get(f"/people?{query}")
+            self.assertEqual(response.status, 400)
+
+
+class TestPhoto(_HandlerTestCase):
+    @async_test
+    async def test_photo(self):
+        async with self.client() as client:
+            # The original JPEG is served as is
+            response = await client.get("/people/u00/photo")
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.content_type, "image/jpeg")
+            self.assertEqual(response.headers["Vary"], "Accept")
+            self.assertEqual(await response.read(), _PHOTO)
+
+            # Variants are resized and converted as requested
+            response = await client.get("/people/u00/photo?size=64", headers={"Accept": "image/webp"})
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.content_type, "image/webp")
+
+            image = Image.open(BytesIO(await response.read()))
+            self.assertEqual(image.format, "WEBP")
+            self.assertEqual(image.size, (64, 43))
+
+            # ...and are revalidated by their entity tag
+            etag = response.headers["ETag"]
+            response = await client.get("/people/u00/photo?size=64", headers={"Accept": "image/webp",
+                                                                               "If-None-Match": etag})
+            self.assertEqual(response.status, 304)
+            self.assertEqual(response.headers["ETag"], etag)
+
+            response = await client.get("/people/u00/photo?size=64", headers={"If-None-Match": etag})
+            self.assertEqual(response.status, 200)
+            self.assertNotEqual(response.headers["ETag"], etag)
+
+    @async_test
+    async def test_invalid(self):
+        async with self.client() as client:
+            for size in ("100", "-64", "big", ""):
+                response = await client.get(f"/people/u00/photo?size={size}")
+                self.assertEqual(response.status, 400)
+                self.assertIn("Photo size must be one of 64, 128, 256 or 512", await response.text())
+
+            # People without photos don't have one
+            response = await client.get("/people/u01/photo")
+            self.assertEqual(response.status, 404)
+
+            response = await client.get("/people/nobody/photo")
+            self.assertEqual(response.status, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+
+from api.httpd._metrics import LoopMonitor, metric_set
+from api.httpd._photos import PhotoVariants
+from api.httpd._refresher import Refresher
+from api.httpd._store import ResponseStore
+from api.ldap import Server
+from api.models import Registry
+from common import time
+
+
+class TestMetricSet(unittest.TestCase):
+    def test_pool(self):
+        registry = Registry(Server("ldap://foo", 3), time.delta(hours=1))
+        app = {
+            "registry":  registry,
+            "refresher": Refresher(registry),
+            "monitor":   LoopMonitor(),
+            "store":     ResponseStore(),
+            "photos":    PhotoVariants()
+        }
+
+        rendered = metric_set(app).render().splitlines()
+        for sample in ("ldap_pool_size 3", "ldap_pool_waits_total 0", "ldap_pool_wait_seconds_total 0.0",
+                       "ldap_pool_max_wait_seconds 0.0", "ldap_pool_waiting 0"):
+            self.assertIn(sample, rendered)
+
+
+if __name__ == "__main__":
+    unittest.main()
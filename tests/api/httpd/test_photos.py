@@ -0,0 +1,94 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+from io import BytesIO
+
+from PIL import Image
+
+from tests import async_test
+from api.httpd._photos import PhotoVariants
+from common.constants import MIMEType
+
+
+def jpeg(width:int = 600, height:int = 400, colour:str = "red") -> bytes:
+    """ Encoded JPEG of a plain image """
+    output = BytesIO()
+    Image.new("RGB", (width, height), colour).save(output, format="JPEG")
+    return output.getvalue()
+
+def _decoded(body:bytes) -> Image.Image:
+    return Image.open(BytesIO(body))
+
+
+class TestPhotoVariants(unittest.TestCase):
+    @async_test
+    async def test_original(self):
+        photos = PhotoVariants()
+        photo = jpeg()
+
+        # The original JPEG passes through unchanged, without caching
+        variant = await photos.variant(photo, None, MIMEType.JPEG)
+        self.assertIs(variant.body, photo)
+        self.assertEqual(len(photos.cache), 0)
+
+    @async_test
+    async def test_variants(self):
+        photos = PhotoVariants()
+        photo = jpeg()
+
+        # Resized within the bounding box, keeping the aspect ratio
+        small = await photos.variant(photo, 64, MIMEType.JPEG)
+        image = _decoded(small.body)
+        self.assertEqual(image.format, "JPEG")
+        self.assertEqual(image.size, (64, 43))
+
+        # Converted to other formats, at the original size or not
+        for media_type, fmt in ((MIMEType.WEBP, "WEBP"), (MIMEType.PNG, "PNG")):
+            for size, dimensions in ((None, (600, 400)), (128, (128, 85))):
+                image = _decoded((await photos.variant(photo, size, media_type)).body)
+                self.assertEqual(image.format, fmt)
+                self.assertEqual(image.size, dimensions)
+
+        # Every variant has its own entity tag
+        etags = {(await photos.variant(photo, size, media_type)).etag
+                 for size in (None, 64, 128) for media_type in (MIMEType.JPEG, MIMEType.WEBP, MIMEType.PNG)}
+        self.assertEqual(len(etags), 9)
+
+    @async_test
+    async def test_cache(self):
+        photos = PhotoVariants()
+        photo = jpeg()
+
+        first = await photos.variant(photo, 64, MIMEType.WEBP)
+        self.assertEqual(photos.cache.misses, 1)
+
+        # Variants are cached by the original's content, not its identity
+        again = await photos.variant(bytes(bytearray(photo)), 64, MIMEType.WEBP)
+        self.assertIs(again, first)
+        self.assertEqual(photos.cache.hits, 1)
+
+        # ...so a different photo is a different variant
+        other = await photos.variant(jpeg(colour="blue"), 64, MIMEType.WEBP)
+        self.assertNotEqual(other.etag, first.etag)
+        self.assertEqual(len(photos.cache), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
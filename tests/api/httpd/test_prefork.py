@@ -0,0 +1,102 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import os
+import signal
+import socket
+import tempfile
+import unittest
+from time import monotonic, sleep
+
+from api.httpd import _prefork as p
+from common import time
+
+
+class _IdleRegistry(object):
+    """ Registry stand-in that's never due a refresh """
+    def __init__(self):
+        self.shelf_life = time.delta(hours=1)
+        self.last_updated = time.now()
+
+def _worker(sock:socket.socket, published:str) -> None:
+    """ Worker that reports its PID to each connection """
+    loop = asyncio.get_event_loop()
+
+    async def _serve(_reader, writer):
+        writer.write(str(os.getpid()).encode())
+        writer.close()
+
+    loop.run_until_complete(asyncio.start_server(_serve, sock=sock))
+
+    # Record that we're serving
+    open(os.path.join(os.path.dirname(published), f"worker-{os.getpid()}"), "w").close()
+    loop.run_forever()
+
+
+class TestSupervisor(unittest.TestCase):
+    def test_workers(self):
+        # The supervisor mustn't share an event loop with its children
+        asyncio.get_event_loop()
+
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            supervisor = p.Supervisor(_IdleRegistry, 2, os.path.join(tmp, "snapshot"))
+
+            pid = os.fork()
+            if pid == 0:
+                # In its own process group, so it can be killed with its children
+                os.setpgid(0, 0)
+
+                try:
+                    supervisor.run("127.0.0.1", port, _worker)
+
+                finally:
+                    os._exit(0)
+
+            try:
+                # Every worker starts serving
+                deadline = monotonic() + 5
+                while len([f for f in os.listdir(tmp) if f.startswith("worker-")]) < 2 and monotonic() < deadline:
+                    sleep(0.05)
+
+                workers = {int(f[7:]) for f in os.listdir(tmp) if f.startswith("worker-")}
+                self.assertEqual(len(workers), 2)
+
+                with socket.create_connection(("127.0.0.1", port), timeout=5) as client:
+                    self.assertIn(int(client.recv(16)), workers)
+
+            finally:
+                os.kill(pid, signal.SIGTERM)
+
+                deadline = monotonic() + 5
+                while os.waitpid(pid, os.WNOHANG) == (0, 0):
+                    if monotonic() > deadline:
+                        os.killpg(pid, signal.SIGKILL)
+                        os.waitpid(pid, 0)
+                        break
+
+                    sleep(0.05)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from tests import async_test
+from api.httpd import _refresher as r
+from api.ldap import CannotConnect
+from common import time
+
+
+class _FlakyRegistry(object):
+    """ Registry stand-in whose first update fails """
+    def __init__(self):
+        self.shelf_life = time.delta(hours=1)
+        self.last_updated = None
+        self.updates = 0
+
+    async def update(self):
+        self.updates += 1
+        if self.updates == 1:
+            raise CannotConnect("LDAP server is down")
+
+        self.last_updated = time.now()
+
+
+class TestRefresher(unittest.TestCase):
+    @async_test
+    async def test_ready(self):
+        registry = _FlakyRegistry()
+        refresher = r.Refresher(registry)
+
+        with patch.object(r, "_RETRY_MIN", 0.01):
+            await refresher.start(None)
+
+            # The first attempt fails...
+            with self.assertRaises(CannotConnect):
+                await refresher.ready()
+
+            # ...but later requests wait for the next attempt
+            await asyncio.sleep(0)
+            await asyncio.wait_for(refresher.ready(), 1)
+            self.assertEqual(registry.updates, 2)
+            self.assertEqual(refresher.failures._values[()], 1)
+
+            await refresher.stop(None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -17,11 +17,17 @@ You should have received a copy of the GNU Affero General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
+import asyncio
+import os
+import tempfile
 import unittest
 
-from api.ldap import NoSuchDistinguishedName
+from tests import async_test
+from api.ldap import NoSuchDistinguishedName, PayloadNotFetched
 from api.models import _adaptors as a
 from api.models import _bases as b
+from api.models import _snapshot as s
+from common import time
 
 
 class TestNode(unittest.TestCase):
@@ -40,22 +46,293 @@ class TestNode(unittest.TestCase):
         self.assertEqual(_TestNode.extract_rdn(dn), rdn)
         self.assertRaises(NoSuchDistinguishedName, _TestNode.extract_rdn, "foo")
 
-    def test_getattr(self):
+    def test_attributes(self):
         class _TestNode(b.BaseNode):
-            def __init__(self, attr_map):
-                self._attr_map = attr_map
-                self._entity = {"bar": 123}
+            __slots__ = ()
+
+            _rdn_attr = "cn"
+            _base_dn = "ou=foo,dc=example,dc=com"
+
+            foo = a.Attribute("bar", adaptor=lambda *args: args)
+            quux = a.Attribute("quux", adaptor=a.flatten)
 
             def __serialisable__(self):
                 pass
 
-        def _passthrough(*args):
-            return args
+        class _Registry(object):
+            shelf_life = time.delta(hours=1)
+
+        node = _TestNode("test", _Registry())
+        self.assertEqual([attr.name for attr in _TestNode._attributes], ["foo", "quux"])
+        self.assertRaises(PayloadNotFetched, getattr, node, "foo")
 
-        node = _TestNode({"foo": a.Attribute("bar", adaptor=_passthrough)})
+        # Values are decoded once, on ingestion; undecodable values are null
+        node.ingest({"bar": 123, "modifyTimestamp": [b"20180101000000Z"]})
         self.assertEqual(node.foo, (123,))
+        self.assertIsNone(node.quux)
+        self.assertEqual(node.modified, "20180101000000Z")
         self.assertRaises(AttributeError, getattr, node, "bar")
 
+        # Nodes are compact
+        self.assertFalse(hasattr(node, "__dict__"))
+
+
+class _DummyNode(b.BaseNode):
+    _rdn_attr = "cn"
+    _base_dn = "ou=foo,dc=example,dc=com"
+    _object_classes = ["foo"]
+    _base_uri = "/foo"
+    _relation = "foo"
+
+    async def __serialisable__(self):
+        pass
+
+class _DummyRegistry(b.BaseRegistry):
+    _classes = [_DummyNode]
+
+    async def __updator__(self):
+        pass
+
+    async def __serialisable__(self):
+        pass
+
+class _DummyServer(object):
+    """ LDAP server stand-in with a mutable directory """
+    def __init__(self):
+        self.uri = "ldap://example.com"
+        self.directory = {}
+        self.searches = []
+
+    async def search(self, base, scope, search, *, attrs=None):
+        self.searches.append(search)
+        for cn, modified in self.directory.items():
+            if "modifyTimestamp>=" in search and modified < search.split(">=")[1][:-2]:
+                continue
+
+            if "(cn=" in search and f"(cn={cn})" not in search:
+                continue
+
+            yield _DummyNode.build_dn(cn), {"cn": [cn.encode()], "modifyTimestamp": [modified.encode()]}
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        self.server = _DummyServer()
+        self.registry = _DummyRegistry(self.server, time.delta(hours=1))
+
+    @async_test
+    async def test_seed(self):
+        self.server.directory = {"foo": "20180101000000Z", "bar": "20180102000000Z"}
+        await self.registry.seed(_DummyNode)
+
+        self.assertEqual(sorted(self.registry.keys(_DummyNode)), ["bar", "foo"])
+        self.assertEqual(self.registry._high_water[_DummyNode], "20180102000000Z")
+
+        # Reseeding updates nodes in place
+        foo = await self.registry.get(_DummyNode, "foo")
+        self.server.directory["foo"] = "20180103000000Z"
+        await self.registry.seed(_DummyNode)
+
+        self.assertIs(await self.registry.get(_DummyNode, "foo"), foo)
+        self.assertEqual(foo.modified, "20180103000000Z")
+        self.assertIn(foo, self.registry)
+
+        # Nodes are indexed by class
+        class _OtherNode(_DummyNode):
+            pass
+
+        self.assertNotIn(_OtherNode("foo", self.registry), self.registry)
+        self.assertEqual(list(self.registry.keys(_OtherNode)), [])
+
+        self.server.directory = {}
+        with self.assertRaises(b.NoMatches):
+            await self.registry.seed(_DummyNode)
+
+    @async_test
+    async def test_sync(self):
+        self.server.directory = {"foo": "20180101000000Z", "bar": "20180102000000Z"}
+
+        # Full seed without a high-water mark
+        await self.registry.sync(_DummyNode)
+        self.assertEqual(self.server.searches[-1], "(&(objectClass=foo))")
+        self.assertEqual(len(list(self.registry.keys(_DummyNode))), 2)
+
+        # Only modifications thereafter
+        self.server.directory["quux"] = "20180103000000Z"
+        await self.registry.sync(_DummyNode)
+        self.assertEqual(self.server.searches[-1], "(&(objectClass=foo)(modifyTimestamp>=20180102000000Z))")
+        self.assertEqual(self.registry._high_water[_DummyNode], "20180103000000Z")
+        self.assertEqual(len(list(self.registry.keys(_DummyNode))), 3)
+
+        # Unmodified nodes are as fresh as the last synchronisation
+        nodes = self.registry._registry[_DummyNode]
+        for node in nodes.values():
+            node._last_updated = time.now() - time.delta(hours=2)
+
+        await self.registry.sync(_DummyNode)
+        self.assertFalse(any(node.has_expired for node in nodes.values()))
+
+        # Deleted entries are pruned by full seeds
+        del self.server.directory["bar"]
+        await self.registry.seed(_DummyNode)
+        self.assertEqual(list(self.registry.keys(_DummyNode)), ["foo", "quux"])
+
+        # No modifications is not an error
+        self.server.directory = {}
+        await self.registry.sync(_DummyNode)
+
+    @async_test
+    async def test_keys(self):
+        self.server.directory = {cn: "20180101000000Z" for cn in ["foo", "bar", "quux"]}
+        await self.registry.seed(_DummyNode)
+
+        # Keys are in a stable order, which can be paged through
+        self.assertEqual(list(self.registry.keys(_DummyNode)), ["bar", "foo", "quux"])
+        self.assertEqual(list(self.registry.keys(_DummyNode, limit=2)), ["bar", "foo"])
+        self.assertEqual(list(self.registry.keys(_DummyNode, after="foo", limit=2)), ["quux"])
+        self.assertEqual(list(self.registry.keys(_DummyNode, after="baz")), ["foo", "quux"])
+
+        # New nodes are included
+        self.server.directory["baz"] = "20180102000000Z"
+        await self.registry.seed(_DummyNode)
+        self.assertEqual(list(self.registry.keys(_DummyNode, after="bar", limit=1)), ["baz"])
+
+    @async_test
+    async def test_negative_cache(self):
+        self.server.directory = {"foo": "20180101000000Z"}
+
+        for _ in range(3):
+            with self.assertRaises(b.NoMatches):
+                await self.registry.get(_DummyNode, "bar")
+
+        self.assertEqual(len(self.server.searches), 1)
+
+        # Misses expire
+        self.registry._misses.put(_DummyNode.build_dn("bar"), time.now())
+        with self.assertRaises(b.NoMatches):
+            await self.registry.get(_DummyNode, "bar")
+
+        self.assertEqual(len(self.server.searches), 2)
+
+        # Reseeding invalidates misses
+        self.server.directory["bar"] = "20180102000000Z"
+        await self.registry.seed(_DummyNode)
+        bar = await self.registry.get(_DummyNode, "bar")
+        self.assertEqual(bar.identity, "bar")
+
+    @async_test
+    async def test_single_flight(self):
+        self.server.directory = {"foo": "20180101000000Z"}
+
+        foos = await asyncio.gather(*(self.registry.get(_DummyNode, "foo") for _ in range(5)))
+        self.assertEqual(len(self.server.searches), 1)
+        self.assertTrue(all(foo is foos[0] for foo in foos))
+
+        misses = await asyncio.gather(*(self.registry.get(_DummyNode, "bar") for _ in range(5)), return_exceptions=True)
+        self.assertEqual(len(self.server.searches), 2)
+        self.assertTrue(all(isinstance(miss, b.NoMatches) for miss in misses))
+
+    @async_test
+    async def test_get_many(self):
+        self.server.directory = {"foo": "20180101000000Z", "bar": "20180102000000Z", "quux": "20180103000000Z"}
+        await self.registry.seed(_DummyNode, "(cn=foo)")
+        searches = len(self.server.searches)
+
+        # Registered nodes are used as they are; the rest are fetched in
+        # one search, with those that are missing remembered as misses
+        nodes = await self.registry.get_many(_DummyNode, ["quux", "foo", "bar", "xyzzy", "foo"])
+        self.assertEqual(list(nodes), ["quux", "foo", "bar"])
+        self.assertEqual(self.server.searches[searches:], ["(&(objectClass=foo)(|(cn=quux)(cn=bar)(cn=xyzzy)))"])
+
+        with self.assertRaises(b.NoMatches):
+            await self.registry.get(_DummyNode, "xyzzy")
+
+        self.assertEqual(len(self.server.searches), searches + 1)
+
+        # Expired nodes are updated in the same way, in batches
+        for node in nodes.values():
+            node._last_updated = None
+
+        _batch_size, b._BATCH_SIZE = b._BATCH_SIZE, 2
+        try:
+            self.server.directory["foo"] = "20180104000000Z"
+            nodes = await self.registry.get_many(_DummyNode, ["foo", "bar", "quux"])
+
+        finally:
+            b._BATCH_SIZE = _batch_size
+
+        self.assertEqual(len(self.server.searches), searches + 3)
+        self.assertEqual(nodes["foo"].modified, "20180104000000Z")
+        self.assertFalse(any(node.has_expired for node in nodes.values()))
+
+        # Concurrent callers await the same batch for expired nodes
+        for node in nodes.values():
+            node._last_updated = None
+
+        await asyncio.gather(
+            self.registry.get_many(_DummyNode, ["foo", "bar"]),
+            self.registry.get_many(_DummyNode, ["bar", "foo"]),
+            self.registry.get(_DummyNode, "foo"),
+            nodes["bar"].update())
+
+        self.assertEqual(len(self.server.searches), searches + 4)
+        self.assertFalse(any(node._updating for node in nodes.values()))
+
+        # Expired nodes that no longer exist are removed and remembered
+        # as misses, rather than sought again
+        for node in nodes.values():
+            node._last_updated = None
+
+        del self.server.directory["bar"]
+        nodes = await self.registry.get_many(_DummyNode, ["foo", "bar"])
+        self.assertEqual(list(nodes), ["foo"])
+        self.assertEqual(list(self.registry.keys(_DummyNode)), ["foo", "quux"])
+
+        for _ in range(2):
+            self.assertEqual(list(await self.registry.get_many(_DummyNode, ["foo", "bar"])), ["foo"])
+            with self.assertRaises(b.NoMatches):
+                await self.registry.get(_DummyNode, "bar")
+
+        self.assertEqual(len(self.server.searches), searches + 5)
+
+    @async_test
+    async def test_snapshot(self):
+        self.server.directory = {"foo": "20180101000000Z", "bar": "20180102000000Z"}
+        await self.registry.seed(_DummyNode)
+        self.registry._last_updated = time.now()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "snapshot")
+            s.write(self.registry.dump(), path)
+
+            restored = _DummyRegistry(self.server, time.delta(hours=1))
+            restored.restore(s.read(path))
+
+            # Garbage is rejected
+            with open(path, "wb") as f:
+                f.write(b"garbage")
+
+            self.assertRaises(s.InvalidSnapshot, s.read, path)
+
+            open(path, "wb").close()
+            self.assertRaises(s.InvalidSnapshot, s.read, path)
+
+        self.assertEqual(sorted(restored.keys(_DummyNode)), ["bar", "foo"])
+        self.assertEqual(restored._high_water[_DummyNode], "20180102000000Z")
+        self.assertEqual(restored.last_updated, self.registry.last_updated)
+
+        # Restored nodes are served without searching, even if they're
+        # older than their shelf life, until the registry is updated
+        searches = len(self.server.searches)
+        foo = await restored.get(_DummyNode, "foo")
+        foo._last_updated = time.now() - time.delta(hours=2)
+        self.assertIs(await restored.get(_DummyNode, "foo"), foo)
+        self.assertEqual(foo.modified, "20180101000000Z")
+        self.assertEqual(len(self.server.searches), searches)
+
+        await restored.update()
+        self.assertFalse(restored.restored)
+        self.assertTrue(foo.has_expired)
+
 
 if __name__ == "__main__":
     unittest.main()
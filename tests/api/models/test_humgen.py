@@ -18,8 +18,12 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
 import unittest
+from unittest.mock import MagicMock
 
+from tests import async_test
+from api import ldap
 from api.models import _humgen as h
+from common import time
 
 
 class TestPerson(unittest.TestCase):
@@ -45,5 +49,156 @@ class TestPerson(unittest.TestCase):
         self.assertTrue(h.Person.is_active([b"YES"], [b"TRUE"]))
 
 
+class _PhotoServer(object):
+    """ LDAP server stand-in with people, some with photos """
+    def __init__(self, photos):
+        self.photos = photos
+        self.searches = []
+
+    async def search(self, base, scope, search="(objectClass=*)", *, attrs=None):
+        self.searches.append((base, search, attrs))
+
+        if scope == ldap.Scope.Base:
+            uid = h.Person.extract_rdn(base)
+            yield base, {"jpegPhoto": [self.photos[uid]]}
+            return
+
+        for uid, photo in self.photos.items():
+            if "jpegPhoto=*" in search and photo is None:
+                continue
+
+            yield h.Person.build_dn(uid), {"uid": [uid.encode()], "cn": [uid.encode()]}
+
+class TestPhoto(unittest.TestCase):
+    @async_test
+    async def test_lazy_photo(self):
+        server = _PhotoServer({"alice": b"abc123", "bob": None})
+        registry = h.Registry(server, time.delta(hours=1))
+        await registry.seed(h.Person)
+
+        # Photos aren't fetched by seeding
+        self.assertTrue(all(attrs is not None and "jpegPhoto" not in attrs for _, _, attrs in server.searches))
+
+        alice = await registry.get(h.Person, "alice")
+        bob = await registry.get(h.Person, "bob")
+        self.assertTrue(alice.has_photo)
+        self.assertFalse(bob.has_photo)
+
+        searches = len(server.searches)
+        self.assertEqual(await alice.get_photo(), b"abc123")
+        self.assertEqual(await alice.get_photo(), b"abc123")
+        self.assertEqual(len(server.searches), searches + 1)
+        self.assertEqual(registry.photos.size, 6)
+
+        self.assertIsNone(await bob.get_photo())
+        self.assertEqual(len(server.searches), searches + 1)
+
+
+def _group(registry, cn, pi=None, owners=(), members=()):
+    """ Group with the given people involved, by their UIDs """
+    to_dns = lambda uids: [h.Person.build_dn(uid).encode() for uid in uids]
+
+    group = h.Group(cn, registry)
+    group.ingest({
+        "cn":              [cn.encode()],
+        "sangerProjectPI": to_dns([pi] if pi else []),
+        "owner":           to_dns(owners),
+        "member":          to_dns(members) + [b"not a DN"]
+    })
+
+    return group
+
+class TestInvolvement(unittest.TestCase):
+    def setUp(self):
+        self.registry = h.Registry(MagicMock(), time.delta(hours=1))
+        self.alice = h.Person("alice", self.registry)
+        self.bob = h.Person("bob", self.registry)
+
+    def test_roster(self):
+        group = _group(self.registry, "foo", pi="alice", members=["alice", "bob"])
+        self.assertEqual(group.roster, {
+            "pi":     {"alice"},
+            "owner":  set(),
+            "member": {"alice", "bob"}
+        })
+
+    @async_test
+    async def test_index(self):
+        foo = _group(self.registry, "foo", pi="alice", owners=["alice"], members=["alice", "bob"])
+        bar = _group(self.registry, "bar", members=["bob"])
+        self.registry.index(foo)
+        self.registry.index(bar)
+
+        self.assertEqual(self.registry.involvement(self.alice), {"foo": {"pi", "owner", "member"}})
+        self.assertEqual(self.registry.involvement(self.bob), {"foo": {"member"}, "bar": {"member"}})
+
+        self.assertTrue(await foo.is_pi(self.alice))
+        self.assertTrue(await foo.is_owner(self.alice))
+        self.assertFalse(await foo.is_owner(self.bob))
+        self.assertTrue(await bar.is_member(self.bob))
+        self.assertFalse(await bar.is_member(self.alice))
+
+        # Reindexing replaces the group's previous roster
+        foo = _group(self.registry, "foo", members=["bob"])
+        self.registry.index(foo)
+
+        self.assertEqual(self.registry.involvement(self.alice), {})
+        self.assertEqual(self.registry.involvement(self.bob), {"foo": {"member"}, "bar": {"member"}})
+
+        # People aren't indexed
+        self.registry.index(self.alice)
+        self.assertEqual(self.registry.involvement(self.alice), {})
+
+    def test_versions(self):
+        people = self.registry._registry[h.Person]
+        people["alice"], people["bob"] = self.alice, self.bob
+
+        foo = _group(self.registry, "foo", pi="alice")
+        self.registry._registry[h.Group]["foo"] = foo
+        self.registry.index(foo)
+
+        alice, bob = self.alice.version, self.bob.version
+        self.assertGreater(alice, 0)
+        self.assertEqual(bob, 0)
+
+        # Changing a group changes the people involved, before and after
+        self.registry.index(_group(self.registry, "foo", members=["bob"]))
+        self.assertGreater(self.alice.version, alice)
+        self.assertGreater(self.bob.version, bob)
+
+        # Changing a person changes the groups they're involved in, but
+        # not the listing of groups
+        version, groups, people = foo.version, self.registry.version(h.Group), self.registry.version(h.Person)
+        self.registry.index(self.bob)
+        self.assertGreater(foo.version, version)
+        self.assertGreater(self.registry.version(h.Person), people)
+        self.assertEqual(self.registry.version(h.Group), groups)
+
+
+class TestSparseFields(unittest.TestCase):
+    def setUp(self):
+        # People can't be resolved from the stand-in server
+        self.registry = h.Registry(MagicMock(), time.delta(hours=1))
+
+    @async_test
+    async def test_group(self):
+        group = _group(self.registry, "foo", pi="alice", members=["alice", "bob"])
+        output = await group.__serialisable__(frozenset({"description"}))
+        self.assertEqual(set(output), {"id", "description"})
+
+    @async_test
+    async def test_person(self):
+        alice = h.Person("alice", self.registry)
+        alice.ingest({"uid": [b"alice"], "cn": [b"Alice"], "mail": [b"alice@example.com"]})
+        self.registry.index(_group(self.registry, "foo", pi="alice"))
+
+        output = await alice.__serialisable__(frozenset({"name", "mail"}))
+        self.assertEqual(output, {
+            "name": "Alice",
+            "mail": "alice@example.com",
+            "id":   {"href": "/people/alice", "rel": "self", "value": "alice"}
+        })
+
+
 if __name__ == "__main__":
     unittest.main()
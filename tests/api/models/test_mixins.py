@@ -17,6 +17,7 @@ You should have received a copy of the GNU Affero General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
+import asyncio
 import unittest
 from unittest.mock import patch
 
@@ -32,6 +33,7 @@ class DummyExpirable(m.Expirable):
         if not hasattr(self, "update_count"):
             self.update_count = 0
 
+        await asyncio.sleep(0)
         self.update_count += 1
 
 class TestExpirable(unittest.TestCase):
@@ -50,6 +52,16 @@ class TestExpirable(unittest.TestCase):
         await expirable.update()
         self.assertEqual(expirable.update_count, 2)
 
+    @async_test
+    async def test_single_flight(self):
+        expirable = DummyExpirable(time.delta(1))
+
+        await asyncio.gather(*(expirable.update() for _ in range(5)))
+        self.assertEqual(expirable.update_count, 1)
+
+        await asyncio.gather(*(expirable.update() for _ in range(5)))
+        self.assertEqual(expirable.update_count, 2)
+
     def test_expiry(self):
         expirable = DummyExpirable(123)
         self.assertTrue(expirable.has_expired)
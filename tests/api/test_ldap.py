@@ -17,11 +17,21 @@ You should have received a copy of the GNU Affero General Public License
 along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
+import asyncio
+import os
+import tempfile
+import threading
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
+
+import ldap
 
 from tests import async_test
 import api.ldap._entity as e
+import api.ldap._filter as f
+import api.ldap._instrumentation as i
+import api.ldap._ldif as l
+import api.ldap._pool as p
 import api.ldap._server as s
 import api.ldap._exceptions as x
 
@@ -41,13 +51,327 @@ class TestResultGenerator(unittest.TestCase):
     @async_test
     async def test_generator(self):
         results = 0
-        async for dn, entry in s._SearchResults(_mock_results(10)):
+        async for dn, entry in s._SearchResults(_mock_results(10), s.SearchRecord("dn", s.Scope.Base, "(objectClass=*)")):
             self.assertEqual(dn, "dn")
             self.assertEqual(entry, {"attribute": "value"})
             results += 1
 
         self.assertEqual(results, 10)
 
+    @async_test
+    async def test_pending(self):
+        def _pending_results(x):
+            # Interleave results with messages that aren't ready yet
+            for result in _mock_results(x):
+                yield None
+                yield None
+                yield result
+
+        results = 0
+        async for dn, entry in s._SearchResults(_pending_results(3), s.SearchRecord("dn", s.Scope.Base, "(objectClass=*)")):
+            self.assertEqual(dn, "dn")
+            results += 1
+
+        self.assertEqual(results, 3)
+
+    def test_poll(self):
+        entry = (ldap.RES_SEARCH_ENTRY, [("dn", {})], 1, [])
+        server = MagicMock()
+        server.result3.side_effect = [
+            (None, None, None, None),
+            entry,
+            (ldap.RES_SEARCH_REFERENCE, [], 1, []),
+            (None, None, None, None),
+            entry,
+            (ldap.RES_SEARCH_RESULT, [], 1, [])
+        ]
+
+        messages = list(p._Connection.poll(server, 1))
+        self.assertEqual(messages, [None, entry, None, entry])
+        server.result3.assert_called_with(1, all=0, timeout=0)
+
+
+class _DummyConnection(object):
+    def __init__(self, uri, generation):
+        self.generation = generation
+        self.last_used = 0
+        self.closed = False
+        self.threads = []
+
+    def whoami_s(self):
+        self.threads.append(threading.get_ident())
+        return ""
+
+    def close(self):
+        self.threads.append(threading.get_ident())
+        self.closed = True
+
+@patch("api.ldap._pool._Connection", _DummyConnection)
+class TestConnectionPool(unittest.TestCase):
+    @async_test
+    async def test_lazy(self):
+        pool = p.ConnectionPool("ldap://foo", 2)
+        self.assertEqual(pool.statistics.connections, 0)
+
+        async with pool.connection() as first:
+            self.assertEqual(pool.statistics.in_use, 1)
+
+            async with pool.connection() as second:
+                self.assertIsNot(first, second)
+                self.assertEqual(pool.statistics.in_use, 2)
+
+        stats = pool.statistics
+        self.assertEqual(stats.size, 2)
+        self.assertEqual(stats.connections, 2)
+        self.assertEqual(stats.in_use, 0)
+        self.assertEqual(stats.waits, 2)
+
+        # Idle connections are reused
+        async with pool.connection() as third:
+            self.assertIn(third, (first, second))
+
+        self.assertEqual(pool.statistics.connections, 2)
+
+    @async_test
+    async def test_bounded(self):
+        pool = p.ConnectionPool("ldap://foo", 1)
+
+        async with pool.connection():
+            waiter = asyncio.ensure_future(pool.connection().__aenter__())
+            await asyncio.sleep(0)
+            self.assertEqual(pool.statistics.waiting, 1)
+            self.assertFalse(waiter.done())
+
+        await waiter
+        self.assertEqual(pool.statistics.waiting, 0)
+        self.assertEqual(pool.statistics.in_use, 1)
+
+    @async_test
+    async def test_blocking(self):
+        pool = p.ConnectionPool("ldap://foo", 1)
+
+        # Connections are made and closed off the event loop
+        with self.assertRaises(ldap.SERVER_DOWN):
+            async with pool.connection() as connection:
+                self.assertEqual(len(connection.threads), 1)
+                raise ldap.SERVER_DOWN()
+
+        self.assertEqual(len(connection.threads), 2)
+        self.assertNotIn(threading.get_ident(), connection.threads)
+
+        # Failing to connect doesn't use up the pool
+        with patch.object(_DummyConnection, "whoami_s", side_effect=ldap.SERVER_DOWN()):
+            with self.assertRaises(ldap.SERVER_DOWN):
+                async with pool.connection():
+                    pass
+
+        self.assertEqual(pool.statistics.in_use, 0)
+        async with pool.connection():
+            pass
+
+    @async_test
+    async def test_invalidation(self):
+        pool = p.ConnectionPool("ldap://foo", 2)
+
+        async with pool.connection() as idle:
+            pass
+
+        with self.assertRaises(ldap.SERVER_DOWN):
+            async with pool.connection() as dead:
+                raise ldap.SERVER_DOWN()
+
+        self.assertTrue(idle.closed)
+        self.assertTrue(dead.closed)
+        self.assertEqual(pool.statistics.connections, 0)
+
+        async with pool.connection() as fresh:
+            self.assertFalse(fresh.closed)
+
+
+class _SearchingConnection(_DummyConnection):
+    def search(self, base, scope, search, attrs):
+        return 1
+
+    def poll(self, msgid):
+        yield None
+        for n in range(3):
+            yield "foo", [(f"uid={n},ou=bar", {"attribute": [b"value"]})], "bar", "quux"
+
+    def abandon(self, msgid):
+        pass
+
+@patch("api.ldap._pool._Connection", _SearchingConnection)
+class TestInstrumentation(unittest.TestCase):
+    def test_labels(self):
+        self.assertEqual(i._base_label("uid=foo\\,bar,ou=people", s.Scope.Base), "ou=people")
+        self.assertEqual(i._base_label("ou=people", s.Scope.OneLevel), "ou=people")
+
+        self.assertEqual(i._shape("(&(objectClass=foo)(uid=bar))"), "(&(objectClass=?)(uid=?))")
+        self.assertEqual(i._shape("(|(uid=foo)(uid=bar\\29)(uid=quux))"), "(|(uid=?)...)")
+        self.assertEqual(i._shape("(&(photo=*)(modified>=123))"), "(&(photo=*)(modified>=?))")
+
+    @async_test
+    async def test_search(self):
+        server = s.Server("ldap://foo", 1)
+        instrumentation = server.instrumentation
+        labels = ("ou=bar", "OneLevel")
+
+        results = [dn async for dn, _ in server.search("ou=bar", s.Scope.OneLevel, "(uid=*)")]
+        self.assertEqual(len(results), 3)
+        self.assertEqual(instrumentation.durations.count(*labels), 1)
+        self.assertEqual(instrumentation.first_results.count(*labels), 1)
+        self.assertEqual(instrumentation.entries._values[labels], 3)
+        self.assertEqual(instrumentation.received._values[labels], 3 * (len("uid=0,ou=bar") + len(b"value")))
+        self.assertEqual(instrumentation.searches._values[(*labels, "(uid=*)")], 1)
+
+        # Searches stopped early are recorded, too, once they're closed
+        search = server.search("uid=1,ou=bar", s.Scope.Base)
+        await search.__anext__()
+        await search.aclose()
+
+        self.assertEqual(instrumentation.entries._values[("ou=bar", "Base")], 1)
+        self.assertNotIn(labels, instrumentation.slow._values)
+
+    @async_test
+    async def test_slow(self):
+        server = s.Server("ldap://foo", 1, slow_threshold=0)
+
+        with patch("api.ldap._instrumentation.log") as mock_log:
+            async for _ in server.search("ou=bar", s.Scope.OneLevel):
+                pass
+
+        self.assertEqual(server.instrumentation.slow._values[("ou=bar", "OneLevel")], 1)
+        message, level = mock_log.call_args[0]
+        self.assertIn("OneLevel search of ou=bar for (objectClass=*): 3 entries", message)
+
+        # The time spent between results isn't the LDAP server's
+        server = s.Server("ldap://foo", 1, slow_threshold=0.05)
+        record = None
+        with patch.object(server.instrumentation, "record") as mock_record:
+            async for _ in server.search("ou=bar", s.Scope.OneLevel):
+                await asyncio.sleep(0.02)
+
+            record, = mock_record.call_args[0]
+
+        server.instrumentation.record(record)
+        self.assertLess(record.duration, 0.05)
+        self.assertGreater(record.elapsed, 0.05)
+        self.assertNotIn(("ou=bar", "OneLevel"), server.instrumentation.slow._values)
+
+
+class TestFilter(unittest.TestCase):
+    def test_parse(self):
+        search = f.parse("(&(objectClass=person)(|(uid=foo)(uid=b\\29r))(photo=*)(!(cn=x*y))(modified>=2018))")
+        entry = {
+            "objectclass": [b"top", b"Person"],
+            "uid":         [b"b)r"],
+            "photo":       [b"..."],
+            "cn":          [b"xyzzq"],
+            "modified":    [b"2019"]
+        }
+        self.assertTrue(search.match(entry))
+
+        entry["cn"] = [b"XaY"]
+        self.assertFalse(search.match(entry))
+
+        entry["cn"] = [b"xyzzq"]
+        entry["modified"] = [b"2017"]
+        self.assertFalse(search.match(entry))
+
+    def test_invalid(self):
+        for search in ("uid=foo", "(uid=foo", "(&)", "(uid=foo))", "(!(a=b)(c=d))", "(=foo)"):
+            self.assertRaises(x.InvalidFilter, f.parse, search)
+
+
+_LDIF = b"""version: 1
+dn: ou=people,dc=example
+
+# A comment, that's
+  folded
+dn: uid=foo,ou=people,dc=example
+objectClass: posixAccount
+uid: foo
+cn: Foo
+description: Spans
+  lines
+jpegPhoto:: AAEC
+
+dn: UID=Bar , ou=people,dc=example
+objectClass: posixAccount
+uid: bar
+cn: Bar
+
+dn: cn=quux,uid=bar,ou=people,dc=example
+objectClass: device
+cn: quux
+"""
+
+class TestLDIFDirectory(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".ldif")
+        with os.fdopen(fd, "wb") as ldif:
+            ldif.write(_LDIF)
+
+        self.directory = l.LDIFDirectory(self.path)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    async def _search(self, *args, **kwargs):
+        return [result async for result in self.directory.search(*args, **kwargs)]
+
+    @async_test
+    async def test_load(self):
+        self.assertEqual(len(self.directory), 4)
+
+        (dn, payload), = await self._search("uid=foo,ou=people,dc=example", s.Scope.Base)
+        self.assertEqual(dn, "uid=foo,ou=people,dc=example")
+        self.assertEqual(payload["description"], [b"Spans lines"])
+        self.assertEqual(payload["jpegPhoto"], [b"\x00\x01\x02"])
+
+    @async_test
+    async def test_search(self):
+        dns = lambda results: [dn for dn, _ in results]
+
+        people = await self._search("ou=people,dc=example", s.Scope.OneLevel, "(objectClass=posixAccount)")
+        self.assertEqual(dns(people), ["uid=foo,ou=people,dc=example", "UID=Bar , ou=people,dc=example"])
+
+        # Indexed and unindexed filters, in different scopes
+        bar = await self._search("ou=people,dc=example", s.Scope.OneLevel, "(|(uid=BAR)(uid=nobody))")
+        self.assertEqual(dns(bar), ["UID=Bar , ou=people,dc=example"])
+        photos = await self._search("ou=people,dc=example", s.Scope.OneLevel, "(jpegPhoto=*)")
+        self.assertEqual(dns(photos), ["uid=foo,ou=people,dc=example"])
+        subtree = await self._search("ou=people,dc=example", s.Scope.Subtree, "(cn=*u*)")
+        self.assertEqual(dns(subtree), ["cn=quux,uid=bar,ou=people,dc=example"])
+        children = await self._search("uid=bar,ou=people,dc=example", s.Scope.Children)
+        self.assertEqual(dns(children), ["cn=quux,uid=bar,ou=people,dc=example"])
+
+        # Attribute selection
+        (_, payload), = await self._search("uid=foo,ou=people,dc=example", s.Scope.Base, attrs=["UID", "cn"])
+        self.assertEqual(payload, {"UID": [b"foo"], "cn": [b"Foo"]})
+        (_, payload), = await self._search("uid=foo,ou=people,dc=example", s.Scope.Base, attrs=["1.1"])
+        self.assertEqual(payload, {})
+
+        with self.assertRaises(x.NoSuchDistinguishedName):
+            await self._search("ou=nowhere,dc=example", s.Scope.OneLevel)
+
+    @async_test
+    async def test_options(self):
+        with open(self.path, "wb") as f:
+            f.write(b"dn: uid=foo,dc=example\nuid: foo\njpegphoto;binary:: AAEC\n")
+
+        self.directory = l.LDIFDirectory(self.path)
+
+        (_, payload), = await self._search("dc=example", s.Scope.OneLevel, "(jpegPhoto=*)", attrs=["jpegPhoto"])
+        self.assertEqual(payload, {"jpegPhoto": [b"\x00\x01\x02"]})
+
+    def test_invalid(self):
+        for ldif in (b" folded", b"dn: foo\nchangetype: add\n", b"uid: foo\n", b"dn: foo\nfoo\n", b"dn:: !!!\n"):
+            with open(self.path, "wb") as f:
+                f.write(ldif)
+
+            self.assertRaises(x.InvalidLDIF, l.LDIFDirectory, self.path)
+
 
 class TestEntity(unittest.TestCase):
     def test_mapping(self):
@@ -72,10 +396,10 @@ class TestEntity(unittest.TestCase):
         entity = e.Entity("foo")
         entity.server = mock_server
 
-        mock_server.search.return_value = s._SearchResults(_mock_results(1))
+        mock_server.search.return_value = s._SearchResults(_mock_results(1), s.SearchRecord("dn", s.Scope.Base, "(objectClass=*)"))
         await entity.fetch()
         self.assertEqual(entity["attribute"], "value")
 
-        mock_server.search.return_value = s._SearchResults(_mock_results(0))
+        mock_server.search.return_value = s._SearchResults(_mock_results(0), s.SearchRecord("dn", s.Scope.Base, "(objectClass=*)"))
         with self.assertRaises(x.NoSuchDistinguishedName):
             await entity.fetch()
@@ -0,0 +1,81 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+
+from common.cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_budget(self):
+        self.assertRaises(AssertionError, LRUCache, 0)
+
+        cache = LRUCache(10)
+        cache.put("foo", b"12345")
+        cache.put("bar", b"1234")
+        self.assertEqual(cache.size, 9)
+        self.assertEqual(len(cache), 2)
+
+        # Least recently used is evicted
+        cache.get("foo")
+        cache.put("quux", b"123")
+        self.assertIn("foo", cache)
+        self.assertNotIn("bar", cache)
+        self.assertEqual(cache.size, 8)
+
+        # Replacing a value accounts for its previous size
+        cache.put("foo", b"1")
+        self.assertEqual(cache.size, 4)
+
+        # Values larger than the budget aren't cached
+        cache.put("xyzzy", b"x" * 11)
+        self.assertNotIn("xyzzy", cache)
+        self.assertEqual(cache.size, 4)
+
+        cache.remove("foo")
+        cache.remove("foo")
+        self.assertEqual(cache.size, 3)
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.size, 0)
+
+    def test_sizeof(self):
+        cache = LRUCache(10, sizeof=lambda x: x[1])
+        cache.put("foo", ("abc", 6))
+        cache.put("bar", ("def", 6))
+        self.assertNotIn("foo", cache)
+        self.assertEqual(cache.size, 6)
+
+    def test_hit_rate(self):
+        cache = LRUCache(10)
+        self.assertIsNone(cache.hit_rate)
+
+        cache.put("foo", b"bar")
+        self.assertEqual(cache.get("foo"), b"bar")
+        self.assertIsNone(cache.get("bar"))
+        self.assertEqual(cache.get("bar", b"quux"), b"quux")
+
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 2)
+        self.assertAlmostEqual(cache.hit_rate, 1 / 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+from datetime import datetime, timezone
+
+from common import json
+
+
+class TestJSON(unittest.TestCase):
+    def test_backends(self):
+        data = {
+            "last_updated": datetime(2018, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+            "name":         "Zoë Bloggs",
+            "title":        None,
+            "active":       True,
+            "prelims":      ["foo", "bar"],
+            "id":           {"href": "/people/zb1", "rel": "self", "value": "zb1"}
+        }
+
+        expected = '{"last_updated":"2018-01-02T03:04:05Z+0000","name":"Zoë Bloggs","title":null,' \
+                   '"active":true,"prelims":["foo","bar"],"id":{"href":"/people/zb1","rel":"self","value":"zb1"}}'
+
+        # Every backend produces the same output
+        self.assertIn("stdlib", json.BACKENDS)
+        for backend in json.BACKENDS:
+            encode = json.encoder(backend)
+            self.assertEqual(encode(data), expected.encode())
+            self.assertRaises(TypeError, encode, object())
+
+        self.assertIs(json.encode, json.encoder(json.BACKEND))
+
+
+if __name__ == "__main__":
+    unittest.main()
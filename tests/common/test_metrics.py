@@ -0,0 +1,89 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+
+from common.metrics import Counter, Gauge, Histogram, MetricSet
+
+
+class TestMetrics(unittest.TestCase):
+    def test_counter(self):
+        counter = Counter("foo_total", "Foo", ("bar",))
+        counter.inc("x")
+        counter.inc("x", amount=2)
+        counter.inc("y\"z")
+        self.assertEqual(counter.render(), "\n".join([
+            "# HELP foo_total Foo",
+            "# TYPE foo_total counter",
+            "foo_total{bar=\"x\"} 3",
+            "foo_total{bar=\"y\\\"z\"} 1"]))
+
+        # Unlabelled counters start from zero
+        self.assertIn("foo_total 0", Counter("foo_total", "Foo").render())
+
+    def test_gauge(self):
+        state = {"x": 1}
+        gauge = Gauge("foo", "Foo", ("bar",), collect=lambda: {(k,): v for k, v in state.items()})
+        self.assertIn("foo{bar=\"x\"} 1", gauge.render())
+
+        # Collected when rendered
+        state["x"] = 2.5
+        self.assertIn("foo{bar=\"x\"} 2.5", gauge.render())
+
+        gauge = Gauge("foo", "Foo")
+        gauge.set(123)
+        self.assertIn("foo 123", gauge.render())
+
+    def test_histogram(self):
+        histogram = Histogram("foo_seconds", "Foo", ("bar",), buckets=(1, 0.1))
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value, "x")
+
+        self.assertEqual(histogram.count("x"), 4)
+        self.assertEqual(histogram.count("y"), 0)
+
+        rendered = histogram.render().splitlines()
+        self.assertEqual(rendered[2:], [
+            "foo_seconds_bucket{bar=\"x\",le=\"0.1\"} 2",
+            "foo_seconds_bucket{bar=\"x\",le=\"1\"} 3",
+            "foo_seconds_bucket{bar=\"x\",le=\"+Inf\"} 4",
+            "foo_seconds_sum{bar=\"x\"} 5.65",
+            "foo_seconds_count{bar=\"x\"} 4"])
+
+        with histogram.time("y"):
+            pass
+
+        self.assertEqual(histogram.count("y"), 1)
+
+    def test_metric_set(self):
+        foo = Counter("foo_total", "Foo")
+        bar = Gauge("bar", "Bar")
+        metrics = MetricSet(foo, bar)
+
+        self.assertIn("foo_total", metrics)
+        self.assertIs(metrics["bar"], bar)
+        self.assertRaises(AssertionError, metrics.register, Counter("foo_total", "Foo"))
+
+        rendered = metrics.render()
+        self.assertTrue(rendered.endswith("\n"))
+        self.assertLess(rendered.index("# TYPE foo_total"), rendered.index("# TYPE bar"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+"""
+Copyright (c) 2018 Genome Research Ltd.
+
+Author: Christopher Harrison <ch12@sanger.ac.uk>
+
+This program is free software: you can redistribute it and/or modify it
+under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+from datetime import datetime, timezone
+
+from common import serialisation as s
+from common.constants import MIMEType
+
+
+_DATA = [
+    {"href": "/people/zb1", "rel": "person", "value": "Zoë Bloggs"},
+    {"last_updated": datetime(2018, 1, 2, 3, 4, 5, tzinfo=timezone.utc), "active": True, "title": None}
+]
+
+class TestSerialisation(unittest.TestCase):
+    def test_json(self):
+        self.assertEqual(s.MEDIA_TYPES[0], MIMEType.JSON)
+        self.assertEqual(s.array_framing(MIMEType.JSON, 2), (b"[", b",", b"]"))
+
+        start, separator, end = s.array_framing(MIMEType.JSON, len(_DATA))
+        framed = start + separator.join(s.encode(item, MIMEType.JSON) for item in _DATA) + end
+        self.assertEqual(framed, s.encode(_DATA, MIMEType.JSON))
+
+    @unittest.skipUnless(s.msgpack, "msgpack is not installed")
+    def test_msgpack(self):
+        encoded = s.encode(_DATA, MIMEType.MSGPACK)
+        self.assertEqual(s.msgpack.unpackb(encoded, timestamp=3), _DATA)
+
+        start, separator, end = s.array_framing(MIMEType.MSGPACK, len(_DATA))
+        self.assertEqual(start + separator.join(s.encode(item, MIMEType.MSGPACK) for item in _DATA) + end, encoded)
+
+    @unittest.skipUnless(s.cbor2, "cbor2 is not installed")
+    def test_cbor(self):
+        start, separator, end = s.array_framing(MIMEType.CBOR, len(_DATA))
+        framed = start + separator.join(s.encode(item, MIMEType.CBOR) for item in _DATA) + end
+        self.assertEqual(s.cbor2.loads(framed), _DATA)
+
+
+if __name__ == "__main__":
+    unittest.main()